@@ -0,0 +1,200 @@
+"""
+Vectorized (NumPy) helpers for analyzing the samples of a chatlog (post-processing).
+
+They operate on whole sample columns (see SampleTable.column) and return plain arrays,
+building the actual Highlight/Spike/... objects is left to ChatAnalytics.
+"""
+
+import heapq
+import numpy as np
+
+def find_runs(mask: np.ndarray):
+    """Find the runs (maximal contiguous stretches) of True values in a boolean mask.
+
+    :param mask: one boolean per sample
+    :type mask: np.ndarray
+    :returns: (the index of the first sample of every run, the index after the last sample of every run)
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    # Pad with False on both sides, so that runs touching the first/last sample still have a rising & falling edge
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def _reduce_runs(ufunc, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Apply a ufunc reduction to values[start:end] of every run"""
+    if(len(starts) == 0):
+        return np.zeros(0, dtype=values.dtype)
+    # Interleaving the starts and ends lets reduceat reduce every [start, end) at the even positions.
+    # (values is padded, since an end may be == len(values), which reduceat doesn't accept)
+    indices = np.empty(2*len(starts), dtype=np.intp)
+    indices[0::2] = starts
+    indices[1::2] = ends
+    return ufunc.reduceat(np.append(values, values[:1]), indices)[0::2]
+
+def max_of_runs(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """The maximum of the values in every run (see find_runs)"""
+    return _reduce_runs(np.maximum, values, starts, ends)
+
+def sum_of_runs(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """The sum of the values in every run (see find_runs)"""
+    return _reduce_runs(np.add, values, starts, ends)
+
+def rolling_mean_std(values: np.ndarray, lag: int):
+    """The mean and (population) standard deviation of the 'lag' values preceding every value (the trailing window, excluding the value itself).
+    Computed from cumulative sums, so in O(n) regardless of the lag.
+
+    :param values: one value per sample
+    :type values: np.ndarray
+    :param lag: the number of preceding samples in the window
+    :type lag: int
+    :returns: (the rolling mean, the rolling std), NaN for the first 'lag' samples (whose window is incomplete)
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean = np.full(len(values), np.nan)
+    std = np.full(len(values), np.nan)
+    if(len(values) <= lag):
+        return mean, std
+
+    # Sums of the windows [i-lag, i) for i >= lag
+    cumsum = np.concatenate(([0.0], np.cumsum(values)))
+    cumsum_sq = np.concatenate(([0.0], np.cumsum(values*values)))
+    window_sum = cumsum[lag:-1] - cumsum[:-lag-1]
+    window_sum_sq = cumsum_sq[lag:-1] - cumsum_sq[:-lag-1]
+
+    mean[lag:] = window_sum/lag
+    # (Clamped, the subtraction can go slightly negative due to rounding when the window is constant)
+    std[lag:] = np.sqrt(np.maximum(window_sum_sq/lag - mean[lag:]*mean[lag:], 0.0))
+    return mean, std
+
+def zscore_signals(values: np.ndarray, lag: int, threshold: float, influence: float):
+    """Smoothed z-score peak detection.
+
+    A sample is a signal if it is more than 'threshold' standard deviations away from the mean of the 'lag' samples before it.
+    Signals only have 'influence' (0-1) weight in the mean/std of the following windows, so that a sustained spike
+    does not immediately become the new baseline.
+
+    With influence == 1 the windows are the plain values, so everything is vectorized (see rolling_mean_std).
+    Otherwise the windows depend on the previous signals, so the values are streamed once, updating the
+    window sums in O(1) per sample.
+
+    :param values: one value per sample
+    :type values: np.ndarray
+    :param lag: the number of preceding samples the baseline (mean/std) is computed from
+    :type lag: int
+    :param threshold: the number of standard deviations from the baseline a sample must be to be a signal
+    :type threshold: float
+    :param influence: the weight (0-1) of a signal in the baseline of the following samples
+    :type influence: float
+    :returns: (the signal of every sample: 1 above, -1 below the baseline, 0 otherwise, the baseline (mean) of every sample (NaN for the first 'lag' samples))
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    signals = np.zeros(n, dtype=np.int8)
+    if(n <= lag):
+        return signals, np.full(n, np.nan)
+
+    if(influence >= 1):
+        mean, std = rolling_mean_std(values, lag)
+        deviation = values[lag:] - mean[lag:]
+        is_signal = np.abs(deviation) > threshold*std[lag:]
+        signals[lag:] = np.where(is_signal, np.sign(deviation), 0)
+        return signals, mean
+
+    # Streaming pass, the filtered values (signals dampened by the influence) make up the windows
+    y = values.tolist()
+    filtered = y[:lag] + [0.0]*(n-lag)
+    window_sum = sum(filtered[:lag])
+    window_sum_sq = sum(v*v for v in filtered[:lag])
+    signal_list = [0]*n
+    baselines = [float('nan')]*n
+    for i in range(lag, n):
+        mean = window_sum/lag
+        std = max(window_sum_sq/lag - mean*mean, 0.0)**0.5
+        deviation = y[i] - mean
+        if(abs(deviation) > threshold*std):
+            signal_list[i] = 1 if deviation > 0 else -1
+            filtered[i] = influence*y[i] + (1-influence)*filtered[i-1]
+        else:
+            filtered[i] = y[i]
+        baselines[i] = mean
+
+        # Slide the window: drop the oldest value, add the newest
+        oldest = filtered[i-lag]
+        window_sum += filtered[i] - oldest
+        window_sum_sq += filtered[i]*filtered[i] - oldest*oldest
+
+    signals[:] = signal_list
+    return signals, np.array(baselines)
+
+def local_maxima(values: np.ndarray, lag: int, threshold: float):
+    """Local maxima peak detection.
+
+    A sample is a peak if it is the maximum of the 'lag' samples on either side of it, and it is more than
+    'threshold' standard deviations above the mean of the 'lag' samples before it. (Of a plateau of equal values, only the first sample is a peak)
+
+    :param values: one value per sample
+    :type values: np.ndarray
+    :param lag: the number of samples on either side of a peak that it must be the maximum of (and that the baseline is computed from)
+    :type lag: int
+    :param threshold: the number of standard deviations above the baseline a peak must be
+    :type threshold: float
+    :returns: (a boolean mask of the peaks, the baseline (mean) of every sample (NaN for the first 'lag' samples))
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if(n == 0):
+        return np.zeros(0, dtype=bool), np.zeros(0)
+
+    # The maximum of the centered window [i-lag, i+lag] (padded with -inf at the edges)
+    padded = np.concatenate((np.full(lag, -np.inf), values, np.full(lag, -np.inf)))
+    window_max = np.lib.stride_tricks.sliding_window_view(padded, 2*lag+1).max(axis=1)
+    is_rising = np.concatenate(([True], values[1:] > values[:-1]))
+
+    mean, std = rolling_mean_std(values, lag)
+    # (NaN baselines compare False, so the first 'lag' samples are never peaks)
+    is_peak = (values >= window_max) & is_rising & (values - mean > threshold*std)
+    return is_peak, mean
+
+def prefix_sums(values: np.ndarray) -> np.ndarray:
+    """The cumulative sums of the values, with a leading 0 (prefix[i] = sum(values[:i])), so that the sum of any
+    window values[i:j] is prefix[j] - prefix[i] in O(1)"""
+    return np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+
+def top_windows(prefix: np.ndarray, window: int, count: int) -> np.ndarray:
+    """Find the 'count' best non-overlapping windows of 'window' consecutive samples (the windows with the highest sum).
+
+    The windows are picked greedily: the best window, then the best window that does not overlap it, and so on.
+    All window sums are computed at once from the prefix sums, then popped from a heap (largest sum first, earliest window on ties)
+    until 'count' non-overlapping windows are found, so O(n log n) at worst.
+
+    :param prefix: the prefix sums of the values (see prefix_sums)
+    :type prefix: np.ndarray
+    :param window: the number of samples in a window
+    :type window: int
+    :param count: the (maximum) number of windows to find
+    :type count: int
+    :returns: the index of the first sample of every window, best first
+    :rtype: np.ndarray
+    """
+    num_windows = len(prefix) - window # (prefix has one more element than there are samples)
+    if(num_windows <= 0 or count <= 0):
+        return np.zeros(0, dtype=np.intp)
+
+    window_sums = prefix[window:] - prefix[:-window]
+    heap = list(zip((-window_sums).tolist(), range(num_windows)))
+    heapq.heapify(heap)
+
+    # blocked[i]: a window starting at i would overlap an already picked window
+    blocked = np.zeros(num_windows, dtype=bool)
+    starts = []
+    while(heap and len(starts) < count):
+        _, start = heapq.heappop(heap)
+        if(blocked[start]):
+            continue
+        starts.append(start)
+        blocked[max(start-window+1, 0):start+window] = True
+
+    return np.array(starts, dtype=np.intp)
@@ -3,6 +3,7 @@ import ntpath
 import json
 import logging
 import sys
+import itertools
 
 sys.path.append("..") # chat_downloader in sibling directory, this is so we can find it
 from .chat_downloader.chat_downloader import ChatDownloader
@@ -10,6 +11,10 @@ from .dataformat import * # YoutubeChatAnalytics, TwitchChatAnalytics
 from .util import dprint, remove_non_alpha_numeric
 from urllib.parse import urlparse
 from .chat_downloader.sites.common import Chat
+from .chatfile import iter_chatmsgs_from_chatfile, get_chatfile_duration, ChatColumns, ChatColumnsBuilder, load_chatfile_cache, save_chatfile_cache
+from .pipeline import PrefetchingIterator, DEFAULT_PREFETCH_DEPTH, DEFAULT_BATCH_SIZE
+from .chat_downloader.utils.rate_limiting import get_all_host_stats
+from .store import AnalyticsStore
 
 from .metadata import (
     __version__
@@ -22,11 +27,20 @@ MIN_INTERVAL = 1
 # Can be set via CLI --debug flag
 DEBUG = False
 
+# The only fields of chat messages that are read by the analysis (other fields are not parsed when downloading, unless the chatfile is saved)
+ANALYSIS_FIELDS = ['time_in_seconds', 'message_type', 'author.id']
+
 # Define the arguments for getting the chatlog using chat-downloader
 chat_download_settings =  {
     "url" : None, # Set in get_chatlog_downloader()
     "message_types" : 'all',
     "output" : None, # If save-chatfile, set to that path before get_chatlog_downloader()
+    "download_workers" : 1, # Set in run() (--download-workers)
+    "max_requests_per_second" : None, # Set in run() (--max-requests-per-second)
+    "response_cache" : None, # Set in run() (--response-cache)
+    "resume" : False, # Set in run() (--resume)
+    "max_response_cache_size" : 1024, # Set in run() (--response-cache-size)
+    "fields" : None, # Set in run() (ANALYSIS_FIELDS, unless the chatfile is saved)
 }
 
 def get_chatlog_downloader(url: str):
@@ -49,7 +63,13 @@ def get_chatlog_downloader(url: str):
         chat = ChatDownloader().get_chat(
             chat_download_settings['url'], 
             message_types=[chat_download_settings['message_types']],
-            output=chat_download_settings['output'])       # create a generator
+            output=chat_download_settings['output'],
+            download_workers=chat_download_settings['download_workers'],
+            max_requests_per_second=chat_download_settings['max_requests_per_second'],
+            response_cache=chat_download_settings['response_cache'],
+            max_response_cache_size=chat_download_settings['max_response_cache_size'],
+            resume=chat_download_settings['resume'],
+            fields=chat_download_settings['fields'])       # create a generator
     except Exception as exception:
         logging.critical("ERORR: Could not get chat: "+ str(exception))
         exit(1)
@@ -98,19 +118,18 @@ def check_chatlog_downloader_supported(chatlog: Chat, url: str):
 
 def get_chatmsgs_from_chatfile(filepath: str):
     """Given a path to a chatfile (directly from Xenovas downloader or produced by 
-    --save-chatfile-output) flag, extract the chat messages from the file into an array
-    of chat messages.
+    --save-chatfile-output) flag, lazily extract the chat messages from the file.
 
+    The chatfile is read incrementally (one message at a time), so the whole chatfile never has to fit in memory.
+    Both JSON (array) and JSON lines chatfiles are supported.
 
     :param filepath: a path to a chatfile (directly from Xenovas downloader or produced by 
     --save-chatfile-output) flag
     :type filepath: str
-    :returns: an array of chat messages
-    :rtype: list[chat_downloader.sites.common.ChatMessage]
+    :returns: a generator of chat messages
+    :rtype: Generator[chat_downloader.sites.common.ChatMessage]
     """
-    with open(filepath, 'r') as f:
-        chat_messages = json.load(f)
-    return chat_messages
+    return iter_chatmsgs_from_chatfile(filepath)
 
 def get_ChatAnalytics_from_file(filepath: str):
     """Given a path to a previous output file of this program containing analytical data,
@@ -140,12 +159,7 @@ def get_ChatAnalytics_from_file(filepath: str):
             for attr in dict.keys(jsonData):
                 # Nested objects have to be set manually
                 if(attr == 'samples'):
-                    setattr(chatAnalytics, attr, [])
-                    for sample_string in jsonData[attr]:
-                        sample_object = Sample(-1,-1)
-                        for attr2 in dict.keys(sample_string):
-                            setattr(sample_object, attr2, sample_string[attr2])
-                        chatAnalytics.samples.append(sample_object)
+                    chatAnalytics.samples = SampleTable.from_records(chatAnalytics.get_sample_type(), jsonData[attr])
                 else:
                     setattr(chatAnalytics, attr, jsonData[attr])
         except KeyError as exception:
@@ -169,10 +183,55 @@ def output_json_to_file(json_obj, filepath):
     
     print(f"Successfully wrote chat analytics to {filepath}")
 
+def read_chatlog(chatlog: Chat, settings: ProcessSettings):
+    """
+    Downloads/reads the whole chatlog without processing it (for the vectorized engine, which needs all of it up front).
+    Progress is printed the same way as when processing the chatlog message by message.
+
+    NOTE: Like ChatAnalytics.process_chatlog, reading stops after BREAK messages if settings.msg_break >= 0
+
+    :param chatlog: The chatlog to read
+    :type chatlog: chat_downloader.sites.common.Chat
+    :param settings: Utility class for passing information from the analyzer to the chatlog processor and post-processor
+    :type settings: ProcessSettings
+    """
+    print("Reading chat data...")
+
+    # Header
+    if(settings.print_interval > 0):
+        print("\033[1m"+PROG_PRINT_TEMPLATE.format("Completion", "Read Media Time", "# Messages Read")+"\033[0m")
+
+    total_duration: str = seconds_to_time(chatlog.duration)
+    msgs_read = 0
+    for idx, msg in enumerate(chatlog):
+        if idx==settings.msg_break:
+            break
+        msgs_read += 1
+        # Display progress every UPDATE_PROGRESS_INTERVAL messages
+        if(settings.print_interval > 0 and idx%settings.print_interval==0 and idx!=0):
+            completion: float = round((float(msg['time_in_seconds'])/chatlog.duration)*100, 2) # Completion %
+            print(PROG_PRINT_TEMPLATE.format(f"({completion}%)", f"{seconds_to_time(msg['time_in_seconds'])} / {total_duration}", f"{idx}"), end='\r')
+
+    if(settings.print_interval > 0):
+        print(PROG_PRINT_TEMPLATE.format("(100%)", f"{total_duration} / {total_duration}", f"{msgs_read}"))
+
+def get_interval_output_filepath(output_filepath: str, interval: int):
+    """When sampling several intervals, each interval gets its own output file: '[OUTPUT]_[INTERVAL]s.json'
+
+    :param output_filepath: The output filepath (of a single interval run)
+    :type output_filepath: str
+    :param interval: The interval of the ChatAnalytics written to the file
+    :type interval: int
+    :returns: The output filepath of the interval
+    :rtype: str
+    """
+    root, ext = os.path.splitext(output_filepath)
+    return f"{root}_{interval}s{ext}"
+
 def run(**kwargs):
     """Runs the chat-analyzer
 
-    :returns: The chat analytics data as a dataclass
+    :returns: The chat analytics data as a dataclass (a list of them, one per interval, if a list of intervals was provided)
     :rtype: dataformat.ChatAnalytics (dataformat.YoutubeChatAnalytics or dataformat.TwitchChatAnalytics)
     """
 
@@ -191,84 +250,185 @@ def run(**kwargs):
     # Mode arguments
     program_mode = kwargs.get('mode') # choices=["url", "chatfile", "reanalyze"]
     save_chatfile_output = kwargs.get('save_chatfile_output')
+    use_cache = not kwargs.get('no_cache')
+    download_workers = kwargs.get('download_workers') or 1
+    max_requests_per_second = kwargs.get('max_requests_per_second')
+    response_cache = kwargs.get('response_cache')
+    response_cache_size = kwargs.get('response_cache_size') or 1024
+    resume = kwargs.get('resume')
     # Processing (Sampling) arguments
     interval = kwargs.get('interval')
     print_interval = kwargs.get('print_interval')
+    engine = kwargs.get('engine') or 'auto' # choices=["auto", "loop", "vectorized"]
+    use_pipeline = kwargs.get('pipeline')
+    prefetch_depth = kwargs.get('pipeline_prefetch_depth') or DEFAULT_PREFETCH_DEPTH
+    batch_size = kwargs.get('pipeline_batch_size') or DEFAULT_BATCH_SIZE
     # Post-processing (Analyzing) arguments
     highlight_percentile = kwargs.get('highlight_percentile')
     highlight_metric = kwargs.get('highlight_metric')
     spike_sensitivity = kwargs.get('spike_sensitivity')
+    spike_metric = kwargs.get('spike_metric')
+    spike_algorithm = kwargs.get('spike_algorithm')
+    spike_lag = kwargs.get('spike_lag')
+    spike_influence = kwargs.get('spike_influence')
+    engagement_metric = kwargs.get('engagement_metric')
+    engagement_windows = kwargs.get('engagement_windows')
+    engagement_count = kwargs.get('engagement_count')
     # Output
     description = kwargs.get('description')
     output_filepath = kwargs.get('output')
+    store_filepath = kwargs.get('store')
     # Debugging
     msg_break = kwargs.get('break')
 
 
     # Consumed by the processing/post-processing logic in dataformat.py
-    process_settings = ProcessSettings(print_interval=print_interval, msg_break=msg_break, highlight_percentile=highlight_percentile, highlight_metric=highlight_metric, spike_sensitivity=spike_sensitivity)
+    process_settings = ProcessSettings(print_interval=print_interval, msg_break=msg_break, highlight_percentile=highlight_percentile, highlight_metric=highlight_metric, spike_sensitivity=spike_sensitivity,
+                                       spike_metric=spike_metric, spike_algorithm=spike_algorithm, spike_lag=spike_lag, spike_influence=spike_influence,
+                                       engagement_metric=engagement_metric, engagement_windows=engagement_windows, engagement_count=engagement_count)
 
 
+    # Several intervals can be sampled in the same run (one ChatAnalytics/output file per interval)
+    multiple_intervals = isinstance(interval, (list, tuple))
+    intervals = list(dict.fromkeys(interval)) if multiple_intervals else [interval] # (Drop duplicates, keep order)
+
     # Check interval argument, we check the url arg's platform in check_chatlog_supported()
     # NOTE: We double check here in addition to in CLI
-    if(interval > MAX_INTERVAL or interval < MIN_INTERVAL): 
-        raise ValueError(f"Sample interval must be {MIN_INTERVAL} <= interval <= {MAX_INTERVAL}")
+    for interval in intervals:
+        if(interval > MAX_INTERVAL or interval < MIN_INTERVAL): 
+            raise ValueError(f"Sample interval must be {MIN_INTERVAL} <= interval <= {MAX_INTERVAL}")
+
+    # The vectorized engine needs the whole chatlog up front. When the chat has to be downloaded, the loop engine
+    # processes it as it arrives instead (unless there are several intervals, which only the vectorized engine samples in one pass)
+    if(engine=='auto'):
+        engine = 'vectorized' if (program_mode=='chatfile' or len(intervals) > 1) else 'loop'
+    if(engine=='loop' and len(intervals) > 1):
+        raise ValueError("The loop sampling engine can only sample one interval at a time")
+    dprint(DEBUG, f"Sampling engine: {engine}")
 
     # Get the chat using the chat downloader and ensure that we can work with that data
     chatlog: Chat
+    chat_columns: ChatColumns = None # The chatlog as columns, for the vectorized engine
+    cache_builder: ChatColumnsBuilder = None # Set if the chat is read into columns (to write the columnar chat cache once the chat has been processed, and/or for the vectorized engine)
+    prefetcher: PrefetchingIterator = None # Set if the chat is downloaded in the background (--pipeline)
     if(program_mode=='url'):
+        chat_download_settings['output'] = save_chatfile_output # (Reset, in case of a previous run in the same process)
         if(save_chatfile_output!=None):
-            chat_download_settings['output']= save_chatfile_output
             print(f"Raw chat data file will be saved to {save_chatfile_output}")
+        chat_download_settings['download_workers'] = download_workers
+        chat_download_settings['max_requests_per_second'] = max_requests_per_second
+        chat_download_settings['response_cache'] = response_cache
+        chat_download_settings['max_response_cache_size'] = response_cache_size
+        chat_download_settings['resume'] = resume and save_chatfile_output != None
+        chat_download_settings['fields'] = ANALYSIS_FIELDS if save_chatfile_output == None else None # (The chatfile keeps the full messages)
         url = source
         platform = urlparse(url).netloc
         chatlog = get_chatlog_downloader(url)
         check_chatlog_downloader_supported(chatlog, url)
+        if(use_pipeline):
+            # Download (and parse) the chat in a background thread while it is processed
+            # NOTE: Wraps the downloader's generator itself, so that the cache columns & the chatfile output are still built/written by the consumer
+            prefetcher = PrefetchingIterator(chatlog.chat, prefetch_depth=prefetch_depth, batch_size=batch_size, debug=DEBUG)
+            chatlog.chat = prefetcher
+            dprint(DEBUG, f"Pipeline enabled (prefetch depth: {prefetch_depth} batches, batch size: {batch_size} messages)")
+        if(chatlog.resumed_from != None):
+            # Only the rest of the chat is downloaded (and appended to the chatfile). The messages downloaded before
+            # the interruption are read back from the chatfile first, so the whole chat is processed
+            print(f"Resuming the download after the {chatlog.resumed_from.get('message_count')} messages already saved to {save_chatfile_output}")
+            chatlog = Chat(chat=itertools.chain(get_chatmsgs_from_chatfile(save_chatfile_output), chatlog),
+                           title=chatlog.title, duration=chatlog.duration, status=chatlog.status, video_type=chatlog.video_type, id=chatlog.id)
+        if((save_chatfile_output!=None and use_cache) or engine=='vectorized'):
+            # Build the columns from the same messages that are written to the chatfile
+            cache_builder = ChatColumnsBuilder()
+            chatlog.chat = cache_builder.tee(chatlog.chat)
     elif(program_mode=='chatfile'):
         # Have to create the Chat object manually. 
         # We just have the chat messages so we have to guess on some fields (Limitation from Xenova's chat-downloader)
         # NOTE: We could require custom chatfiles with manually imposed fields, but that destroys compatibility w/ native Xenova chat-downloader
-        chat_messages = get_chatmsgs_from_chatfile(source) 
-        chat_msg_iterator = iter(chat_messages)       
+        chat_columns = load_chatfile_cache(source) if use_cache else None
+        if(chat_columns != None):
+            dprint(DEBUG, f"Using the columnar chat cache of {source} ({len(chat_columns)} messages)")
+            chat_msg_iterator = chat_columns.iter_messages()
+            chat_duration = chat_columns.duration
+        else:
+            chat_msg_iterator = get_chatmsgs_from_chatfile(source)
+            chat_duration = get_chatfile_duration(source) # We don't have duration so we approximate by taking the last message's timestamp
+            if(use_cache or engine=='vectorized'):
+                # Build the columns while we read the chatfile, to cache them (so the next run doesn't have to parse the chatfile again) and/or for the vectorized engine
+                cache_builder = ChatColumnsBuilder()
+                chat_msg_iterator = cache_builder.tee(chat_msg_iterator)
         chat_title = ntpath.basename(source) # We don't have the title of original vid so file name is next best thing
-        chat_duration = chat_messages[-1]['time_in_seconds'] # We don't have duration so we approximate by taking the last message's timestamp
+        if(chat_duration == None):
+            logging.critical(f"ERROR: Could not find any timestamped chat messages in the chatfile: {source}")
+            exit(1)
         chat_status = 'past' # (has to be, since its a chatfile)
 
         chatlog = Chat(chat=chat_msg_iterator, title=chat_title, duration=chat_duration, status=chat_status)
         # NOTE: platform required to provided through CLI, so don't need to set it here
         # NOTE: We assume that its a supported platform because user had to provide a platform via CLI which checks it there
 
-    # Next section: Create the proper type of ChatAnalytics object based on the platform
-    chatAnalytics: ChatAnalytics
+    if(program_mode!='reanalyze' and engine=='vectorized' and chat_columns == None):
+        # The vectorized engine samples the whole chatlog at once, so read (download) all of it up front
+        read_chatlog(chatlog, process_settings)
+        if(prefetcher != None):
+            prefetcher.close() # (In case reading stopped early, ex: --break)
+        chat_columns = cache_builder.build()
+
+    # Next section: Create the proper type of ChatAnalytics object(s) based on the platform
+    chatAnalyticsList: List[ChatAnalytics]
     
     if(program_mode=='reanalyze'):
         # Create the ChatAnalytics object from the saved json file
         chatAnalytics = get_ChatAnalytics_from_file(source)
         dprint(DEBUG,f"chatanalytics object: {type(chatAnalytics)}")
         chatAnalytics.chatlog_post_process(process_settings)
+        chatAnalyticsList = [chatAnalytics]
     else:
-        # We aren't reanalyzing a file, create the chatAnalytics object and process normally
+        # We aren't reanalyzing a file, create the chatAnalytics object (one per interval) and process normally
         if(platform == YOUTUBE_NETLOC or platform == YOUTUBE_SHORT_NETLOC):
-            chatAnalytics = YoutubeChatAnalytics(duration=chatlog.duration, platform=platform, interval=interval, description=description, program_version=__version__)
+            chatAnalyticsList = [YoutubeChatAnalytics(duration=chatlog.duration, platform=platform, interval=interval, description=description, program_version=__version__) for interval in intervals]
         elif(platform == TWITCH_NETLOC):
-            chatAnalytics = TwitchChatAnalytics(duration=chatlog.duration, platform=platform, interval=interval, description=description, program_version=__version__)
+            chatAnalyticsList = [TwitchChatAnalytics(duration=chatlog.duration, platform=platform, interval=interval, description=description, program_version=__version__) for interval in intervals]
         else:
             logging.critical(
                 "ERROR: No corresponding ChatAnalytics object.\n\
                 NOTE: Should have caught this in supported platforms checks earlier...")
             exit(1)
         # Now, we can process & analyze the data!
-        chatAnalytics.process_chatlog(chatlog, source, process_settings)
-        
-    # chatAnalytics now contains all analytical data. We can print/return as ncessary
-   
-    json_obj = chatAnalytics.to_JSON()
+        if(engine=='vectorized'):
+            process_columns_for_intervals(chatAnalyticsList, chat_columns, chatlog.title, source, process_settings)
+        else:
+            chatAnalyticsList[0].process_chatlog(chatlog, source, process_settings)
+            if(prefetcher != None):
+                prefetcher.close() # (In case processing stopped early, ex: --break)
 
-    if(output_filepath==None): # If user did not specify an output filepath, use this default convention
-        output_filepath = remove_non_alpha_numeric(chatAnalytics.mediaTitle)+'.json'
-    output_json_to_file(json_obj, output_filepath)     
-    
-   
+        # Only a cache of the complete chatlog is usable (processing may have stopped early, ex: --break)
+        if(use_cache and cache_builder != None and cache_builder.complete and (program_mode=='chatfile' or save_chatfile_output!=None)):
+            chatfile_path = source if program_mode=='chatfile' else save_chatfile_output
+            save_chatfile_cache(chatfile_path, cache_builder.build())
+            dprint(DEBUG, f"Saved the columnar chat cache of {chatfile_path}")
 
-    return chatAnalytics
+    if(program_mode=='url'):
+        # Requests made, retries, and time spent waiting on the rate limit of each host the chat was downloaded from
+        dprint(DEBUG, f"Download rate limiting: {get_all_host_stats()}")
+        
+    # chatAnalytics now contains all analytical data. We can print/return as ncessary
+    for chatAnalytics in chatAnalyticsList:
+        json_obj = chatAnalytics.to_JSON()
 
+        if(output_filepath==None): # If user did not specify an output filepath, use this default convention
+            interval_output_filepath = remove_non_alpha_numeric(chatAnalytics.mediaTitle)+'.json'
+        else:
+            interval_output_filepath = output_filepath
+        if(len(chatAnalyticsList) > 1):
+            interval_output_filepath = get_interval_output_filepath(interval_output_filepath, chatAnalytics.interval)
+        output_json_to_file(json_obj, interval_output_filepath)
+
+    if(store_filepath != None):
+        # Also append the analytics to the store, to query them along with the analytics of other chatlogs
+        with AnalyticsStore(store_filepath) as store:
+            for chatAnalytics in chatAnalyticsList:
+                store.add(chatAnalytics)
+        print(f"Successfully added chat analytics to the store {store_filepath}")
+
+    return chatAnalyticsList if multiple_intervals else chatAnalyticsList[0]
@@ -0,0 +1,234 @@
+"""
+Batch mode: analyzes many sources (URLs and/or chatfiles) in one invocation.
+
+Each source is analyzed by a worker of a bounded process pool, so the startup cost (imports, site setup) is paid once per worker
+instead of once per source, and sources are analyzed in parallel. Every source gets its own output file (and log file) in the
+output directory, a failing source is recorded and skipped, and a summary index of all the sources is written once the batch is over.
+"""
+
+import os
+import glob
+import json
+import time
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+from .util import remove_non_alpha_numeric
+
+# Name of the summary index, written to the output directory
+BATCH_INDEX_FILENAME = 'index.json'
+
+# Output directory used when none is specified
+DEFAULT_BATCH_OUTPUT_DIRECTORY = 'chat_analyzer_batch'
+
+# Characters that make a source a glob pattern (rather than a list file)
+_GLOB_CHARACTERS = ('*', '?', '[')
+
+# Arguments of the batch itself, which are not passed on to the analysis of each source
+_BATCH_ONLY_ARGUMENTS = ('batch', 'batch_workers', 'skip_existing', 'channel', 'since', 'until', 'channel_limit')
+
+def is_url_source(source: str) -> bool:
+    """Whether a batch source is a URL (to download the chat from) rather than a file
+
+    :param source: a batch source
+    :type source: str
+    :rtype: bool
+    """
+    return urlparse(source).scheme in ('http', 'https')
+
+def get_batch_sources(batch_source: str):
+    """Get the sources of a batch.
+
+    The batch source is either a list file, with one source (URL or filepath) per line (empty lines and lines starting with '#' are ignored),
+    or a glob pattern matching the files to analyze (ex: 'chats/**/*.json').
+
+    :param batch_source: a list file or a glob pattern
+    :type batch_source: str
+    :returns: the sources, in order and without duplicates
+    :rtype: List[str]
+    """
+    if(os.path.isfile(batch_source)):
+        with open(batch_source, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+        sources = [line for line in lines if line and not line.startswith('#')]
+    elif(any(c in batch_source for c in _GLOB_CHARACTERS)):
+        sources = sorted(glob.glob(batch_source, recursive=True))
+    else:
+        raise ValueError(f"The batch source must be a list file or a glob pattern: {batch_source}")
+
+    return list(dict.fromkeys(sources)) # (Drop duplicates, keep order)
+
+def get_source_name(source: str) -> str:
+    """Get the name used for the output files of a source (deterministic, so a batch can be re-run with --skip-existing)
+
+    :param source: a batch source
+    :type source: str
+    :rtype: str
+    """
+    if(is_url_source(source)):
+        parsed = urlparse(source)
+        name = f"{parsed.netloc} {parsed.path} {parsed.query}".replace('/', ' ')
+    else:
+        name = os.path.splitext(os.path.basename(source))[0]
+    return remove_non_alpha_numeric(name.strip()) or 'source'
+
+def get_source_output_filepaths(output_filepath: str, intervals):
+    """Get the analytics files written for a source (one per interval, if there are several intervals)
+
+    :param output_filepath: The output filepath of the source
+    :type output_filepath: str
+    :param intervals: The interval(s) sampled
+    :type intervals: Union[int, List[int]]
+    :rtype: List[str]
+    """
+    from .analyzer import get_interval_output_filepath
+
+    if(isinstance(intervals, (list, tuple)) and len(set(intervals)) > 1):
+        return [get_interval_output_filepath(output_filepath, interval) for interval in dict.fromkeys(intervals)]
+    return [output_filepath]
+
+def _run_source(source_kwargs: dict, log_filepath: str) -> dict:
+    """Analyze a single source (in a worker process). The console output of the analysis is written to the source's log file.
+
+    Never raises (except on keyboard interrupts): failures, including the analyzer exiting, are reported in the returned entry.
+
+    :returns: The source's entry of the summary index
+    :rtype: dict
+    """
+    # Imported here (once per worker process), the main process does not need the analyzer
+    from .analyzer import run
+
+    entry = {
+        'source': source_kwargs['source'],
+        'mode': source_kwargs['mode'],
+        'log': log_filepath,
+    }
+    start_time = time.time()
+    with open(log_filepath, 'w', encoding='utf-8') as log_file, contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        try:
+            result = run(**source_kwargs)
+            chatAnalytics = result[0] if isinstance(result, list) else result
+            entry['status'] = 'ok'
+            entry['title'] = chatAnalytics.mediaTitle
+            entry['duration'] = chatAnalytics.duration
+            entry['outputs'] = get_source_output_filepaths(source_kwargs['output'], source_kwargs.get('interval'))
+        except KeyboardInterrupt:
+            raise
+        except BaseException as exception: # (Including SystemExit, the analyzer exits on fatal errors)
+            traceback.print_exc()
+            entry['status'] = 'failed'
+            entry['error'] = f"{type(exception).__name__}: {exception}"
+    entry['elapsed'] = round(time.time() - start_time, 3)
+    return entry
+
+def _write_index(index_filepath: str, entries):
+    with open(index_filepath, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=4)
+
+def run_batch(**kwargs):
+    """Runs the chat-analyzer on every source of a batch (see get_batch_sources), in a pool of worker processes.
+
+    Takes the same arguments as analyzer.run (applied to every source), where 'source' is the batch source, 'output' is the output directory,
+    and 'save_chatfile_output' (if set) is the directory to save the chatfiles of the URL sources to. Each source is written to '[OUTPUT]/[NAME].json'
+    (and logged to '[OUTPUT]/[NAME].log'), where NAME is derived from the URL or the chatfile's name.
+    The summary index ('[OUTPUT]/index.json') lists every source with its status, output files and errors, and is updated as sources complete.
+
+    Additional arguments:
+        - batch_workers: the number of worker processes (defaults to the number of CPUs)
+        - skip_existing: skip the sources whose output files already exist (ex: to continue an interrupted batch)
+
+    :returns: The summary index
+    :rtype: List[dict]
+    """
+    sources = get_batch_sources(kwargs['source'])
+    names = []
+    used_names = set()
+    for position, source in enumerate(sources):
+        name = get_source_name(source)
+        if(name in used_names): # Several sources with the same name (ex: chatfiles from different directories)
+            name = f"{name}_{position}"
+        used_names.add(name)
+        names.append(name)
+    return run_sources(sources, names, **kwargs)
+
+def run_sources(sources, names, entry_info=None, **kwargs):
+    """Runs the chat-analyzer on a list of sources, in a pool of worker processes (see run_batch for the arguments and output files).
+
+    :param sources: The sources (URLs and/or filepaths)
+    :type sources: List[str]
+    :param names: The (unique) name of the output files of each source
+    :type names: List[str]
+    :param entry_info: Additional information to include in the summary index entry of each source
+    :type entry_info: List[dict]
+    :returns: The summary index, one entry per source (in order)
+    :rtype: List[dict]
+    """
+    output_directory = kwargs.get('output') or DEFAULT_BATCH_OUTPUT_DIRECTORY
+    chatfile_directory = kwargs.get('save_chatfile_output')
+    batch_workers = kwargs.get('batch_workers') or os.cpu_count() or 1
+    skip_existing = kwargs.get('skip_existing')
+    file_mode = kwargs.get('mode') if kwargs.get('mode') in ('chatfile', 'reanalyze') else 'chatfile'
+
+    os.makedirs(output_directory, exist_ok=True)
+    if(chatfile_directory):
+        os.makedirs(chatfile_directory, exist_ok=True)
+    index_filepath = os.path.join(output_directory, BATCH_INDEX_FILENAME)
+
+    # The arguments of every source (the batch arguments, with its own source, mode and files)
+    base_kwargs = {k: v for k, v in kwargs.items() if k not in _BATCH_ONLY_ARGUMENTS}
+    base_kwargs['print_interval'] = 0 # (Progress is reported per source instead)
+    jobs = []
+    entries = [None] * len(sources)
+    for position, (source, name) in enumerate(zip(sources, names)):
+        source_kwargs = dict(base_kwargs, source=source, output=os.path.join(output_directory, name+'.json'))
+        if(is_url_source(source)):
+            source_kwargs['mode'] = 'url'
+            source_kwargs['save_chatfile_output'] = os.path.join(chatfile_directory, name+'.json') if chatfile_directory else None
+        else:
+            source_kwargs['mode'] = file_mode
+            source_kwargs['save_chatfile_output'] = None
+            source_kwargs['resume'] = False
+
+        outputs = get_source_output_filepaths(source_kwargs['output'], kwargs.get('interval'))
+        if(skip_existing and all(os.path.exists(output) for output in outputs)):
+            entries[position] = {'source': source, 'mode': source_kwargs['mode'], 'status': 'skipped', 'outputs': outputs}
+            if(entry_info):
+                entries[position].update(entry_info[position])
+            continue
+        jobs.append((position, source_kwargs, os.path.join(output_directory, name+'.log')))
+
+    print(f"Analyzing {len(jobs)} source(s) with {batch_workers} worker process(es) ({len(sources)-len(jobs)} skipped). Writing output to {output_directory}")
+
+    completed = 0
+    futures = {}
+    executor = ProcessPoolExecutor(max_workers=min(batch_workers, max(len(jobs), 1)))
+    try:
+        for position, source_kwargs, log_filepath in jobs:
+            futures[executor.submit(_run_source, source_kwargs, log_filepath)] = position
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                entry = future.result()
+            except Exception as exception: # The worker itself failed (ex: it was killed)
+                entry = {'source': sources[position], 'status': 'failed', 'error': f"{type(exception).__name__}: {exception}"}
+            if(entry_info):
+                entry.update(entry_info[position])
+            entries[position] = entry
+            completed += 1
+            status = entry['status'] if entry['status']=='ok' else f"\033[1;31m{entry['status']}\033[0m ({entry.get('error')})"
+            print(f"[{completed}/{len(jobs)}] {entry['source']}: {status}")
+            _write_index(index_filepath, [entry for entry in entries if entry != None]) # (Kept up to date, in case the batch is interrupted)
+    except KeyboardInterrupt:
+        print("Batch interrupted, cancelling the remaining sources...")
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        _write_index(index_filepath, [entry for entry in entries if entry != None])
+
+    failed = [entry for entry in entries if entry['status']=='failed']
+    print(f"Batch complete: {len(jobs)-len(failed)} succeeded, {len(failed)} failed, {len(sources)-len(jobs)} skipped. Summary written to {index_filepath}")
+    return entries
@@ -0,0 +1,241 @@
+"""
+Channel mode: analyzes the past broadcasts of a channel (optionally within a date range).
+
+The channel's past broadcasts are listed, and the ones that were not analyzed yet are downloaded and analyzed in a pool of worker processes
+(see batch.py). Outputs are named after the video id, so that re-running on the same output directory (ex: a nightly sync) only analyzes the new
+broadcasts. Once the broadcasts are analyzed, a rollup of the channel ('channel.json': totals and highlight density per hour, across broadcasts)
+is written to the output directory.
+"""
+
+import os
+import json
+import math
+import datetime
+from urllib.parse import urlparse
+
+from .batch import run_sources, get_source_output_filepaths, DEFAULT_BATCH_OUTPUT_DIRECTORY
+from .chat_downloader.utils.core import seconds_to_time
+
+# Name of the channel rollup, written to the output directory
+CHANNEL_ROLLUP_FILENAME = 'channel.json'
+
+# Format of the --since and --until dates
+CHANNEL_DATE_FORMAT = '%Y-%m-%d'
+
+_TWITCH_CHANNEL_NETLOCS = ('www.twitch.tv', 'twitch.tv', 'm.twitch.tv')
+_YOUTUBE_CHANNEL_NETLOCS = ('www.youtube.com', 'youtube.com', 'm.youtube.com')
+# YouTube channel URL path type -> YouTubeChatDownloader.get_user_videos argument
+_YOUTUBE_CHANNEL_TYPES = {
+    'channel': 'channel_id',
+    'user': 'user_id',
+    'c': 'custom_username',
+}
+
+def parse_channel(channel: str):
+    """Parse a channel URL (ex: 'https://www.twitch.tv/[USERNAME]', 'https://www.youtube.com/channel/[CHANNEL_ID]',
+    'https://www.youtube.com/c/[NAME]' or 'https://www.youtube.com/user/[USER_ID]')
+
+    :param channel: The URL of the channel
+    :type channel: str
+    :raises ValueError: if the URL is not the URL of a supported channel
+    :returns: The platform ('twitch' or 'youtube') and the channel's identifier (a Twitch username, or a YouTube (type, id) pair)
+    :rtype: Tuple[str, Union[str, Tuple[str, str]]]
+    """
+    parsed = urlparse(channel)
+    path = [part for part in parsed.path.split('/') if part]
+    if(parsed.netloc in _TWITCH_CHANNEL_NETLOCS and len(path) >= 1 and path[0] not in ('videos', 'directory')):
+        return 'twitch', path[0]
+    if(parsed.netloc in _YOUTUBE_CHANNEL_NETLOCS and len(path) >= 2 and path[0] in _YOUTUBE_CHANNEL_TYPES):
+        return 'youtube', (path[0], path[1])
+    raise ValueError(f"Unsupported channel URL (expected https://www.twitch.tv/[USERNAME] or https://www.youtube.com/[channel|c|user]/[ID]): {channel}")
+
+def parse_channel_date(date: str, end_of_day: bool = False):
+    """Parse a --since/--until date (YYYY-MM-DD, UTC) into a timestamp in microseconds (comparable to the publication time of Twitch videos)
+
+    :param date: The date, or None
+    :type date: str
+    :param end_of_day: Get the end of the day (for an inclusive upper bound) rather than its start
+    :type end_of_day: bool
+    :rtype: Union[int, None]
+    """
+    if(date == None):
+        return None
+    day = datetime.datetime.strptime(date, CHANNEL_DATE_FORMAT)
+    if(end_of_day):
+        day += datetime.timedelta(days=1)
+    # (Naive, like chat_downloader's timestamp_to_microseconds, so both are shifted the same way)
+    return round(day.timestamp() * 1e6) - (1 if end_of_day else 0)
+
+def _format_publication_time(published_at):
+    if(published_at == None):
+        return None
+    return datetime.datetime.fromtimestamp(published_at / 1e6).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def get_channel_videos(channel: str, since: str = None, until: str = None, limit: int = None):
+    """List the past broadcasts of a channel, most recent first.
+
+    NOTE: YouTube channel listings do not include publication dates, so the date range can only be applied to Twitch channels.
+
+    :param channel: The URL of the channel (see parse_channel)
+    :type channel: str
+    :param since: Only list the broadcasts published on or after this date (YYYY-MM-DD)
+    :type since: str
+    :param until: Only list the broadcasts published on or before this date (YYYY-MM-DD)
+    :type until: str
+    :param limit: The maximum number of (most recent) broadcasts to list
+    :type limit: int
+    :returns: The broadcasts, each with its 'id', 'url', 'title' and 'published_at' (None for YouTube)
+    :rtype: List[dict]
+    """
+    # Imported here, the other modes do not need the site downloaders
+    from .chat_downloader.chat_downloader import ChatDownloader
+    from .chat_downloader.sites.twitch import TwitchChatDownloader
+    from .chat_downloader.sites.youtube import YouTubeChatDownloader
+
+    platform, identifier = parse_channel(channel)
+    since_time = parse_channel_date(since)
+    until_time = parse_channel_date(until, end_of_day=True)
+
+    videos = []
+    downloader = ChatDownloader()
+    try:
+        if(platform == 'twitch'):
+            session = downloader.create_session(TwitchChatDownloader)
+            # Past broadcasts, most recent first (so listing can stop at the start of the date range)
+            for video in session.get_user_videos(identifier, video_type='ARCHIVE', sort='TIME'):
+                published_at = video.get('published_at')
+                if(until_time != None and published_at != None and published_at > until_time):
+                    continue
+                if(since_time != None and published_at != None and published_at < since_time):
+                    break
+                videos.append({
+                    'id': video['id'],
+                    'url': f"https://www.twitch.tv/videos/{video['id']}",
+                    'title': video.get('title'),
+                    'published_at': _format_publication_time(published_at),
+                })
+                if(limit != None and len(videos) >= limit):
+                    break
+        else:
+            session = downloader.create_session(YouTubeChatDownloader)
+            channel_type, channel_id = identifier
+            for video in session.get_user_videos(video_status='past', **{_YOUTUBE_CHANNEL_TYPES[channel_type]: channel_id}):
+                videos.append({
+                    'id': video['video_id'],
+                    'url': f"https://www.youtube.com/watch?v={video['video_id']}",
+                    'title': video.get('title'),
+                    'published_at': None,
+                })
+                if(limit != None and len(videos) >= limit):
+                    break
+    finally:
+        downloader.close()
+
+    return videos
+
+def get_channel_rollup(channel: str, videos, output_filepaths):
+    """Aggregate the analytics of a channel's broadcasts.
+
+    Highlight density is the number of highlights per hour of broadcast, overall and by hour of the broadcasts
+    (ex: hour 0 is the first hour of every broadcast, only counting the broadcasts that lasted that long), so it
+    can be compared between broadcasts of different lengths.
+
+    :param channel: The URL of the channel
+    :type channel: str
+    :param videos: The channel's broadcasts (see get_channel_videos)
+    :type videos: List[dict]
+    :param output_filepaths: The analytics file of each broadcast (broadcasts without one are left out of the rollup)
+    :type output_filepaths: List[str]
+    :returns: The rollup
+    :rtype: dict
+    """
+    vods = []
+    hours = [] # Hour of the broadcasts -> [broadcast seconds, number of broadcasts, number of highlights, highlight seconds]
+    for video, output_filepath in zip(videos, output_filepaths):
+        if(not os.path.exists(output_filepath)):
+            continue
+        with open(output_filepath, 'r', encoding='utf-8') as f:
+            analytics = json.load(f)
+
+        duration = analytics.get('duration') or 0
+        highlights = analytics.get('highlights') or []
+        for hour in range(math.ceil(duration / 3600)):
+            if(hour == len(hours)):
+                hours.append([0, 0, 0, 0])
+            hours[hour][0] += min(duration - hour*3600, 3600)
+            hours[hour][1] += 1
+        for highlight in (highlights if hours else []):
+            hour = min(int(highlight['startTime'] // 3600), len(hours)-1)
+            hours[hour][2] += 1
+            hours[hour][3] += highlight['duration']
+
+        vods.append({
+            'id': video['id'],
+            'url': video['url'],
+            'title': analytics.get('mediaTitle') or video.get('title'),
+            'published_at': video.get('published_at'),
+            'output': output_filepath,
+            'duration': duration,
+            'totalActivity': analytics.get('totalActivity', 0),
+            'totalChatMessages': analytics.get('totalChatMessages', 0),
+            'totalUniqueUsers': analytics.get('totalUniqueUsers', 0),
+            'highlights': len(highlights),
+            'highlights_duration': analytics.get('highlights_duration', 0),
+            'highlightsPerHour': len(highlights) / (duration / 3600) if duration > 0 else 0,
+        })
+
+    total_duration = sum(vod['duration'] for vod in vods)
+    total_highlights = sum(vod['highlights'] for vod in vods)
+    return {
+        'channel': channel,
+        'vods': len(vods),
+        'duration': total_duration,
+        'duration_text': seconds_to_time(total_duration),
+        'totalActivity': sum(vod['totalActivity'] for vod in vods),
+        'totalChatMessages': sum(vod['totalChatMessages'] for vod in vods),
+        'highlights': total_highlights,
+        'highlights_duration': sum(vod['highlights_duration'] for vod in vods),
+        'highlightsPerHour': total_highlights / (total_duration / 3600) if total_duration > 0 else 0,
+        'highlightDensityByHour': [{
+            'hour': hour,
+            'vods': num_vods,
+            'highlights': num_highlights,
+            'highlights_duration': highlight_seconds,
+            'highlightsPerHour': num_highlights / (seconds / 3600) if seconds > 0 else 0,
+        } for hour, (seconds, num_vods, num_highlights, highlight_seconds) in enumerate(hours)],
+        'vodList': vods,
+    }
+
+def run_channel(**kwargs):
+    """Runs the chat-analyzer on the past broadcasts of a channel (see get_channel_videos), in a pool of worker processes.
+
+    Takes the same arguments as batch.run_batch, where 'source' is the URL of the channel. Each broadcast is written to '[OUTPUT]/[VIDEO ID].json',
+    and broadcasts that already have an output file are skipped, so only new broadcasts are analyzed when the output directory is reused.
+    The rollup of every listed broadcast that has an output file (analyzed in this run or a previous one) is written to '[OUTPUT]/channel.json'.
+
+    Additional arguments:
+        - since, until: the date range (YYYY-MM-DD, inclusive) of the broadcasts to analyze (Twitch only)
+        - channel_limit: the maximum number of (most recent) broadcasts to analyze
+
+    :returns: The summary index
+    :rtype: List[dict]
+    """
+    channel = kwargs['source']
+    output_directory = kwargs.get('output') or DEFAULT_BATCH_OUTPUT_DIRECTORY
+
+    print(f"Listing the past broadcasts of {channel}...")
+    videos = get_channel_videos(channel, kwargs.get('since'), kwargs.get('until'), kwargs.get('channel_limit'))
+    print(f"Found {len(videos)} past broadcast(s)")
+
+    names = [video['id'] for video in videos]
+    entry_info = [{'video_id': video['id'], 'published_at': video['published_at']} for video in videos]
+    entries = run_sources([video['url'] for video in videos], names, entry_info, **dict(kwargs, output=output_directory, skip_existing=True))
+
+    output_filepaths = [get_source_output_filepaths(os.path.join(output_directory, name+'.json'), kwargs.get('interval'))[0] for name in names]
+    rollup = get_channel_rollup(channel, videos, output_filepaths)
+    rollup_filepath = os.path.join(output_directory, CHANNEL_ROLLUP_FILENAME)
+    with open(rollup_filepath, 'w', encoding='utf-8') as f:
+        json.dump(rollup, f, ensure_ascii=False, indent=4)
+    print(f"Channel rollup ({rollup['vods']} broadcast(s), {rollup['highlightsPerHour']:.2f} highlights per hour) written to {rollup_filepath}")
+
+    return entries
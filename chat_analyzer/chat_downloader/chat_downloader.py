@@ -3,6 +3,8 @@ import sys
 import itertools
 import time
 import json
+import asyncio
+import functools
 
 from urllib.parse import urlparse
 
@@ -10,7 +12,9 @@ from .metadata import __version__
 
 from .sites.common import (
     SiteDefault,
-    BaseChatDownloader
+    BaseChatDownloader,
+    AsyncChat,
+    MessageProjection
 )
 from .sites import get_all_sites
 
@@ -32,6 +36,20 @@ from .debugging import (
 
 from .output.continuous_write import ContinuousWriter
 
+from .utils.response_cache import ResponseCache
+
+from .utils.async_http import (
+    create_async_client,
+    DEFAULT_CONNECTION_LIMIT
+)
+
+from .output.checkpoint import (
+    DownloadCheckpoint,
+    get_checkpoint_file_name,
+    check_written_messages,
+    skip_written_messages
+)
+
 
 from requests.exceptions import (
     RequestException,
@@ -80,6 +98,12 @@ class ChatDownloader():
         # Track sessions using a dictionary (allows for reusing)
         self.sessions = {}
 
+        # Response caches, by directory (shared by all sessions)
+        self.response_caches = {}
+
+        # Asynchronous HTTP client (shared by all asynchronous downloads)
+        self.async_client = None
+
     def get_chat(self, url=None,
                  start_time=None,
                  end_time=None,
@@ -92,10 +116,18 @@ class ChatDownloader():
 
                  message_groups=SiteDefault('message_groups'),
                  message_types=None,
+                 fields=None,
+
+                 # Downloading
+                 download_workers=1,
+                 max_requests_per_second=None,
+                 response_cache=None,
+                 max_response_cache_size=1024,
 
                  # Output
                  output=None,
                  overwrite=True,
+                 resume=False,
                  sort_keys=True,
                  indent=4,
 
@@ -146,6 +178,34 @@ class ChatDownloader():
         :type message_groups: SiteDefault, optional
         :param message_types: List of messages types to include, defaults to None
         :type message_types: list, optional
+        :param fields: List of the fields of messages to build (nested fields
+            are separated by dots, e.g. 'author.id'). Other fields are not
+            parsed, which makes downloading faster when only some fields are
+            needed. The id, type and time fields are always included.
+            Supported for Twitch VODs and YouTube chats. Defaults to None
+            (all fields)
+        :type fields: list, optional
+        :param download_workers: Maximum number of concurrent requests used to
+            download the chat of a past broadcast. The broadcast is split into
+            time ranges (or chunks of messages) which are downloaded in
+            parallel. Supported for Twitch VODs, YouTube chat replays and
+            Reddit past broadcasts. Defaults to 1 (download serially)
+        :type download_workers: int, optional
+        :param max_requests_per_second: Maximum number of requests per second
+            made to each host, shared by all download workers (and sessions).
+            The rate is lowered automatically when the host rate limits the
+            requests. Defaults to None (unlimited, until rate limited)
+        :type max_requests_per_second: float, optional
+        :param response_cache: Path of a directory in which to cache the
+            responses of past broadcasts' chat (Twitch VOD comments, YouTube
+            chat replays and Reddit comments). Later downloads of the same
+            chat reuse the cached responses instead of making the requests
+            again. Defaults to None (no caching)
+        :type response_cache: str, optional
+        :param max_response_cache_size: Maximum size of the response cache
+            (in MiB), beyond which the least recently used responses are
+            removed. Defaults to 1024
+        :type max_response_cache_size: float, optional
         :param output: Path of the output file, defaults to None (print to
             standard output)
         :type output: str, optional
@@ -153,6 +213,10 @@ class ChatDownloader():
             to the end of the file. Defaults to True. In both cases, the file
             (and directories) is created if it does not exist.
         :type overwrite: bool, optional
+        :param resume: Resume an interrupted download of a past broadcast's
+            chat from its checkpoint (saved next to the output file, while
+            downloading), appending to the output file. Defaults to False
+        :type resume: bool, optional
         :param sort_keys: Sort keys when outputting to a file, defaults to True
         :type sort_keys: bool, optional
         :param indent: Number of spaces to indent JSON objects by. If
@@ -213,6 +277,41 @@ class ChatDownloader():
                 for k, v in original_params.items():
                     params[k] = site_object.get_site_value(v)
 
+                params['projection'] = MessageProjection(
+                    params['fields']) if params['fields'] else None
+
+                site_object.set_rate_limit(params['max_requests_per_second'])
+                site_object.set_response_cache(self.get_response_cache(
+                    params['response_cache'], params['max_response_cache_size']))
+
+                previous_checkpoint = None
+                if params['output']:
+                    # Save how far the download gets, so it can be resumed if interrupted
+                    checkpoint_file_name = get_checkpoint_file_name(
+                        params['output'])
+
+                    if params['resume']:
+                        previous_checkpoint = DownloadCheckpoint.load(
+                            checkpoint_file_name)
+
+                        if previous_checkpoint is None:
+                            log('info', f'No checkpoint found ({checkpoint_file_name}), downloading from the start.')
+                        elif previous_checkpoint.get('url') != url:
+                            log('warning', f"Checkpoint is for a different URL ({previous_checkpoint.get('url')}), downloading from the start.")
+                            previous_checkpoint = None
+                        else:
+                            previous_checkpoint = check_written_messages(
+                                params['output'], previous_checkpoint)
+
+                        if previous_checkpoint is not None:
+                            log('info', f"Resuming after {previous_checkpoint.get('message_count')} messages.")
+                            params['resume_state'] = previous_checkpoint.get(
+                                'state')
+                            params['overwrite'] = False  # append
+
+                    params['download_checkpoint'] = DownloadCheckpoint(
+                        checkpoint_file_name, url, previous=previous_checkpoint)
+
                 log('info', f'Site: {site_object._NAME}')
                 log('debug', f'Program parameters: {params}')
 
@@ -229,6 +328,12 @@ class ChatDownloader():
                     raise ChatGeneratorError(
                         f'No valid generator found in {site.__name__} for url "{url}"')
 
+                if previous_checkpoint is not None:
+                    # The download resumes from the page of the last written message
+                    chat.chat = skip_written_messages(
+                        chat.chat, previous_checkpoint)
+                    chat.resumed_from = previous_checkpoint
+
                 if isinstance(params['max_messages'], int):
                     chat.chat = itertools.islice(
                         chat.chat, params['max_messages'])
@@ -268,6 +373,7 @@ class ChatDownloader():
                         overwrite=params['overwrite'],
                         lazy_initialise=True
                     ))
+                    chat.attach_checkpoint(params['download_checkpoint'])
 
                 chat.site = site_object
 
@@ -289,6 +395,66 @@ class ChatDownloader():
         else:
             raise InvalidURL(f'Invalid URL: "{url}"')
 
+    async def get_chat_async(self, url=None, **kwargs):
+        """Asynchronous version of `get_chat`, used to download many chats
+        concurrently, on a single event loop. Requires aiohttp.
+
+        Takes the same parameters as `get_chat`. Chats are downloaded with an
+        HTTP client (and connection pool) shared by all asynchronous downloads
+        of this object, except for those which a site cannot download
+        asynchronously (e.g. Twitch livestreams), which use a thread each.
+        The chat's information is retrieved in a thread of the event loop's
+        default executor.
+
+        Downloads are not split between workers (`download_workers` is
+        ignored), and retries never wait for user input.
+
+        :param url: The URL of the livestream, video, clip or past broadcast,
+            defaults to None
+        :type url: str, optional
+        :raises ImportError: if aiohttp is not installed
+        :return: Asynchronous iterator of the chat messages, with the chat's
+            information
+        :rtype: AsyncChat
+        """
+        client = self.get_async_client()
+
+        # Handled by the asynchronous iterator
+        max_messages = kwargs.pop('max_messages', None)
+        timeout = kwargs.pop('timeout', None)
+        inactivity_timeout = kwargs.pop('inactivity_timeout', None)
+
+        kwargs.update(download_workers=1, interruptible_retry=False)
+
+        chat = await asyncio.get_event_loop().run_in_executor(
+            None, functools.partial(self.get_chat, url, **kwargs))
+
+        return AsyncChat(chat, client, max_messages=max_messages,
+                         timeout=timeout, inactivity_timeout=inactivity_timeout)
+
+    def get_async_client(self, connection_limit=DEFAULT_CONNECTION_LIMIT):
+        """Get the asynchronous HTTP client (shared by all asynchronous
+        downloads). Must be called from a coroutine.
+
+        :param connection_limit: Maximum number of connections to keep open,
+            when creating the client, defaults to DEFAULT_CONNECTION_LIMIT
+        :type connection_limit: int, optional
+        :return: The client
+        :rtype: aiohttp.ClientSession
+        """
+        if self.async_client is None or self.async_client.closed:
+            self.async_client = create_async_client(connection_limit)
+        return self.async_client
+
+    async def close_async(self):
+        """Close all sessions associated with the object, including the
+        asynchronous HTTP client"""
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+
+        self.close()
+
     def create_session(self, chat_downloader_class, overwrite=False):
         if not issubclass(chat_downloader_class, BaseChatDownloader):
             raise TypeError(
@@ -306,6 +472,29 @@ class ChatDownloader():
 
         return self.sessions[session_name]
 
+    def get_response_cache(self, directory, max_size=1024):
+        """Get the response cache stored in a directory (shared by all sessions)
+
+        :param directory: Path of the cache directory. If None, no cache is used
+        :type directory: str
+        :param max_size: Maximum size of the cache (in MiB), defaults to 1024
+        :type max_size: float, optional
+        :return: The response cache, or None
+        :rtype: Union[ResponseCache, None]
+        """
+        if not directory:
+            return None
+
+        max_size = int(max_size * 1024 * 1024)
+        response_cache = self.response_caches.get(directory)
+        if response_cache is None:
+            response_cache = self.response_caches[directory] = ResponseCache(
+                directory, max_size)
+        else:
+            response_cache.max_size = max_size
+
+        return response_cache
+
     def get_session(self, chat_downloader_class):
         return self.sessions.get(chat_downloader_class.__name__)
 
@@ -314,6 +503,9 @@ class ChatDownloader():
         for session in self.sessions.values():
             session.close()
 
+        for directory, response_cache in self.response_caches.items():
+            log('debug', f'Response cache ({directory}): {response_cache.get_stats()}')
+
         self.sessions = {}
 
 
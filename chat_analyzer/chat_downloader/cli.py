@@ -102,6 +102,12 @@ def main(cli_args=None):
     add_chat_param(retry_group, '--interruptible_retry',
                    type=str2bool, nargs='?', const=True)
 
+    download_group = parser.add_argument_group('Download Arguments')
+    add_chat_param(download_group, '--download_workers', type=int)
+    add_chat_param(download_group, '--max_requests_per_second', type=float)
+    add_chat_param(download_group, '--response_cache')
+    add_chat_param(download_group, '--max_response_cache_size', type=float)
+
     termination_group = parser.add_argument_group('Termination Arguments')
     add_chat_param(termination_group, '--max_messages', type=int)
     add_chat_param(
@@ -141,6 +147,8 @@ def main(cli_args=None):
     add_chat_param(output_group, '--output', '-o')
     add_chat_param(output_group, '--overwrite',
                    type=str2bool, nargs='?', const=True)
+    add_chat_param(output_group, '--resume', action='store_true')
+    add_chat_param(output_group, '--fields', type=splitter)
     add_chat_param(output_group, '--sort_keys',
                    type=str2bool, nargs='?', const=True)
     add_chat_param(output_group, '--indent', type=lambda x: int_or_none(x, x))
@@ -102,6 +102,11 @@ class CookieError(ChatDownloaderError):
     pass
 
 
+class OutputError(ChatDownloaderError):
+    """Raised when the existing data of an output file can not be read"""
+    pass
+
+
 class FormatError(ChatDownloaderError):
     """Raised when a formatting error occurs"""
     pass
@@ -22,6 +22,10 @@ class ItemFormatter:
     """Class used to control the formatting of chat items."""
 
     _INDEX_REGEX = r'(?<!\\){(.+?)(?<!\\)}'
+    _COMPILED_INDEX_REGEX = re.compile(_INDEX_REGEX)
+
+    # Maximum number of compiled formats to keep
+    _MAX_COMPILED_FORMATS = 256
 
     # 'always_show': True (default False)
 
@@ -45,67 +49,8 @@ class ItemFormatter:
             with open(path) as custom_formats:
                 self.format_file.update(json.load(custom_formats))
 
-    def _replace(self, match, item, format_object):
-        """Replace a match object with
-
-        :param match: The match object
-        :type match: re.Match
-        :param item: The chat item to choose the value to replace the key with
-        :type item: dict
-        :param format_object: The format object which defines how the
-            replacement should be done
-        :type format_object: dict
-        :return: The replacement value as a string
-        :rtype: str
-        """
-
-        split = match.group(1).split('|')
-
-        for index in split:
-            value = multi_get(item, *index.split('.'))
-
-            if value is None:
-                continue
-
-            formatting_info = format_object.get(index)
-            if formatting_info is None:
-                return str(value)
-
-            template = ''
-            if isinstance(formatting_info, str):
-                template = formatting_info
-            elif isinstance(formatting_info, dict):
-                template = formatting_info.get('template') or ''
-                formatting = formatting_info.get('format')
-                if formatting:
-                    if index == 'timestamp':
-                        value = microseconds_to_timestamp(
-                            value, formatting)
-                    elif index == 'time_text':
-                        collapse_leading_zeroes = formatting_info.get(
-                            'collapse_leading_zeroes')
-                        value = seconds_to_time(time_to_seconds(
-                            value), formatting, collapse_leading_zeroes)
-                    else:
-                        pass   # TODO add others
-
-                # Apply separator
-                separator = formatting_info.get('separator')
-                if separator:
-                    if index == 'author.badges':
-                        value = separator.join(
-                            map(lambda key: key.get('title'), value))
-                    elif isinstance(value, (tuple, list)):
-                        value = separator.join(
-                            map(lambda x: str(x), value))
-                    else:
-                        pass
-            else:
-                pass
-
-            return template.format(value)
-
-        return ''  # no match, return empty
+        # Compiled formats, by the id of their format object
+        self._compiled_formats = {}
 
     def format(self, item, format_name='default', format_object=None):
         """Format a chat item according to a format (specified by its name),
@@ -155,6 +100,29 @@ class ItemFormatter:
         if not format_object:
             return  # raise no format given
 
+        return self.compile(format_object)(item)
+
+    def compile(self, format_object):
+        """Compile a format object into a function which formats chat items.
+        The template is only parsed once (into literal text and the keys to
+        replace), so formatting an item only gets the values of its keys and
+        joins them with the literal text. Compiled formats are cached, by
+        format object (which must not be modified once compiled).
+
+        :param format_object: The format object (a single format, not a list
+            of formats)
+        :type format_object: dict
+        :return: Function which takes a chat item and returns its string
+            representation
+        :rtype: function
+        """
+        # (The format object is kept, so its id cannot be reused)
+        compiled = self._compiled_formats.get(id(format_object))
+        if compiled is not None and compiled[0] is format_object:
+            return compiled[1]
+
+        original_format_object = format_object
+
         inherit = format_object.get('inherit')
         if inherit:
             parent = self.format_file.get(inherit) or {}
@@ -163,7 +131,111 @@ class ItemFormatter:
         template = format_object.get('template') or ''
         keys = format_object.get('keys') or {}
 
-        substitution = re.sub(self._INDEX_REGEX, lambda match: self._replace(
-            match, item, keys), template)
+        # Literal text (escaped for str.format) and a positional field for each key to replace
+        format_string = ''
+        fields = []
+        end = 0
+        for match in self._COMPILED_INDEX_REGEX.finditer(template):
+            format_string += template[end:match.start()].replace(
+                '{', '{{').replace('}', '}}') + '{}'
+            fields.append(self._compile_field(match.group(1), keys))
+            end = match.end()
+        format_string += template[end:].replace('{', '{{').replace('}', '}}')
+
+        def format_item(item):
+            return format_string.format(*[field(item) for field in fields])
+
+        if len(self._compiled_formats) >= self._MAX_COMPILED_FORMATS:
+            self._compiled_formats.clear()
+        self._compiled_formats[id(original_format_object)] = (
+            original_format_object, format_item)
+
+        return format_item
+
+    @staticmethod
+    def _compile_field(field, format_object):
+        """Compile a key to replace (i.e. the text between braces in a
+        template) into a function which gets its replacement value from a chat
+        item.
+
+        :param field: The key(s) to replace, separated by '|' (the first key
+            which the item has a value for is used)
+        :type field: str
+        :param format_object: The format object which defines how the
+            replacement should be done
+        :type format_object: dict
+        :return: Function which takes a chat item and returns the replacement
+            value as a string
+        :rtype: function
+        """
+        alternatives = []
+        for index in field.split('|'):
+            path = index.split('.')
+            if len(path) == 1:
+                def get_value(item, key=path[0]):
+                    return item.get(key)
+            else:
+                def get_value(item, path=path):
+                    return multi_get(item, *path)
+
+            alternatives.append(
+                (get_value, ItemFormatter._compile_value_format(index, format_object.get(index))))
+
+        def replace(item):
+            for get_value, format_value in alternatives:
+                value = get_value(item)
+                if value is not None:
+                    return format_value(value)
+            return ''  # no match, return empty
+
+        return replace
+
+    @staticmethod
+    def _compile_value_format(index, formatting_info):
+        """Get the function which formats the value of a key, according to its
+        formatting information (a template, or a dictionary with a template,
+        a format and/or a separator)"""
+        if formatting_info is None:
+            return str
+
+        if isinstance(formatting_info, str):
+            return formatting_info.format
+
+        if not isinstance(formatting_info, dict):
+            return lambda value: ''
+
+        template = formatting_info.get('template') or ''
+        transforms = []
+
+        formatting = formatting_info.get('format')
+        if formatting:
+            if index == 'timestamp':
+                transforms.append(
+                    lambda value: microseconds_to_timestamp(value, formatting))
+            elif index == 'time_text':
+                collapse_leading_zeroes = formatting_info.get(
+                    'collapse_leading_zeroes')
+                transforms.append(lambda value: seconds_to_time(time_to_seconds(
+                    value), formatting, collapse_leading_zeroes))
+            else:
+                pass   # TODO add others
+
+        # Apply separator
+        separator = formatting_info.get('separator')
+        if separator:
+            if index == 'author.badges':
+                transforms.append(lambda value: separator.join(
+                    map(lambda key: key.get('title'), value)))
+            else:
+                transforms.append(lambda value: separator.join(
+                    map(lambda x: str(x), value)) if isinstance(value, (tuple, list)) else value)
+
+        if not transforms:
+            return template.format
+
+        def format_value(value):
+            for transform in transforms:
+                value = transform(value)
+            return template.format(value)
 
-        return substitution
+        return format_value
@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import threading
+
+from ..debugging import log
+
+
+# Minimum number of seconds between two saves of a checkpoint
+DEFAULT_SAVE_INTERVAL = 5
+
+
+def get_checkpoint_file_name(output_file_name):
+    """Get the name of the checkpoint file of an output file
+
+    :param output_file_name: The name of the output file
+    :type output_file_name: str
+    :return: The name of the checkpoint file
+    :rtype: str
+    """
+    return output_file_name + '.checkpoint'
+
+
+class DownloadCheckpoint:
+    """
+    Keeps track of how far the download of a (past) chat has got, so that an
+    interrupted download can be resumed from where it stopped.
+
+    Site downloaders record the request that returned each page of messages
+    (e.g. a Twitch cursor, a YouTube continuation or a Reddit chunk index),
+    along with the time of the page's first message. The chat records every
+    message it writes to the output file. The checkpoint saved to disk is the
+    latest page that started before the last written message, so resuming
+    from it re-downloads (at most) one page of already written messages, which
+    are then skipped (see `skip_written_messages`).
+
+    Messages must be downloaded in chronological order. Pages may be recorded
+    ahead of the messages being written (e.g. by parallel downloads).
+    """
+
+    def __init__(self, file_name, url, save_interval=DEFAULT_SAVE_INTERVAL, previous=None):
+        """
+        :param file_name: The name of the checkpoint file
+        :type file_name: str
+        :param url: The URL of the chat being downloaded
+        :type url: str
+        :param save_interval: Minimum number of seconds between saves,
+            defaults to DEFAULT_SAVE_INTERVAL
+        :type save_interval: float, optional
+        :param previous: The checkpoint being resumed from, defaults to None
+        :type previous: dict, optional
+        """
+        self.file_name = file_name
+        self.url = url
+        self.save_interval = save_interval
+
+        self._lock = threading.Lock()
+        self._pages = []  # [time of the first message, state]
+
+        # Last written message(s)
+        self.time_in_seconds = None
+        self.message_ids = []
+        self.message_count = 0
+        self.state = None
+
+        if previous:  # still valid until new pages are recorded
+            self.time_in_seconds = previous.get('time_in_seconds')
+            self.message_ids = previous.get('message_ids') or []
+            self.message_count = previous.get('message_count') or 0
+            self.state = previous.get('state')
+
+        self._last_save = time.monotonic()
+
+        # Called before saving, so the checkpoint is never ahead of the output file
+        self.flush_output = None
+
+    def record_page(self, time_in_seconds, state):
+        """Record the request that returned a page of messages (called by the
+        site downloaders, from any thread).
+
+        :param time_in_seconds: Time of the first message of the page
+        :type time_in_seconds: float
+        :param state: The site-specific information needed to make the request
+            again (must be JSON serializable)
+        :type state: dict
+        """
+        if time_in_seconds is None:
+            return
+        with self._lock:
+            self._pages.append((time_in_seconds, state))
+
+    def update(self, item):
+        """Record a message written to the output file (and save the
+        checkpoint, if it has not been saved recently).
+
+        :param item: The chat message
+        :type item: dict
+        """
+        time_in_seconds = item.get('time_in_seconds')
+        self.message_count += 1
+        if time_in_seconds is None:
+            return
+
+        message_id = item.get('message_id')
+        if time_in_seconds == self.time_in_seconds:
+            self.message_ids.append(message_id)
+        else:
+            self.time_in_seconds = time_in_seconds
+            self.message_ids = [message_id]
+
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def _update_state(self):
+        with self._lock:
+            if self.time_in_seconds is None:
+                return
+
+            # Pages which started strictly before the last written message
+            # contain no message that is not written yet, except (maybe) the
+            # last one of them
+            earlier_pages = [page for page in self._pages
+                             if page[0] < self.time_in_seconds]
+            if not earlier_pages:
+                return
+
+            latest_page = max(earlier_pages, key=lambda page: page[0])
+            self.state = latest_page[1]
+
+            # Earlier pages will never be needed again
+            self._pages = [page for page in self._pages
+                           if page[0] >= latest_page[0]]
+
+    def save(self):
+        """Save the checkpoint to its file (atomically)"""
+        self._update_state()
+        self._last_save = time.monotonic()
+
+        if self.flush_output is not None:
+            try:
+                self.flush_output()
+            except (OSError, ValueError) as e:  # e.g. closed file
+                log('warning', f'Unable to flush output: {e}')
+
+        checkpoint = {
+            'url': self.url,
+            'state': self.state,
+            'time_in_seconds': self.time_in_seconds,
+            'message_ids': self.message_ids,
+            'message_count': self.message_count
+        }
+
+        temporary_file_name = self.file_name + '.tmp'
+        try:
+            with open(temporary_file_name, 'w') as f:
+                json.dump(checkpoint, f)
+            os.replace(temporary_file_name, self.file_name)
+        except OSError as e:
+            log('warning', f'Unable to save checkpoint: {e}')
+
+    def remove(self):
+        """Remove the checkpoint file (once the download is complete)"""
+        try:
+            os.remove(self.file_name)
+        except OSError:
+            pass
+
+    @staticmethod
+    def load(file_name):
+        """Load a saved checkpoint
+
+        :param file_name: The name of the checkpoint file
+        :type file_name: str
+        :return: The checkpoint, or None if there is no (valid) checkpoint
+        :rtype: Union[dict, None]
+        """
+        try:
+            with open(file_name) as f:
+                return json.load(f)
+        except (OSError, json.decoder.JSONDecodeError):
+            return None
+
+
+def get_written_message_filter(checkpoint):
+    """Get a function which tells whether a message (re-downloaded after
+    resuming) was already written before the checkpoint was saved. Messages
+    must be passed to it in order.
+
+    :param checkpoint: The checkpoint being resumed from
+    :type checkpoint: dict
+    :return: The filter
+    :rtype: Callable[[dict], bool]
+    """
+    last_time = checkpoint.get('time_in_seconds')
+    written_ids = set(checkpoint.get('message_ids') or [])
+
+    def is_written(item):
+        nonlocal last_time
+        if last_time is None:
+            return False
+
+        time_in_seconds = item.get('time_in_seconds')
+        if time_in_seconds is None:
+            return False
+
+        message_id = item.get('message_id')
+        if time_in_seconds < last_time or (
+                time_in_seconds == last_time and message_id is not None and message_id in written_ids):
+            return True
+        elif time_in_seconds > last_time:
+            last_time = None  # past the overlap
+        return False
+
+    return is_written
+
+
+def skip_written_messages(messages, checkpoint):
+    """Skip the messages (re-downloaded after resuming) that were already
+    written before the checkpoint was saved.
+
+    :param messages: The chat messages
+    :type messages: Iterable[dict]
+    :param checkpoint: The checkpoint being resumed from
+    :type checkpoint: dict
+    """
+    is_written = get_written_message_filter(checkpoint)
+    return (item for item in messages if not is_written(item))
+
+
+def _read_json_array_messages(text):
+    """Parse the messages of a JSON array, up to the first one that can not be
+    parsed. Returns the messages and whether the whole array was parsed."""
+    decoder = json.JSONDecoder()
+    messages = []
+    pos = 0
+
+    def skip(characters):
+        nonlocal pos
+        while pos < len(text) and (text[pos].isspace() or text[pos] in characters):
+            pos += 1
+
+    skip('')
+    if pos == len(text):  # empty file
+        return messages, True
+    if text[pos] != '[':
+        return messages, False
+    pos += 1
+
+    while True:
+        skip(',')
+        if pos == len(text):  # array was never closed
+            return messages, False
+        if text[pos] == ']':
+            pos += 1
+            skip('')
+            return messages, pos == len(text)
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except json.decoder.JSONDecodeError:
+            return messages, False
+        messages.append(item)
+
+
+def _read_json_lines_messages(text):
+    """Parse the messages of JSON lines, up to the first one that can not be
+    parsed. Returns the messages and whether every line was parsed."""
+    messages = []
+    lines = text.split('\n')
+    for index, line in enumerate(lines):
+        if not line.strip():
+            continue
+        if index == len(lines) - 1:  # the last message is always followed by a new line
+            return messages, False
+        try:
+            messages.append(json.loads(line))
+        except json.decoder.JSONDecodeError:
+            return messages, False
+    return messages, True
+
+
+_OUTPUT_MESSAGE_READERS = {
+    'json': _read_json_array_messages,
+    'jsonl': _read_json_lines_messages
+}
+
+
+def check_written_messages(output_file_name, checkpoint):
+    """Check the output file of an interrupted download before resuming it.
+
+    The output file (not the checkpoint) is the record of which messages were
+    written, as the download may have been stopped after the checkpoint was
+    last saved, or in the middle of writing a message. If the file is damaged,
+    the messages which can be parsed are kept (the damaged file is moved to
+    '<output>.damaged'). The checkpoint is then reset to the last message of
+    the file, going back to the start of the chat if its page is no longer
+    known. Only JSON and JSON lines output files are checked.
+
+    :param output_file_name: The name of the output file
+    :type output_file_name: str
+    :param checkpoint: The checkpoint being resumed from
+    :type checkpoint: dict
+    :return: The checkpoint to resume from, or None if the download must
+        start again from the beginning
+    :rtype: Union[dict, None]
+    """
+    extension = os.path.splitext(output_file_name)[1][1:].lower()
+    read_messages = _OUTPUT_MESSAGE_READERS.get(extension)
+    if read_messages is None:
+        return checkpoint
+
+    try:
+        with open(output_file_name, encoding='utf-8') as f:
+            messages, complete = read_messages(f.read())
+    except FileNotFoundError:
+        log('warning', f'Output file ({output_file_name}) not found, downloading from the start.')
+        return None
+
+    if not complete:
+        damaged_file_name = output_file_name + '.damaged'
+        log('warning', f'Output file ({output_file_name}) is damaged, keeping the first {len(messages)} messages (the damaged file is moved to {damaged_file_name}).')
+
+        temporary_file_name = output_file_name + '.tmp'
+        with open(temporary_file_name, 'w', encoding='utf-8') as f:
+            if extension == 'json':
+                json.dump(messages, f)
+            else:
+                for message in messages:
+                    print(json.dumps(message), file=f)
+        os.replace(output_file_name, damaged_file_name)
+        os.replace(temporary_file_name, output_file_name)
+
+    written_times = [message.get('time_in_seconds') for message in messages
+                     if isinstance(message, dict) and message.get('time_in_seconds') is not None]
+    if not written_times:
+        log('info', f'No messages with a time in {output_file_name}, downloading from the start.')
+        return None
+
+    last_time = written_times[-1]
+    recovered = dict(checkpoint)
+    recovered['time_in_seconds'] = last_time
+    recovered['message_ids'] = [message.get('message_id') for message in messages
+                                if isinstance(message, dict) and message.get('time_in_seconds') == last_time]
+    recovered['message_count'] = len(messages)
+
+    # The saved page started before the checkpoint's last message,
+    # so it only still covers later messages
+    previous_time = checkpoint.get('time_in_seconds')
+    if previous_time is None or last_time < previous_time:
+        recovered['state'] = None
+
+    return recovered
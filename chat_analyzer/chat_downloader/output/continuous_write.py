@@ -4,6 +4,7 @@ import csv
 import shutil
 
 from ..utils.core import flatten_json
+from ..errors import OutputError
 
 
 class CW:
@@ -60,11 +61,15 @@ class JSONCW(CW):
 
         previous_items = []  # save previous
         if not self.overwrite:  # may have other data
-            try:
-                previous_items = json.load(self.file)
-            except json.decoder.JSONDecodeError:
-                # TODO create .tmp, file shutil.copy(), self.file.read()
-                pass
+            previous_data = self.file.read()
+            if previous_data.strip():
+                try:
+                    previous_items = json.loads(previous_data)
+                except json.decoder.JSONDecodeError as e:
+                    # Never empty a file which may hold previously written data
+                    self.file.close()
+                    raise OutputError(
+                        f'Unable to append to "{self.file_name}", existing data is not valid JSON: {e}')
 
         self.file.truncate(0)  # empty file
 
@@ -259,6 +264,10 @@ class ContinuousWriter:
 
         self.writer.write(item, flush)
 
+    def flush(self):
+        if self._initialised:
+            self.writer.flush()
+
     def __enter__(self):
         return self
 
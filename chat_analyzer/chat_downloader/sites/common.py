@@ -26,8 +26,24 @@ from ..utils.timed_utils import (
     timed_input,
     interruptible_sleep
 )
+from ..utils.rate_limiting import (
+    get_host_bucket,
+    get_all_host_stats,
+    parse_retry_after
+)
+from ..utils.async_http import async_request
+from ..output.checkpoint import get_written_message_filter
 from ..debugging import log
 
+from requests.exceptions import RequestException
+
+import math
+import asyncio
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 
 class Image():
     def __init__(self, url, width=None, height=None, image_id=None):
@@ -178,6 +194,166 @@ class Remapper():
             )
         return info
 
+    # Kinds of compiled remapping steps
+    _COPY = 0
+    _CALL = 1
+    _UNPACK = 2
+
+    @staticmethod
+    def compile(remapping_dict, keep_unknown_keys=False, replace_char_with_underscores=None):
+        """Compile a dictionary of remappings into a function which remaps all
+        the items of an input dictionary. This is equivalent to calling `remap`
+        for every item, but the type of each remapping is only resolved once,
+        so it should be used for remappings applied to every message.
+
+        :param remapping_dict: Dictionary of remappings
+        :type remapping_dict: dict
+        :param keep_unknown_keys: If no remapping is found, keep the data
+            with its original key and value. Defaults to False
+        :type keep_unknown_keys: bool, optional
+        :param replace_char_with_underscores: If no remapping is found,
+            replace a character in the key with underscores. Defaults to None
+        :type replace_char_with_underscores: str, optional
+        :raises ValueError: if an unknown remapping is specified
+        :return: Function which takes the output dictionary and the input
+            dictionary, and returns the output dictionary
+        :rtype: function
+        """
+        copy, call, unpack = Remapper._COPY, Remapper._CALL, Remapper._UNPACK
+
+        steps = {}  # input key -> (kind, new key, remap function)
+        for key, remap in remapping_dict.items():
+            if not remap:
+                continue
+            elif isinstance(remap, str):
+                steps[key] = (copy, remap, None)
+            elif isinstance(remap, Remapper):
+                if remap.to_unpack:
+                    steps[key] = (unpack, None, remap.remap_function)
+                elif remap.remap_function:
+                    steps[key] = (call, remap.new_key, remap.remap_function)
+                else:
+                    steps[key] = (copy, remap.new_key, None)
+            else:
+                raise ValueError('Unknown remapping specified.')
+
+        get_step = steps.get
+
+        def remap_all(info, input_dictionary):
+            for key, value in input_dictionary.items():
+                step = get_step(key)
+                if step is None:
+                    if keep_unknown_keys:
+                        if replace_char_with_underscores:
+                            key = key.replace(replace_char_with_underscores, '_')
+                        info[key] = value
+                    continue
+
+                kind, new_key, remap_function = step
+                if kind is copy:
+                    info[new_key] = value
+                elif kind is call:
+                    info[new_key] = remap_function(value)
+                else:
+                    new_value = remap_function(value)
+                    if not isinstance(new_value, dict):
+                        raise ValueError(
+                            'Unable to unpack item which is not a dictionary.')
+                    info.update(new_value)
+            return info
+
+        return remap_all
+
+
+class MessageProjection():
+    """The subset of the fields of chat messages to build (see the `fields`
+    parameter of `ChatDownloader.get_chat`).
+
+    Site downloaders use it to only remap (and parse) the fields of messages
+    which are requested, e.g. skipping author images, badges, emotes and
+    colours when only the time, type and author of messages are needed.
+    Fields are given as output keys, where nested keys are separated by dots
+    (e.g. 'author.id'). Requesting a field (e.g. 'author') keeps all of its
+    nested fields.
+    """
+
+    # Fields which are always built (needed to filter, time and checkpoint messages)
+    _REQUIRED_FIELDS = ('message_id', 'message_type', 'action_type',
+                        'time_in_seconds', 'time_text')
+
+    def __init__(self, fields):
+        """Create a MessageProjection object
+
+        :param fields: The fields of chat messages to build
+        :type fields: list
+        """
+        fields = list(fields) + list(self._REQUIRED_FIELDS)
+
+        # Keys are compared as they are before nested dictionaries
+        # are created, i.e. 'author.id' is 'author_id'
+        self.fields = frozenset(field.replace('.', '_') for field in fields)
+
+        # Keys of the dictionaries which contain requested fields (e.g. 'author')
+        self.parents = frozenset('_'.join(field.split('.')[:i]) for field in fields
+                                 for i in range(1, field.count('.') + 1))
+
+        # Projected (and compiled) remappings of the site downloaders, by name
+        self.remappings = {}
+
+        self._contains = {}
+
+    def __contains__(self, key):
+        """Whether a (flattened) output key must be built: it is a requested
+        field, a nested field of a requested field, or contains a requested
+        (nested) field."""
+        contained = self._contains.get(key)
+        if contained is None:
+            contained = key in self.fields or key in self.parents or any(
+                key.startswith(field + '_') for field in self.fields)
+            self._contains[key] = contained
+        return contained
+
+    def project_remapping(self, remapping_dict, prefix='', unpacked_keys=None, nested=None):
+        """Get the subset of a remapping dictionary whose output keys must be built
+
+        :param remapping_dict: Dictionary of remappings
+        :type remapping_dict: dict
+        :param prefix: Prefix of the output keys (e.g. 'author_' for the
+            remapping of a nested 'author' dictionary), defaults to ''
+        :type prefix: str, optional
+        :param unpacked_keys: The output keys of the remap functions of unpacked
+            items, by function. Unpacked items whose function is not listed
+            are always kept. Defaults to None
+        :type unpacked_keys: dict, optional
+        :param nested: Remapping dictionaries of nested dictionaries, by input
+            key. These are projected too (rather than being remapped by the
+            original remap function). Defaults to None
+        :type nested: dict, optional
+        :return: The projected remapping dictionary
+        :rtype: dict
+        """
+        projected = {}
+        for key, remap in remapping_dict.items():
+            if isinstance(remap, str):
+                if prefix + remap in self:
+                    projected[key] = remap
+
+            elif remap.to_unpack:
+                output_keys = (unpacked_keys or {}).get(remap.remap_function)
+                if output_keys is None or any(prefix + output_key in self for output_key in output_keys):
+                    projected[key] = remap
+
+            elif prefix + remap.new_key in self:
+                if nested and key in nested:
+                    nested_remapping = self.project_remapping(
+                        nested[key], prefix + remap.new_key + '_', unpacked_keys)
+                    projected[key] = Remapper(remap.new_key, lambda x, remap_all=Remapper.compile(nested_remapping): remap_all(
+                        {}, x or {}))
+                else:
+                    projected[key] = remap
+
+        return projected
+
 
 class SiteDefault:
     """Allows for sites to specify default parameters. Additionally, different
@@ -193,6 +369,43 @@ class SiteDefault:
         self.name = name
 
 
+class HTTPRequest():
+    """A request, yielded by a site's download steps (see
+    `BaseChatDownloader._run_steps`). The response is sent back to the steps.
+    """
+
+    def __init__(self, method, url, **kwargs):
+        """Create an HTTPRequest object
+
+        :param method: HTTP method of the request
+        :type method: str
+        :param url: URL of the request
+        :type url: str
+        """
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+
+class Sleep():
+    """A pause, yielded by a site's download steps (see
+    `BaseChatDownloader._run_steps`).
+    """
+
+    def __init__(self, seconds, interruptible=False):
+        """Create a Sleep object
+
+        :param seconds: Number of seconds to sleep for. If None, wait for user
+            input instead
+        :type seconds: float
+        :param interruptible: Whether the user may end the sleep early (by
+            pressing Enter), defaults to False
+        :type interruptible: bool, optional
+        """
+        self.seconds = seconds
+        self.interruptible = interruptible
+
+
 class Chat():
     """Class used to manage all chat data for a single stream or video.
 
@@ -201,7 +414,7 @@ class Chat():
     next value is yielded from the object's `chat` generator method.
     """
 
-    def __init__(self, chat=None, title=None, duration=None, status=None, video_type=None, start_time=None, id=None, **kwargs):
+    def __init__(self, chat=None, title=None, duration=None, status=None, video_type=None, start_time=None, id=None, steps=None, **kwargs):
         """Create a Chat object
 
         :param chat: Generator method for retrieving chat messages, defaults to None
@@ -219,6 +432,10 @@ class Chat():
         :param start_time: Start time of the stream (or upload date of video)
             in UNIX microseconds, defaults to None
         :type start_time: float, optional
+        :param steps: The download steps that `chat` runs (see
+            `BaseChatDownloader._run_steps`), which can also be run
+            asynchronously, defaults to None
+        :type steps: generator, optional
         """
 
         self.chat = chat
@@ -238,6 +455,11 @@ class Chat():
         self._output_writer = None
         self._output_callback = None
 
+        self.checkpoint = None
+        self.resumed_from = None  # set if the download resumes from a checkpoint
+
+        self.steps = steps
+
     def __iter__(self):
         """Allows the object to be iterable
 
@@ -273,6 +495,35 @@ class Chat():
         # writer is a ContinuousWriter
         self._output_writer = writer
 
+    def attach_checkpoint(self, checkpoint):
+        # checkpoint is a DownloadCheckpoint, which is updated with every
+        # message written to the output file
+        self.checkpoint = checkpoint
+        if self._output_writer is not None:
+            checkpoint.flush_output = self._output_writer.flush
+
+    def _on_item(self, item):
+        if self._output_writer is not None:  # writer has been attached
+            self._init_writer()
+
+        if self._output_callback is not None:  # output callback
+            self._output_callback(item)
+
+            if self.checkpoint is not None:
+                self.checkpoint.update(item)
+
+    def _on_complete(self):
+        # Safely close output file when done
+        if self._output_writer is not None:
+            self._output_writer.close()
+        if self.checkpoint is not None:  # download complete
+            self.checkpoint.remove()
+
+    def _on_error(self):
+        # Save how far the download got, so it can be resumed
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+
     def __next__(self):
         """Get the next chat message from the generator
 
@@ -281,18 +532,13 @@ class Chat():
         """
         try:
             item = next(self.chat)
-
-            if self._output_writer is not None:  # writer has been attached
-                self._init_writer()
-
-            if self._output_callback is not None:  # output callback
-                self._output_callback(item)
-
+            self._on_item(item)
             return item
         except StopIteration as e:
-            # Safely close output file when done
-            if self._output_writer is not None:
-                self._output_writer.close()
+            self._on_complete()
+            raise e
+        except BaseException as e:
+            self._on_error()
             raise e
 
     def print_formatted(self, item, flush=True):
@@ -313,6 +559,146 @@ class Chat():
         raise NotImplementedError
 
 
+class AsyncChat():
+    """Asynchronous iterator of the messages of a chat, returned by
+    `ChatDownloader.get_chat_async`.
+
+    If the chat's site downloads it in steps (see
+    `BaseChatDownloader._run_steps`), the chat is downloaded on the event loop,
+    with an asynchronous HTTP client. Otherwise (e.g. Twitch livestreams, which
+    are read from a socket), the chat is downloaded in a thread of its own.
+    Messages are written to the chat's output file (if any), as with `Chat`.
+    """
+
+    def __init__(self, chat, client, max_messages=None, timeout=None, inactivity_timeout=None):
+        """Create an AsyncChat object
+
+        :param chat: The chat, as returned by `ChatDownloader.get_chat`
+        :type chat: Chat
+        :param client: The asynchronous HTTP client to make requests with
+        :type client: aiohttp.ClientSession
+        :param max_messages: Maximum number of messages to retrieve, defaults
+            to None (unlimited)
+        :type max_messages: int, optional
+        :param timeout: Stop retrieving chat after a certain duration (in
+            seconds), defaults to None
+        :type timeout: float, optional
+        :param inactivity_timeout: Stop getting messages after not receiving
+            anything for a certain duration (in seconds), defaults to None
+        :type inactivity_timeout: float, optional
+        """
+        self.chat = chat
+
+        self.title = chat.title
+        self.duration = chat.duration
+        self.status = chat.status
+        self.video_type = chat.video_type
+        self.start_time = chat.start_time
+        self.id = chat.id
+
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.inactivity_timeout = inactivity_timeout
+
+        self._message_count = 0
+        self._download_start = None
+        self._closed = False
+
+        if chat.steps is not None:
+            self._messages = chat.site._run_steps_async(chat.steps, client)
+            self._executor = None
+
+            # (`chat.chat` skips these, but is not used)
+            self._is_written = get_written_message_filter(
+                chat.resumed_from) if chat.resumed_from else None
+        else:
+            self._messages = None
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def __aiter__(self):
+        """Allows the object to be asynchronously iterable
+
+        :return: This object
+        :rtype: AsyncChat
+        """
+        return self
+
+    async def _get_next_item(self):
+        if self._messages is None:
+            item = await asyncio.get_event_loop().run_in_executor(
+                self._executor, next, self.chat.chat, None)
+            if item is None:
+                raise StopAsyncIteration
+            return item
+
+        while True:
+            item = await self._messages.__anext__()
+            if self._is_written is None or not self._is_written(item):
+                return item
+
+    async def __anext__(self):
+        """Get the next chat message
+
+        :return: The next chat item
+        :rtype: dict
+        """
+        if self._closed:
+            raise StopAsyncIteration
+
+        loop = asyncio.get_event_loop()
+        if self._download_start is None:
+            self._download_start = loop.time()
+
+        # (wait_time is None if the download may wait indefinitely)
+        wait_time = self.inactivity_timeout
+        if self.timeout is not None:
+            remaining_time = self.timeout - \
+                (loop.time() - self._download_start)
+            wait_time = remaining_time if wait_time is None else min(
+                wait_time, remaining_time)
+
+        try:
+            if self.max_messages is not None and self._message_count >= self.max_messages:
+                raise StopAsyncIteration
+
+            if wait_time is None:
+                item = await self._get_next_item()
+            else:
+                item = await asyncio.wait_for(self._get_next_item(), max(wait_time, 0))
+
+            self.chat._on_item(item)
+
+        except (StopAsyncIteration, asyncio.TimeoutError) as e:
+            if isinstance(e, asyncio.TimeoutError):
+                log('debug', f'Timeout occurred after {loop.time() - self._download_start} seconds.')
+            await self.aclose()
+            self.chat._on_complete()
+            raise StopAsyncIteration
+
+        except BaseException as e:
+            self.chat._on_error()
+            raise e
+
+        self._message_count += 1
+        return item
+
+    async def aclose(self):
+        """Stop downloading the chat"""
+        self._closed = True
+        if self._messages is not None:
+            await self._messages.aclose()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def print_formatted(self, item, flush=True):
+        """Safely print the formatted message
+
+        :param item: The chat item to be printed
+        :type item: dict
+        """
+        self.chat.print_formatted(item, flush)
+
+
 class BaseChatDownloader:
     """Base class for chat downloaders. Each supported site should have its
     own chat downloader. Subclasses should redefine the `_VALID_URLS`
@@ -456,6 +842,9 @@ class BaseChatDownloader:
                     f'The file "{cookies}" could not be found.')
         self.session.cookies = cj
 
+        self._max_requests_per_second = None
+        self._response_cache = None
+
     def get_session_headers(self, key):
         return self.session.headers.get(key)
 
@@ -498,14 +887,178 @@ class BaseChatDownloader:
         """Close the session. Once this has been called, no more requests can be made."""
         self.session.close()
         log('debug', 'Session closed.')
+        log('debug', f'Rate limiting: {get_all_host_stats()}')
+
+    def _ensure_connection_pool_size(self, pool_size):
+        """Make sure the session can keep (at least) `pool_size` connections
+        open per host, so that concurrent requests (made by a pool of workers)
+        do not have to reopen connections.
+
+        :param pool_size: Number of connections to keep open per host
+        :type pool_size: int
+        """
+        adapter = self.session.get_adapter('https://')
+        if getattr(adapter, '_pool_maxsize', 0) >= pool_size:
+            return
+
+        for prefix in ('https://', 'http://'):
+            self.session.mount(prefix, requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size))
+
+    # Number of times a rate limited request (HTTP 429) is retried, before the
+    # response is returned as is
+    _MAX_RATE_LIMITED_RETRIES = 5
+
+    def set_rate_limit(self, requests_per_second=None):
+        """Limit the number of requests made to each host. The limit is shared
+        by every thread and session of the process.
+
+        :param requests_per_second: Maximum number of requests per second (per
+            host), defaults to None (unlimited, until the host rate limits the
+            requests)
+        :type requests_per_second: float, optional
+        """
+        self._max_requests_per_second = requests_per_second
+
+    def _get_host_bucket(self, url):
+        bucket = get_host_bucket(urlparse(url).netloc)
+
+        max_rate = self._max_requests_per_second
+        if max_rate is not None and bucket.max_rate != max_rate:
+            bucket.set_max_rate(max_rate)
+
+        return bucket
+
+    @staticmethod
+    def _is_rate_limited(response):
+        return response.status_code == 429 or (
+            response.status_code == 503 and 'Retry-After' in response.headers)
+
+    # Regular expressions matching the URLs whose responses never change
+    # (e.g. pages of a chat replay), which may be stored in the response cache
+    _CACHEABLE_URLS = ()
+
+    # If set, only these fields of a JSON request body are part of the cache
+    # key (the others, e.g. client information, do not affect the response)
+    _CACHE_KEY_JSON_FIELDS = None
+
+    def set_response_cache(self, response_cache=None):
+        """Store the responses of cacheable requests in a response cache, and
+        reuse them instead of making the same requests again.
+
+        :param response_cache: The cache, defaults to None (no caching)
+        :type response_cache: ResponseCache, optional
+        """
+        self._response_cache = response_cache
+
+    def _get_cache_key(self, method, url, **kwargs):
+        if self._response_cache is None or not any(
+                re.match(regex, url) for regex in self._CACHEABLE_URLS):
+            return None
+
+        body = kwargs.get('json')
+        if isinstance(body, dict) and self._CACHE_KEY_JSON_FIELDS is not None:
+            body = {key: body.get(key) for key in self._CACHE_KEY_JSON_FIELDS}
+        elif body is None:
+            body = kwargs.get('data')
+
+        return self._response_cache.get_key(method, url, body)
+
+    def _get_cached_response(self, cache_key, url):
+        if cache_key is None:
+            return None
+
+        content = self._response_cache.get(cache_key)
+        if content is None:
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = content
+        return response
+
+    def _cache_response(self, cache_key, response):
+        # Only store successful (JSON) responses
+        if cache_key is not None and response.status_code == 200 and response.content.lstrip()[:1] in (b'{', b'['):
+            self._response_cache.put(cache_key, response.content)
+
+    def _session_request(self, method, url, **kwargs):
+        """Make a request using the current session, respecting (and adapting
+        to) the host's rate limit. Rate limited requests are retried after
+        the delay the host asks for.
+
+        Cacheable requests are answered from the response cache (if set),
+        without making the request."""
+        cache_key = self._get_cache_key(method, url, **kwargs)
+        response = self._get_cached_response(cache_key, url)
+        if response is not None:
+            return response
+
+        bucket = self._get_host_bucket(url)
+
+        for attempt_number in range(self._MAX_RATE_LIMITED_RETRIES + 1):
+            if attempt_number > 0:
+                bucket.on_retry()
+
+            bucket.acquire()
+            response = self.session.request(method, url, **kwargs)
+
+            if not self._is_rate_limited(response):
+                bucket.on_success()
+                break
+
+            bucket.on_rate_limited(parse_retry_after(
+                response.headers.get('Retry-After')))
+
+        self._cache_response(cache_key, response)
+        return response
+
+    async def _async_session_request(self, client, method, url, **kwargs):
+        """Asynchronous version of `_session_request`. The request is made with
+        an asynchronous client, but with the session's headers, cookies and
+        proxy."""
+        cache_key = self._get_cache_key(method, url, **kwargs)
+        response = self._get_cached_response(cache_key, url)
+        if response is not None:
+            return response
+
+        headers = dict(self.session.headers)
+        headers.update(kwargs.pop('headers', None) or {})
+        kwargs['headers'] = headers
+        kwargs['cookies'] = self._get_cookies_dict()
+
+        proxy = self.session.proxies.get(urlparse(url).scheme)
+        if proxy:
+            kwargs['proxy'] = proxy
+
+        bucket = self._get_host_bucket(url)
+
+        for attempt_number in range(self._MAX_RATE_LIMITED_RETRIES + 1):
+            if attempt_number > 0:
+                bucket.on_retry()
+
+            await asyncio.sleep(bucket.reserve())
+            response = await async_request(client, method, url, **kwargs)
+
+            if not self._is_rate_limited(response):
+                bucket.on_success()
+                break
+
+            bucket.on_rate_limited(parse_retry_after(
+                response.headers.get('Retry-After')))
+
+        self._cache_response(cache_key, response)
+        return response
 
     def _session_post(self, url, **kwargs):
         """Make a post request using the current session."""
-        return self.session.post(url, **kwargs)
+        return self._session_request('POST', url, **kwargs)
 
     def _session_get(self, url, **kwargs):
         """Make a get request using the current session."""
-        return self.session.get(url, **kwargs)
+        return self._session_request('GET', url, **kwargs)
 
     def _session_get_json(self, url, **kwargs):
         """Make a get request using the current session and return as JSON."""
@@ -584,10 +1137,260 @@ class BaseChatDownloader:
 
         return new_dict
 
+    # Number of time shards to split a past broadcast into, per download worker
+    _SHARDS_PER_WORKER = 1
+    # Shards shorter than this (in seconds) are not worth the extra seek request
+    _MIN_SHARD_DURATION = 300
+
+    @classmethod
+    def _get_time_shards(cls, start_time, end_time, max_duration, download_workers):
+        """Split the [start_time, end_time] range of a past broadcast into
+        consecutive (start, end) time ranges which can be downloaded
+        concurrently.
+
+        :return: The time ranges in order, or None if the range should be
+            downloaded serially
+        :rtype: Union[list, None]
+        """
+        if not download_workers or download_workers <= 1 or not max_duration:
+            return None
+
+        start_time = start_time or 0
+        range_end = max_duration if end_time is None else min(
+            end_time, max_duration)
+        range_duration = range_end - start_time
+
+        number_of_shards = min(download_workers * cls._SHARDS_PER_WORKER,
+                               math.ceil(range_duration / cls._MIN_SHARD_DURATION))
+        if number_of_shards <= 1:
+            return None
+
+        shard_duration = range_duration / number_of_shards
+        bounds = [start_time + i * shard_duration for i in range(number_of_shards)]
+        bounds.append(range_end)
+
+        return list(zip(bounds, bounds[1:]))
+
+    def _get_sharded_items(self, download_shard, shards, download_workers, id_key):
+        """Download time shards on a pool of (at most) `download_workers`
+        threads, and yield their items in shard order.
+
+        Items of a shard are yielded as soon as the shards preceding it are
+        complete. Items whose `id_key` was already seen in the previous shard
+        are skipped, so items on a shard boundary are not duplicated.
+
+        :param download_shard: Called as `download_shard(shard_start, shard_end, is_last, stop_event)`
+            and returns the list of items in the shard. It should stop once
+            `stop_event` is set (the items are no longer needed)
+        :type download_shard: callable
+        :param shards: The (start, end) time ranges, in order
+        :type shards: list
+        :param download_workers: Maximum number of concurrent downloads
+        :type download_workers: int
+        :param id_key: Key of the items' unique id
+        :type id_key: str
+        """
+        download_workers = min(download_workers, len(shards))
+        log('debug', f'Downloading {len(shards)} shards with {download_workers} workers: {shards}')
+
+        self._ensure_connection_pool_size(download_workers)
+
+        stop_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=download_workers)
+        futures = []
+        try:
+            futures += [
+                executor.submit(download_shard, shard_start, shard_end,
+                                index == len(shards) - 1, stop_event)
+                for index, (shard_start, shard_end) in enumerate(shards)
+            ]
+
+            previous_ids = set()
+            for future in futures:
+                items = future.result()
+
+                for item in items:
+                    item_id = item.get(id_key)
+                    if item_id is not None and item_id in previous_ids:
+                        continue
+                    yield item
+
+                previous_ids = {item.get(id_key) for item in items}
+
+        finally:
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _iter_concurrently(self, function, arguments, download_workers, lookahead=None):
+        """Yield `function(argument)` for every argument, in order. Calls are
+        made on a pool of `download_workers` threads, at most `lookahead`
+        arguments ahead of the result being yielded.
+
+        :param function: The function to call (e.g. to download a page)
+        :type function: callable
+        :param arguments: The arguments to call the function with
+        :type arguments: Iterable
+        :param download_workers: Maximum number of concurrent calls
+        :type download_workers: int
+        :param lookahead: Maximum number of calls made ahead of the consumer,
+            defaults to None (twice the number of workers)
+        :type lookahead: int, optional
+        """
+        if not download_workers or download_workers <= 1:
+            yield from map(function, arguments)
+            return
+
+        if lookahead is None:
+            lookahead = 2 * download_workers
+
+        self._ensure_connection_pool_size(download_workers)
+
+        executor = ThreadPoolExecutor(max_workers=download_workers)
+        pending = collections.deque()
+        try:
+            for argument in arguments:
+                pending.append(executor.submit(function, argument))
+                if len(pending) >= lookahead:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
     @staticmethod
     def retry(attempt_number, max_attempts=1, error=None, retry_timeout=None, text=None, interruptible_retry=True, **kwargs):
         """Retry to occur after an error occurs
 
+        :param attempt_number: The current attempt number
+        :type attempt_number: int
+        :param max_attempts: The maximum number of attempts allowed
+        :type max_attempts: int, optional
+        :param error: The error which was raised, defaults to None
+        :type error: Exception, optional
+        :param retry_timeout: The number of seconds to sleep after failing,
+            defaults to None (i.e. use exponential back-off)
+        :type retry_timeout: float, optional
+        :param text: Items to display on retry, defaults to None
+        :type text: object, optional
+        :raises RetriesExceeded: if the maximum number of retries has been exceeded
+        """
+        for sleep in BaseChatDownloader._retry_steps(
+                attempt_number, max_attempts, error, retry_timeout, text, interruptible_retry):
+            BaseChatDownloader._sleep(sleep)
+
+    @staticmethod
+    def _sleep(sleep):
+        if sleep.seconds is None:
+            pause()
+        elif sleep.interruptible:
+            timed_input(sleep.seconds)
+        else:
+            interruptible_sleep(sleep.seconds)
+
+    def _run_steps(self, steps):
+        """Run a site's download steps.
+
+        Download steps are generators which yield `HTTPRequest` and `Sleep`
+        objects (as well as chat items), and may return a result. The response
+        to each request is sent back to the steps (or the error it raised is
+        raised inside them), so the same steps can be run synchronously (here)
+        or asynchronously (see `_run_steps_async`).
+
+        :param steps: The download steps
+        :type steps: generator
+        :return: The chat items produced by the steps
+        :rtype: Generator[dict]
+        """
+        response = error = None
+        try:
+            while True:
+                try:
+                    if error is None:
+                        step = steps.send(response)
+                    else:
+                        step = steps.throw(error)
+                except StopIteration as e:
+                    return e.value
+
+                response = error = None
+                if isinstance(step, HTTPRequest):
+                    try:
+                        response = self._session_request(
+                            step.method, step.url, **step.kwargs)
+                    except RequestException as e:
+                        error = e
+                elif isinstance(step, Sleep):
+                    self._sleep(step)
+                else:
+                    yield step
+        finally:
+            steps.close()
+
+    def _call_steps(self, steps):
+        """Run download steps which do not produce chat items (see
+        `_run_steps`).
+
+        :param steps: The download steps
+        :type steps: generator
+        :return: The result of the steps
+        :rtype: object
+        """
+        runner = self._run_steps(steps)
+        while True:
+            try:
+                next(runner)
+            except StopIteration as e:
+                return e.value
+
+    async def _run_steps_async(self, steps, client):
+        """Run a site's download steps asynchronously (see `_run_steps`).
+
+        Requests are made with an asynchronous client. Sleeps do not block the
+        event loop, and those which would wait for user input are skipped.
+
+        :param steps: The download steps
+        :type steps: generator
+        :param client: The asynchronous HTTP client
+        :type client: aiohttp.ClientSession
+        :return: The chat items produced by the steps
+        :rtype: AsyncGenerator[dict]
+        """
+        response = error = None
+        try:
+            while True:
+                try:
+                    if error is None:
+                        step = steps.send(response)
+                    else:
+                        step = steps.throw(error)
+                except StopIteration:
+                    return
+
+                response = error = None
+                if isinstance(step, HTTPRequest):
+                    try:
+                        response = await self._async_session_request(
+                            client, step.method, step.url, **step.kwargs)
+                    except RequestException as e:
+                        error = e
+                elif isinstance(step, Sleep):
+                    if step.seconds:
+                        await asyncio.sleep(step.seconds)
+                else:
+                    yield step
+        finally:
+            steps.close()
+
+    @staticmethod
+    def _retry_steps(attempt_number, max_attempts=1, error=None, retry_timeout=None, text=None, interruptible_retry=True, **kwargs):
+        """Download steps of `retry` (for use in a site's download steps)
+
         :param attempt_number: The current attempt number
         :type attempt_number: int
         :param max_attempts: The maximum number of attempts allowed
@@ -644,12 +1447,9 @@ class BaseChatDownloader:
         log('warning', text + [retry_text])
 
         if must_sleep:
-            if interruptible_retry:
-                timed_input(time_to_sleep)
-            else:
-                interruptible_sleep(time_to_sleep)
+            yield Sleep(time_to_sleep, interruptible=interruptible_retry)
         else:
-            pause()
+            yield Sleep(None)
 
     @staticmethod
     def check_for_invalid_types(messages_types_to_add, allowed_message_types):
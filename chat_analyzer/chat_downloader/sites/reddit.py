@@ -466,6 +466,9 @@ class RedditChatDownloader(BaseChatDownloader):
 
     _COMMENTS_API_TEMPLATE = 'https://www.reddit.com/comments/{}/.json?limit=1'  # &sort=old
 
+    # Chunks of comments (of past broadcasts)
+    _CACHEABLE_URLS = (r'https://www\.reddit\.com/api/info\.json\?',)
+
     def _get_chat_messages_by_post_id(self, post_id, params, stream_start_time=None):
 
         # 1. Get all comment ids
@@ -497,6 +500,11 @@ class RedditChatDownloader(BaseChatDownloader):
         num_bins = len(chunk_info)
         all_stored = [{} for x in range(num_bins)]
 
+        download_workers = params.get('download_workers') or 1
+        if download_workers > 1:
+            # Workers cannot wait for user input, so they retry on a timer
+            params = dict(params, interruptible_retry=False)
+
         def _parse_chunk(index):
             if not all_stored[index]:  # get if not stored
                 url = info_api + ',t1_'.join(chunk_info[index])
@@ -514,6 +522,9 @@ class RedditChatDownloader(BaseChatDownloader):
 
         start_chunk_index = 0
 
+        checkpoint = params.get('download_checkpoint')
+        resume_state = params.get('resume_state')
+
         if start_time is None:
             start_time = float('-inf')
 
@@ -521,42 +532,61 @@ class RedditChatDownloader(BaseChatDownloader):
             utc_start_time = start_time*1e6 + \
                 (stream_start_time or time.time()*1e3)
 
-            def _binary_search(low, high):
+            def _search(low, high):
+                # k-ary search: probe (up to) one chunk per worker at a time,
+                # each round narrows the range down to the gap between two probes
+                while low <= high:
+                    num_probes = min(download_workers, high - low + 1)
+                    probes = sorted({low + (i + 1) * (high - low) // (num_probes + 1)
+                                     for i in range(num_probes)})
 
-                if high < low:
-                    return -1
+                    parsed_probe_chunks = list(self._iter_concurrently(
+                        _parse_chunk, probes, download_workers))
 
-                mid = (high + low) // 2
-                parsed_mid_chunk = _parse_chunk(mid)
+                    for probe, parsed_probe_chunk in zip(probes, parsed_probe_chunks):
+                        ts_min = multi_get(parsed_probe_chunk, 0, 'timestamp') or 0
+                        ts_max = multi_get(parsed_probe_chunk, -1,
+                                           'timestamp') or float('inf')
 
-                ts_min = multi_get(parsed_mid_chunk, 0, 'timestamp') or 0
-                ts_max = multi_get(parsed_mid_chunk, -1,
-                                   'timestamp') or float('inf')
+                        if ts_min <= utc_start_time <= ts_max:
+                            return probe
+                        elif utc_start_time < ts_min:
+                            high = probe - 1
+                            break
+                        else:  # ts_max < utc_start_time:
+                            low = probe + 1
 
-                if ts_min <= utc_start_time <= ts_max:
-                    return mid
-                elif utc_start_time < ts_min:
-                    return _binary_search(low, mid - 1)
-                else:  # ts_max > utc_start_time:
-                    return _binary_search(mid + 1, high)
+                return -1
 
-            start_chunk_index = _binary_search(0, num_bins)
+            if not resume_state:
+                start_chunk_index = _search(0, num_bins - 1)
 
-        count = 0
-        # Process remaining chunks
-        for index, chunk in enumerate(chunk_info):
-            if index < start_chunk_index:
-                continue
+        if resume_state:  # resume from the chunk of the last written message
+            start_chunk_index = resume_state.get('chunk_index', 0)
 
-            for item in _parse_chunk(index):
-                if item['time_in_seconds'] > end_time:
-                    return
+        count = 0
+        # Process remaining chunks (downloaded ahead of time, in parallel)
+        remaining_chunk_indices = range(max(start_chunk_index, 0), num_bins)
+        remaining_chunks = self._iter_concurrently(
+            _parse_chunk, remaining_chunk_indices, download_workers)
+        try:
+            for index, parsed_chunk in zip(remaining_chunk_indices, remaining_chunks):
+                if checkpoint is not None and parsed_chunk:
+                    checkpoint.record_page(parsed_chunk[0].get('time_in_seconds'), {
+                        'chunk_index': index
+                    })
+
+                for item in parsed_chunk:
+                    if item['time_in_seconds'] > end_time:
+                        return
 
-                if start_time <= item['time_in_seconds']:
-                    yield item
-                    count += 1
+                    if start_time <= item['time_in_seconds']:
+                        yield item
+                        count += 1
 
-            log('debug', f'Total number of messages: {count}')
+                log('debug', f'Total number of messages: {count}')
+        finally:
+            remaining_chunks.close()
 
     _BROADCAST_API_URL = 'https://strapi.reddit.com/broadcasts'
     _SUBREDDIT_BROADCAST_API_URL = 'https://strapi.reddit.com/r/{}/broadcasts?page_size=1'
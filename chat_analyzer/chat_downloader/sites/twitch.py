@@ -1,6 +1,7 @@
 from .common import (
     Chat,
     BaseChatDownloader,
+    HTTPRequest,
     Remapper as r,
     Image
 )
@@ -72,7 +73,10 @@ class TwitchChatIRC():
         self.socket.send((string + '\r\n').encode('utf-8'))
 
     def recv(self, buffer_size):
-        return self.socket.recv(buffer_size).decode('utf-8', 'ignore')
+        return self.recv_bytes(buffer_size).decode('utf-8', 'ignore')
+
+    def recv_bytes(self, buffer_size):
+        return self.socket.recv(buffer_size)
 
     def join_channel(self, channel_name):
         channel_lower = channel_name.lower()
@@ -88,6 +92,49 @@ class TwitchChatIRC():
         self.socket.close()
 
 
+class IRCLineFramer():
+    """Splits the data received from an IRC connection into lines (messages).
+
+    Lines are split incrementally: only the data received since the last
+    complete line is searched for a line ending, and only the incomplete last
+    line is kept between receives. So, each byte is scanned once, however
+    busy the chat is (i.e. however many messages each receive contains).
+    Lines are returned as bytes, to be decoded once complete (decoding each
+    receive could split multi-byte characters).
+    """
+
+    _LINE_ENDING = b'\r\n'
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received data
+
+        :param data: The received data
+        :type data: bytes
+        :return: The lines completed by this data (without line endings)
+        :rtype: list
+        """
+        buffer = self._buffer
+
+        # A line ending may be split between receives
+        search_start = max(len(buffer) - 1, 0)
+        buffer += data
+
+        end = buffer.rfind(self._LINE_ENDING, search_start)
+        if end == -1:
+            return []
+
+        lines = buffer[:end].split(self._LINE_ENDING)
+        del buffer[:end + len(self._LINE_ENDING)]
+        return lines
+
+    def clear(self):
+        """Discard the incomplete line (e.g. when reconnecting)"""
+        self._buffer.clear()
+
+
 class TwitchChatDownloader(BaseChatDownloader):
     _BADGE_INFO = {}
     _BADGE_INFO_URL = 'https://badges.twitch.tv/v1/badges/global/display'
@@ -212,8 +259,12 @@ class TwitchChatDownloader(BaseChatDownloader):
     _GQL_API_URL = 'https://gql.twitch.tv/gql'
     _API_TEMPLATE = 'https://api.twitch.tv/v5/videos/{}/comments?client_id={}'
 
+    # Pages of vod comments
+    _CACHEABLE_URLS = (r'https://api\.twitch\.tv/v5/videos/\d+/comments\?',)
+
     _PING_TEXT = 'PING :tmi.twitch.tv'
     _PONG_TEXT = 'PONG :tmi.twitch.tv'
+    _PING_LINE = _PING_TEXT.encode()
 
     _SUBSCRIPTION_TYPES = {
         'Prime': 'Prime',
@@ -241,21 +292,17 @@ class TwitchChatDownloader(BaseChatDownloader):
 
     @staticmethod
     def _parse_commenter(commenter):
-        info = {}
-        for key in commenter or []:
-            r.remap(info, TwitchChatDownloader._AUTHOR_REMAPPING,
-                    key, commenter[key])
-        return info
+        return TwitchChatDownloader._REMAP_AUTHOR({}, commenter or {})
 
     @staticmethod
-    def _parse_message_info(message):
+    def _parse_message_info(message, parse_emotes=True):
         # Ignore: fragments, is_action
         message_text = message.get('body') or ''
 
         message_emotes = {}
         locations = {}
 
-        for emoticon in message.get('emoticons') or []:
+        for emoticon in (message.get('emoticons') or []) if parse_emotes else []:
             emote_id = emoticon.get('_id')
             begin = emoticon.get('begin')
             end = emoticon.get('end')
@@ -460,6 +507,12 @@ class TwitchChatDownloader(BaseChatDownloader):
     }))
     # print('_KNOWN_COMMENT_KEYS',_KNOWN_COMMENT_KEYS)
 
+    # Compiled remappings (applied to every message)
+    _REMAP_AUTHOR = r.compile(_AUTHOR_REMAPPING)
+    _REMAP_COMMENT = r.compile(_COMMENT_REMAPPING)
+    _REMAP_MESSAGE_PARAMS = r.compile(
+        _MESSAGE_PARAM_REMAPPING, keep_unknown_keys=True)
+
     _IRC_REMAPPING = {
         # CLEARCHAT
         # Purges all chat messages in a channel, or purges chat messages from a specific user, typically after a timeout or ban.
@@ -569,6 +622,9 @@ class TwitchChatDownloader(BaseChatDownloader):
     }
     _KNOWN_IRC_KEYS.update(BaseChatDownloader.get_mapped_keys(_IRC_REMAPPING))
 
+    _REMAP_IRC_TAGS = r.compile(
+        _IRC_REMAPPING, keep_unknown_keys=True, replace_char_with_underscores='-')
+
     _ACTION_TYPE_REMAPPING = {
         # tags
         'CLEARCHAT': 'clear_chat',
@@ -801,13 +857,27 @@ class TwitchChatDownloader(BaseChatDownloader):
             self._SUBSCRIBER_BADGE_INFO[channel_id] = self._session_get_json(
                 url).get('badge_sets') or {}
 
-    @ staticmethod
-    def _parse_item(item, offset):
-        info = {}
+    @staticmethod
+    def _get_comment_remap_function(projection=None):
+        """Get the (compiled) remapping of comments, only building the fields of the projection (if any)"""
+        if projection is None:
+            return TwitchChatDownloader._REMAP_COMMENT
+
+        remap_function = projection.remappings.get('twitch_comment')
+        if remap_function is None:
+            remapping = projection.project_remapping(TwitchChatDownloader._COMMENT_REMAPPING, nested={
+                'commenter': TwitchChatDownloader._AUTHOR_REMAPPING
+            })
+            # The message is always parsed (it holds the message type), emote images are only generated if requested
+            remapping['message'] = r(None, lambda x: TwitchChatDownloader._parse_message_info(
+                x, 'emotes' in projection), True)
+            remap_function = r.compile(remapping)
+            projection.remappings['twitch_comment'] = remap_function
+        return remap_function
 
-        for key in item:
-            r.remap(info, TwitchChatDownloader._COMMENT_REMAPPING,
-                    key, item[key])
+    @ staticmethod
+    def _parse_item(item, offset, projection=None):
+        info = TwitchChatDownloader._get_comment_remap_function(projection)({}, item)
 
         if 'time_in_seconds' in info:
             info['time_in_seconds'] -= offset
@@ -818,15 +888,12 @@ class TwitchChatDownloader(BaseChatDownloader):
         # author_badges
 
         badges = info.pop('author_badges', None)
-        if badges:
+        if badges and (projection is None or 'author_badges' in projection):
             info['author']['badges'] = list(map(lambda x: TwitchChatDownloader._parse_badge_info(
                 x.get('_id'), x.get('version'), channel_id), badges))
 
         user_notice_params = info.pop('user_notice_params', {})
-
-        for key in user_notice_params:
-            r.remap(info, TwitchChatDownloader._MESSAGE_PARAM_REMAPPING,
-                    key, user_notice_params[key], True)
+        TwitchChatDownloader._REMAP_MESSAGE_PARAMS(info, user_notice_params)
 
         # TODO add user colour to author dict
         # TODO check this works
@@ -1139,6 +1206,8 @@ class TwitchChatDownloader(BaseChatDownloader):
     # offset and max_duration are used by clips
 
     def _get_chat_messages_by_vod_id(self, vod_id, params, max_duration, offset=None):
+        """Download steps (see `BaseChatDownloader._run_steps`) of the chat
+        messages of a vod (or clip)."""
 
         # twitch does not provide messages before the stream starts,
         # so we default to a start time of 0
@@ -1156,77 +1225,188 @@ class TwitchChatDownloader(BaseChatDownloader):
             end_time = ensure_seconds(e_time, max_duration)
             content_offset_seconds = (start_time or 0) + offset
 
-        max_attempts = params.get('max_attempts')
+            # clips are short, they are not checkpointed
+            params = dict(params, download_checkpoint=None, resume_state=None)
 
         messages_groups_to_add = params.get('message_groups') or []
         messages_types_to_add = params.get('message_types') or []
 
+        # Only build the requested fields of messages
+        projection = params.get('projection')
+
         api_url = self._API_TEMPLATE.format(vod_id, self._CLIENT_ID)
 
-        message_count = 0
-        # do not need inactivity timeout (not live)
+        # resume from the page of the last written message
+        resume_state = params.get('resume_state')
         cursor = ''
-        while True:
-            url = f'{api_url}&cursor={cursor}&content_offset_seconds={content_offset_seconds}'
+        if resume_state:
+            cursor = resume_state.get('cursor') or ''
+            content_offset_seconds = resume_state.get(
+                'content_offset_seconds', content_offset_seconds)
 
-            for attempt_number in attempts(max_attempts):
-                try:
-                    info = self._session_get_json(url)
-                    break
-                except (JSONDecodeError, RequestException) as e:
-                    self.retry(attempt_number, error=e, **params)
+        shards = None
+        if offset == 0 and not resume_state:  # sharding is only used for (new) vod downloads
+            shards = self._get_time_shards(
+                content_offset_seconds, end_time, max_duration, params.get('download_workers'))
 
-            error_message = multi_get(info, 'error', 'message')
+        def parse_comment(comment):
+            # Returns the message (None if it must not be added), and whether
+            # the end time has been reached
+            data = self._parse_item(comment, offset, projection)
 
-            if error_message:
-                raise TwitchError(error_message)
+            # test for missing keys
+            missing_keys = data.keys() - TwitchChatDownloader._KNOWN_COMMENT_KEYS
 
-            comments = info.get('comments') or []
-            for comment in comments:
-                data = self._parse_item(comment, offset)
-
-                # test for missing keys
-                missing_keys = data.keys() - TwitchChatDownloader._KNOWN_COMMENT_KEYS
+            if missing_keys:
+                debug_log(
+                    f'Missing keys found: {missing_keys}',
+                    f'Original data: {comment}',
+                    f'Parsed data: {data}',
+                    comment.keys(),
+                    TwitchChatDownloader._KNOWN_COMMENT_KEYS
+                )
 
-                if missing_keys:
-                    debug_log(
-                        f'Missing keys found: {missing_keys}',
-                        f'Original data: {comment}',
-                        f'Parsed data: {data}',
-                        comment.keys(),
-                        TwitchChatDownloader._KNOWN_COMMENT_KEYS
-                    )
+            time_in_seconds = data.get('time_in_seconds', 0)
 
-                time_in_seconds = data.get('time_in_seconds', 0)
+            before_start = start_time is not None and time_in_seconds < start_time
+            after_end = end_time is not None and time_in_seconds > end_time
 
-                before_start = start_time is not None and time_in_seconds < start_time
-                after_end = end_time is not None and time_in_seconds > end_time
+            if before_start:  # still getting to messages
+                return None, False
+            elif after_end:  # after end
+                return None, True  # while actually searching, if time is invalid
 
-                if before_start:  # still getting to messages
-                    continue
-                elif after_end:  # after end
-                    return  # while actually searching, if time is invalid
-
-                to_add = self._must_add_item(
-                    data,
-                    self._MESSAGE_GROUPS,
-                    messages_groups_to_add,
-                    messages_types_to_add
-                )
+            to_add = self._must_add_item(
+                data,
+                self._MESSAGE_GROUPS,
+                messages_groups_to_add,
+                messages_types_to_add
+            )
 
-                if not to_add:
-                    continue
+            return (data if to_add else None), False
 
-                message_count += 1
-                yield data
+        message_count = 0
+        comments = None
+        try:
+            if shards:
+                # (Synchronous only, workers are not used asynchronously)
+                # Workers cannot wait for user input, so they retry on a timer
+                shard_params = dict(params, interruptible_retry=False)
+
+                def download_shard(shard_start, shard_end, is_last, stop_event):
+                    return self._download_vod_shard(
+                        api_url, shard_start, shard_end, is_last, shard_params, stop_event)
+
+                comments = self._get_sharded_items(
+                    download_shard, shards, params.get('download_workers'), '_id')
+
+                for comment in comments:
+                    data, after_end = parse_comment(comment)
+                    if after_end:
+                        return
+                    elif data is not None:
+                        message_count += 1
+                        yield data
+                return
 
+            # do not need inactivity timeout (not live)
+            while True:
+                page, cursor = yield from self._get_vod_comment_page(
+                    api_url, cursor, content_offset_seconds, params)
+
+                for comment in page:
+                    data, after_end = parse_comment(comment)
+                    if after_end:
+                        return
+                    elif data is not None:
+                        message_count += 1
+                        yield data
+
+                if not cursor:
+                    return
+        finally:
+            if comments is not None:
+                comments.close()  # stop the shard workers
             log('debug', f'Total number of messages: {message_count}')
 
-            cursor = info.get('_next')
+    def _get_vod_comment_page(self, api_url, cursor, content_offset_seconds, params):
+        """Download steps (see `BaseChatDownloader._run_steps`) of a page of
+        (raw) comments of a vod, at `cursor` (or at `content_offset_seconds`,
+        if there is no cursor).
+
+        :return: The comments, and the cursor of the next page (None if it is
+            the last page)
+        :rtype: tuple
+        """
+        max_attempts = params.get('max_attempts')
+        checkpoint = params.get('download_checkpoint')
+
+        url = f'{api_url}&cursor={cursor}&content_offset_seconds={content_offset_seconds}'
+
+        for attempt_number in attempts(max_attempts):
+            try:
+                response = yield HTTPRequest('GET', url)
+                info = response.json()
+                break
+            except (JSONDecodeError, RequestException) as e:
+                yield from self._retry_steps(attempt_number, error=e, **params)
+
+        error_message = multi_get(info, 'error', 'message')
+
+        if error_message:
+            raise TwitchError(error_message)
+
+        comments = info.get('comments') or []
+        if checkpoint is not None and comments:
+            checkpoint.record_page(comments[0].get('content_offset_seconds'), {
+                'cursor': cursor,
+                'content_offset_seconds': content_offset_seconds
+            })
+
+        return comments, info.get('_next')
+
+    def _get_vod_comment_pages(self, api_url, content_offset_seconds, params, cursor=''):
+        """Follow a vod's chain of `_next` cursors, starting at
+        `content_offset_seconds` (or `cursor`), and yield each page of (raw)
+        comments."""
+        while True:
+            comments, cursor = self._call_steps(self._get_vod_comment_page(
+                api_url, cursor, content_offset_seconds, params))
+
+            yield comments
 
             if not cursor:
                 return
 
+    # Each worker downloads several shards, so that a slow (busy) part of the
+    # vod does not hold up the rest of the download
+    _SHARDS_PER_WORKER = 4
+
+    def _download_vod_shard(self, api_url, shard_start, shard_end, is_last, params, stop_event):
+        """Download the (raw) comments of a vod from `shard_start` until the
+        cursor chain crosses `shard_end`.
+
+        Shards are half-open ([shard_start, shard_end)), except for the last
+        one, so a comment belongs to exactly one shard. Comments before
+        `shard_start` (the seek returns the page that contains it) are dropped.
+        """
+        comments = []
+        for page in self._get_vod_comment_pages(api_url, shard_start, params):
+            for comment in page:
+                time_in_seconds = comment.get('content_offset_seconds', 0)
+
+                if time_in_seconds < shard_start:
+                    continue
+                elif time_in_seconds > shard_end or (time_in_seconds == shard_end and not is_last):
+                    return comments
+
+                comments.append(comment)
+
+            if stop_event.is_set():  # no longer needed
+                break
+
+        return comments
+
     def _get_chat_by_vod_id(self, match, params):
         return self.get_chat_by_vod_id(match.group('id'), params)
 
@@ -1259,14 +1439,17 @@ class TwitchChatDownloader(BaseChatDownloader):
         channel_id = multi_get(video, 'owner', 'id')
         self._update_subscriber_badge_info(channel_id)
 
+        steps = self._get_chat_messages_by_vod_id(
+            vod_id, params, duration)
+
         return Chat(
-            self._get_chat_messages_by_vod_id(
-                vod_id, params, duration),
+            self._run_steps(steps),
             title=title,
             duration=duration,
             status='past',
             video_type='video',
-            id=vod_id
+            id=vod_id,
+            steps=steps
         )
 
     def _get_chat_by_clip_id(self, match, params):
@@ -1301,14 +1484,17 @@ class TwitchChatDownloader(BaseChatDownloader):
         channel_id = multi_get(clip, 'broadcaster', 'id')
         self._update_subscriber_badge_info(channel_id)
 
+        steps = self._get_chat_messages_by_vod_id(
+            vod_id, params, duration, offset)
+
         return Chat(
-            self._get_chat_messages_by_vod_id(
-                vod_id, params, duration, offset),
+            self._run_steps(steps),
             title=title,
             duration=duration,
             status='past',
             video_type='clip',
-            id=clip_id
+            id=clip_id,
+            steps=steps
         )
 
     _MESSAGE_REGEX = re.compile(
@@ -1403,27 +1589,13 @@ class TwitchChatDownloader(BaseChatDownloader):
 
     @staticmethod
     def _parse_irc_item(match):
-        info = {}
+        tags = {}
+        for item in match.group(1).split(';'):
+            key, equals, value = item.partition('=')
+            # If there's no equals, we assign the tag a value of true.
+            tags[key] = value if equals else True
 
-        split_info = match.group(1).split(';')
-
-        for item in split_info:
-            keys = item.split('=', 1)
-            key_length = len(keys)
-            if key_length == 1:
-                # If there's no equals, we assign the tag a value of true.
-                keys.append(True)
-            elif key_length == 2:
-                pass
-            else:  # TODO never reaches this
-                debug_log(
-                    f'Invalid item found: {item}.',
-                    f'All items: {split_info}.',
-                )
-                continue
-
-            r.remap(info, TwitchChatDownloader._IRC_REMAPPING,
-                    keys[0], keys[1], keep_unknown_keys=True, replace_char_with_underscores='-')
+        info = TwitchChatDownloader._REMAP_IRC_TAGS({}, tags)
 
         message_match = match.group(3)
         if message_match:
@@ -1539,7 +1711,7 @@ class TwitchChatDownloader(BaseChatDownloader):
         # TODO make this a param
         ping_every = 60  # how often to ping the server
 
-        readbuffer = ''
+        framer = IRCLineFramer()
 
         message_count = 0
 
@@ -1547,88 +1719,58 @@ class TwitchChatDownloader(BaseChatDownloader):
             while True:
 
                 try:
-                    new_info = twitch_chat_irc.recv(buffer_size)
+                    new_info = twitch_chat_irc.recv_bytes(buffer_size)
 
                     if not new_info:
                         raise ConnectionError('Lost connection, reconnecting.')
 
-                    readbuffer += new_info
-
-                    if self._PING_TEXT in readbuffer:
-                        twitch_chat_irc.send_raw(self._PONG_TEXT)
-
-                    matches = list(self._MESSAGE_REGEX.finditer(readbuffer))
-                    full_readbuffer = readbuffer.endswith('\r\n')
-                    if matches:
-                        if not full_readbuffer:
-                            # sometimes a buffer does not contain a full message
-                            # last one is incomplete
+                    lines = framer.feed(new_info)
 
-                            span = matches[-1].span()
+                    for line in lines:
+                        if line == self._PING_LINE:
+                            twitch_chat_irc.send_raw(self._PONG_TEXT)
+                            continue
 
-                            pass_on = readbuffer[span[0]:]
+                        if not line.startswith(b'@'):
+                            # Untagged lines (e.g. replies to joining the
+                            # channel) are not messages, so are not decoded
+                            continue
 
-                            # check whether message was cut off
-                            if '\r\n' in pass_on:  # last message not matched
-                                # only pass on incomplete message
+                        match = self._MESSAGE_REGEX.match(
+                            line.decode('utf-8', 'ignore'))
+                        if not match:
+                            log('debug', f'No match found in "{line}"')
+                            continue
 
-                                # readbuffer[span[1]:]
-                                pass_on = pass_on[span[1] - span[0]:]
+                        data = self._parse_irc_item(match)
 
-                            # actual message cut off (matched, but not complete)
-                            else:
-                                # remove the last match from being processed (as it is incomplete)
-                                matches.pop()
+                        # test for missing keys
+                        missing_keys = data.keys() - TwitchChatDownloader._KNOWN_IRC_KEYS
 
-                            # pass remaining information to next attempt
-                            readbuffer = pass_on
-
-                        else:
-                            # the whole readbuffer was read correctly.
-                            # reset the readbuffer
-                            readbuffer = ''
-
-                        for match in matches:
-
-                            data = self._parse_irc_item(match)
-
-                            # test for missing keys
-                            missing_keys = data.keys() - TwitchChatDownloader._KNOWN_IRC_KEYS
-
-                            if missing_keys:
-                                debug_log(
-                                    f'Missing keys found: {missing_keys}',
-                                    f'Original data: {match.groups()}',
-                                    f'Parsed data: {data}'
-                                )
-                            # check whether to skip this message or not, based on its type
-
-                            to_add = self._must_add_item(
-                                data,
-                                self._MESSAGE_GROUPS,
-                                messages_groups_to_add,
-                                messages_types_to_add
+                        if missing_keys:
+                            debug_log(
+                                f'Missing keys found: {missing_keys}',
+                                f'Original data: {match.groups()}',
+                                f'Parsed data: {data}'
                             )
+                        # check whether to skip this message or not, based on its type
 
-                            if not to_add:
-                                continue
+                        to_add = self._must_add_item(
+                            data,
+                            self._MESSAGE_GROUPS,
+                            messages_groups_to_add,
+                            messages_types_to_add
+                        )
 
-                            message_count += 1
-                            yield data
+                        if not to_add:
+                            continue
 
-                        log('debug',
-                            f'Total number of messages: {message_count}')
+                        message_count += 1
+                        yield data
 
-                    elif full_readbuffer:
-                        # No matches, but data has been read successfully.
-                        # This means that we can safely reset the readbuffer.
-                        # This is used to periodically reset the readbuffer,
-                        # to avoid a massive buffer from forming.
-
-                        # never pause
+                    if lines:
                         log('debug',
-                            f'No matches found in "\n{readbuffer.strip()}\n"')
-                        readbuffer = ''
+                            f'Total number of messages: {message_count}')
 
                     current_time = time.time()
 
@@ -1644,6 +1786,7 @@ class TwitchChatDownloader(BaseChatDownloader):
                 except ConnectionError:
                     # Close old connection
                     twitch_chat_irc.close_connection()
+                    framer.clear()  # (The incomplete line will never be completed)
 
                     # Create a new connection
                     twitch_chat_irc = create_connection()
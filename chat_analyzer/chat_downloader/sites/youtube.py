@@ -2,6 +2,8 @@
 from .common import (
     BaseChatDownloader,
     Chat,
+    HTTPRequest,
+    Sleep,
     Remapper as r,
     Image
 )
@@ -430,6 +432,11 @@ class YouTubeChatDownloader(BaseChatDownloader):
     _YOUTUBE_CHAT_API_TEMPLATE = _YT_HOME + '/youtubei/v1/live_chat/get_{}?key={}'
     _YOUTUBE_BROWSE_API_TEMPLATE = _YT_HOME + '/youtubei/v1/browse?key={}'
 
+    # Pages of chat replays. The continuation (and seek position) identify the
+    # page, the rest of the request body is client information.
+    _CACHEABLE_URLS = (re.escape(_YT_HOME) + r'/youtubei/v1/live_chat/get_live_chat_replay\?',)
+    _CACHE_KEY_JSON_FIELDS = ('continuation', 'currentPlayerState')
+
     _MESSAGE_GROUPS = {
         'messages': [
             'text_message'  # normal message
@@ -625,7 +632,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
         return message_info
 
     @ staticmethod
-    def _parse_item(item, info=None, offset=0):
+    def _parse_item(item, info=None, offset=0, projection=None):
         if info is None:
             info = {}
         # info is starting point
@@ -635,17 +642,17 @@ class YouTubeChatDownloader(BaseChatDownloader):
         if not item_info:
             return info
 
-        for key in item_info:
-            r.remap(info, YouTubeChatDownloader._REMAPPING,
-                    key, item_info[key])
+        YouTubeChatDownloader._get_remap_function(projection)(info, item_info)
 
         # check for colour information
         for colour_key in YouTubeChatDownloader._COLOUR_KEYS:
             if colour_key in item_info:  # if item has colour information
-                rgba_colour = arbg_int_to_rgba(item_info[colour_key])
-                hex_colour = rgba_to_hex(rgba_colour)
                 new_key = camel_case_split(
                     colour_key.replace('Color', 'Colour'))
+                if projection is not None and new_key not in projection:
+                    continue
+                rgba_colour = arbg_int_to_rgba(item_info[colour_key])
+                hex_colour = rgba_to_hex(rgba_colour)
                 info[new_key] = hex_colour
 
         item_endpoint = item_info.get('showItemEndpoint')
@@ -655,7 +662,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
             if renderer:
                 info.update(YouTubeChatDownloader._parse_item(
-                    renderer, offset=offset))
+                    renderer, offset=offset, projection=projection))
 
         BaseChatDownloader._move_to_dict(info, 'author')
 
@@ -688,11 +695,26 @@ class YouTubeChatDownloader(BaseChatDownloader):
             info['time_in_seconds'] -= offset
             info['time_text'] = seconds_to_time(info['time_in_seconds'])
 
-        if 'message' not in info:  # Ensure the parsed item contains the 'message' key
+        # Ensure the parsed item contains the 'message' key
+        if 'message' not in info and (projection is None or 'message' in projection):
             info['message'] = None
 
         return info
 
+    @staticmethod
+    def _get_remap_function(projection=None):
+        """Get the (compiled) remapping of items, only building the fields of the projection (if any)"""
+        if projection is None:
+            return YouTubeChatDownloader._REMAP_ITEM
+
+        remap_function = projection.remappings.get('youtube')
+        if remap_function is None:
+            remap_function = r.compile(projection.project_remapping(YouTubeChatDownloader._REMAPPING, unpacked_keys={
+                YouTubeChatDownloader._parse_runs: ('message', 'emotes')
+            }))
+            projection.remappings['youtube'] = remap_function
+        return remap_function
+
     @ staticmethod
     def _parse_badges(badge_items):
         badges = []
@@ -878,6 +900,8 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
     }
 
+    _REMAP_ITEM = r.compile(_REMAPPING)
+
     _COLOUR_KEYS = [
         # paid_message
         'authorNameTextColor', 'timestampColor', 'bodyBackgroundColor',
@@ -1293,13 +1317,19 @@ class YouTubeChatDownloader(BaseChatDownloader):
         return f'SAPISIDHASH {time_now}_{sapisidhash}'
 
     def _get_continuation_info(self, continuation_url, program_params, **post_kwargs):
+        return self._call_steps(self._get_continuation_info_steps(
+            continuation_url, program_params, **post_kwargs))
+
+    def _get_continuation_info_steps(self, continuation_url, program_params, **post_kwargs):
+        """Download steps (see `BaseChatDownloader._run_steps`) of
+        `_get_continuation_info`."""
         if program_params is None:
             program_params = {}
         max_attempts = program_params.get('max_attempts', 1)
 
         for attempt_number in attempts(max_attempts):
             try:
-                response = self._session_post(continuation_url, **post_kwargs)
+                response = yield HTTPRequest('POST', continuation_url, **post_kwargs)
                 json_response = response.json()
 
                 # Check for errors:
@@ -1309,28 +1339,33 @@ class YouTubeChatDownloader(BaseChatDownloader):
                     error_message = error.get('message')
 
                     if error_code // 100 == 5:  # Server error, retry
-                        self.retry(attempt_number,
-                                   text=error_message, **program_params)
+                        yield from self._retry_steps(attempt_number,
+                                                     text=error_message, **program_params)
                         continue
                     # 404 means deleted while live
 
                 return json_response
 
             except JSONDecodeError as e:
-                self.retry(attempt_number, error=e, **program_params,
-                           text=f'Unable to parse JSON: `{response.text}`')
+                yield from self._retry_steps(attempt_number, error=e, **program_params,
+                                             text=f'Unable to parse JSON: `{response.text}`')
 
             except RequestException as e:
-                self.retry(attempt_number, error=e, **program_params)
+                yield from self._retry_steps(attempt_number, error=e, **program_params)
 
     def _get_initial_info(self, url, params=None):
+        return self._call_steps(self._get_initial_info_steps(url, params))
+
+    def _get_initial_info_steps(self, url, params=None):
+        """Download steps (see `BaseChatDownloader._run_steps`) of
+        `_get_initial_info`."""
         if params is None:
             params = {}
 
         max_attempts = params.get('max_attempts', 1)
         for attempt_number in attempts(max_attempts):
             try:
-                response = self._session_get(url)
+                response = yield HTTPRequest('GET', url)
                 html = response.text
                 yt = regex_search(html, self._YT_INITIAL_DATA_RE)
                 yt_initial_data = try_parse_json(yt)
@@ -1341,7 +1376,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
                     if response.status_code == 404:
                         raise VideoNotFound(title)
                     elif response.status_code // 100 == 5:  # Server error, retry
-                        self.retry(attempt_number, text=title, **params)
+                        yield from self._retry_steps(attempt_number, text=title, **params)
                         continue
 
                 if not yt_initial_data:  # Fatal error
@@ -1359,7 +1394,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
                 return yt_initial_data, ytcfg, player_response_info
 
             except RequestException as e:
-                self.retry(attempt_number, error=e, **params)
+                yield from self._retry_steps(attempt_number, error=e, **params)
 
         return None, None, None
 
@@ -1568,7 +1603,13 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
         return headers
 
-    def _get_chat_messages(self, initial_info, ytcfg, params):
+    def _get_chat_messages(self, initial_info, ytcfg, params, seek=False):
+        """Download steps (see `BaseChatDownloader._run_steps`) of the chat
+        messages of a YouTube video.
+
+        If `seek` is True, the replay is seeked to `start_time` directly
+        (skipping the initial chat page, which is at the start of the video).
+        """
 
         initial_continuation_info = initial_info.get('continuation_info') or {}
         if len(initial_continuation_info) < 2:
@@ -1584,6 +1625,9 @@ class YouTubeChatDownloader(BaseChatDownloader):
         start_time = ensure_seconds(params.get('start_time'))
         end_time = ensure_seconds(params.get('end_time'))
 
+        # Only build the requested fields of messages
+        projection = params.get('projection')
+
         # Top chat replay - Some messages, such as potential spam, may not be visible
         # Live chat replay - All messages are visible
         chat_type = params.get('chat_type').title()  # Live or Top
@@ -1609,6 +1653,16 @@ class YouTubeChatDownloader(BaseChatDownloader):
         offset_milliseconds = (
             start_time * 1000) if isinstance(start_time, (float, int)) else None
 
+        # Only (non-clip) replays are checkpointed
+        checkpoint = params.get('download_checkpoint') if is_replay and offset is None else None
+
+        # resume from the page of the last written message
+        resume_state = params.get('resume_state') if checkpoint is not None else None
+        if resume_state:
+            continuation = resume_state.get('continuation') or continuation
+            offset_milliseconds = resume_state.get('offset_milliseconds')
+            seek = True
+
         # force_no_timeout = params.get('force_no_timeout')
 
         max_attempts = params.get('max_attempts')
@@ -1633,7 +1687,38 @@ class YouTubeChatDownloader(BaseChatDownloader):
             'referer': init_page
         })
 
-        innertube_context = ytcfg.get('INNERTUBE_CONTEXT') or {}
+        # (Copied, since click tracking parameters are added to it)
+        innertube_context = dict(ytcfg.get('INNERTUBE_CONTEXT') or {})
+
+        segments = None
+        if is_replay and offset is None and not seek:  # segments are not used for clips
+            segments = self._get_time_shards(
+                start_time, end_time, initial_info.get('duration'), params.get('download_workers'))
+
+        if segments:
+            # (Synchronous only, workers are not used asynchronously)
+            # Workers cannot wait for user input, so they retry on a timer
+            segment_params = dict(
+                params, interruptible_retry=False, download_workers=1)
+
+            def download_segment(segment_start, segment_end, is_last, stop_event):
+                # Each segment follows its own continuation chain, seeded at
+                # the segment's start. The first segment starts normally.
+                segment_seek = segment_start > (start_time or 0)
+                messages = []
+                for data in self._run_steps(self._get_chat_messages(initial_info, ytcfg, dict(
+                        segment_params,
+                        start_time=segment_start if segment_seek else params.get('start_time'),
+                        end_time=params.get('end_time') if is_last else segment_end),
+                        seek=segment_seek)):
+                    messages.append(data)
+                    if stop_event.is_set():  # no longer needed
+                        break
+                return messages
+
+            yield from self._get_sharded_items(
+                download_segment, segments, params.get('download_workers'), 'message_id')
+            return
 
         message_count = 0
         first_time = True
@@ -1652,9 +1737,9 @@ class YouTubeChatDownloader(BaseChatDownloader):
                     'authorization': auth
                 })
 
-            if first_time:
+            if first_time and not seek:
                 # must run to get first few messages, otherwise might miss some
-                yt_info = self._get_initial_info(init_page, params)[0]
+                yt_info = (yield from self._get_initial_info_steps(init_page, params))[0]
 
             else:
                 if is_replay and offset_milliseconds is not None:
@@ -1665,7 +1750,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
                     continuation_params['context']['clickTracking'] = {
                         'clickTrackingParams': click_tracking_params}
 
-                yt_info = self._get_continuation_info(
+                yt_info = yield from self._get_continuation_info_steps(
                     continuation_url, params, json=continuation_params)
 
             debug_info = {
@@ -1689,6 +1774,16 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
             actions = info.get('actions') or []
 
+            # (the initial page cannot be requested again with a continuation)
+            if checkpoint is not None and actions and not (first_time and not seek):
+                page_offset_time = float_or_none(multi_get(
+                    actions, 0, 'replayChatItemAction', 'videoOffsetTimeMsec'))
+                if page_offset_time is not None:
+                    checkpoint.record_page(page_offset_time / 1000, {
+                        'continuation': continuation_params['continuation'],
+                        'offset_milliseconds': offset_milliseconds
+                    })
+
             if actions:
                 for action in actions:
                     data = {}
@@ -1721,7 +1816,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
                         original_message_type = try_get_first_key(
                             original_item)
-                        data = self._parse_item(original_item, data, offset)
+                        data = self._parse_item(original_item, data, offset, projection)
 
                     elif original_action_type in self._KNOWN_REMOVE_ACTION_TYPES:
                         original_item = action
@@ -1730,7 +1825,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
                         else:  # markChatItemsByAuthorAsDeletedAction
                             original_message_type = 'banUser'
 
-                        data = self._parse_item(original_item, data, offset)
+                        data = self._parse_item(original_item, data, offset, projection)
 
                     elif original_action_type in self._KNOWN_REPLACE_ACTION_TYPES:
                         original_item = multi_get(
@@ -1738,7 +1833,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
                         original_message_type = try_get_first_key(
                             original_item)
-                        data = self._parse_item(original_item, data, offset)
+                        data = self._parse_item(original_item, data, offset, projection)
 
                     elif original_action_type in self._KNOWN_TOOLTIP_ACTION_TYPES:
                         original_item = multi_get(
@@ -1746,7 +1841,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
                         original_message_type = try_get_first_key(
                             original_item)
-                        data = self._parse_item(original_item, data, offset)
+                        data = self._parse_item(original_item, data, offset, projection)
 
                     elif original_action_type in self._KNOWN_ADD_BANNER_TYPES:
                         original_item = multi_get(
@@ -1759,13 +1854,13 @@ class YouTubeChatDownloader(BaseChatDownloader):
                             header = original_item[original_message_type].get(
                                 'header')
                             parsed_header = self._parse_item(
-                                header, offset=offset)
+                                header, offset=offset, projection=projection)
                             header_message = parsed_header.get('message')
 
                             contents = original_item[original_message_type].get(
                                 'contents')
                             parsed_contents = self._parse_item(
-                                contents, offset=offset)
+                                contents, offset=offset, projection=projection)
 
                             data.update(parsed_header)
                             data.update(parsed_contents)
@@ -1781,7 +1876,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
                     elif original_action_type in self._KNOWN_REMOVE_BANNER_TYPES:
                         original_item = action
                         original_message_type = 'removeBanner'
-                        data = self._parse_item(original_item, data, offset)
+                        data = self._parse_item(original_item, data, offset, projection)
 
                     elif original_action_type in self._KNOWN_IGNORE_ACTION_TYPES:
                         continue  # ignore these
@@ -1854,7 +1949,9 @@ class YouTubeChatDownloader(BaseChatDownloader):
                         continue
 
                     # if from a replay, check whether to skip this message or not, based on its time
-                    if is_replay:
+                    if is_replay and seek and 'time_in_seconds' not in data:
+                        pass  # not positioned in the replay, keep it
+                    elif is_replay:
                         # assume message is at beginning if it does not have a time component
                         time_in_seconds = data.get(
                             'time_in_seconds', 0) + (offset or 0)
@@ -1938,7 +2035,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
                     sleep_duration = max(min(sleep_duration, 8000), 0)
 
                     log('debug', f'Sleeping for {sleep_duration}ms.')
-                    interruptible_sleep(sleep_duration / 1000)
+                    yield Sleep(sleep_duration / 1000)
 
             if no_continuation:  # no continuation, end
                 break
@@ -1965,9 +2062,12 @@ class YouTubeChatDownloader(BaseChatDownloader):
         params['end_time'] = ensure_seconds(params.get(
             'end_time'), max_duration) + clip_start_time
 
+        steps = self._get_chat_messages(initial_info, ytcfg, params)
+
         return Chat(
-            self._get_chat_messages(initial_info, ytcfg, params),
+            self._run_steps(steps),
             id=clip_id,
+            steps=steps,
             **initial_info
         )
 
@@ -2068,9 +2168,12 @@ class YouTubeChatDownloader(BaseChatDownloader):
         """
         initial_info, ytcfg = self._get_initial_video_info(video_id, params)
 
+        steps = self._get_chat_messages(initial_info, ytcfg, params)
+
         return Chat(
-            self._get_chat_messages(initial_info, ytcfg, params),
+            self._run_steps(steps),
             id=video_id,
+            steps=steps,
             **initial_info
         )
 
@@ -0,0 +1,74 @@
+import asyncio
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# Default maximum number of connections an asynchronous client keeps open (in total)
+DEFAULT_CONNECTION_LIMIT = 100
+
+
+def create_async_client(connection_limit=DEFAULT_CONNECTION_LIMIT):
+    """Create an asynchronous HTTP client, whose connection pool can be shared
+    by any number of chat downloads running on the same event loop. Must be
+    called from a coroutine.
+
+    Cookies are not stored by the client, the cookies of each site's session
+    are sent instead (see `BaseChatDownloader._async_session_request`).
+
+    :param connection_limit: Maximum number of connections to keep open,
+        defaults to DEFAULT_CONNECTION_LIMIT
+    :type connection_limit: int, optional
+    :raises ImportError: if aiohttp is not installed
+    :return: The client
+    :rtype: aiohttp.ClientSession
+    """
+    if aiohttp is None:
+        raise ImportError(
+            'Asynchronous downloads require aiohttp. Install it with: pip install aiohttp')
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=connection_limit),
+        cookie_jar=aiohttp.DummyCookieJar()
+    )
+
+
+async def async_request(client, method, url, **kwargs):
+    """Make a request with an asynchronous client.
+
+    The response is read completely and returned as a `requests.Response`,
+    and errors are raised as `requests` exceptions, so that site code can
+    handle responses the same way, however they were requested.
+
+    :param client: The asynchronous client
+    :type client: aiohttp.ClientSession
+    :param method: HTTP method of the request
+    :type method: str
+    :param url: URL of the request
+    :type url: str
+    :raises requests.exceptions.ConnectionError: if the request fails
+    :raises requests.exceptions.Timeout: if the request times out
+    :return: The response
+    :rtype: requests.Response
+    """
+    try:
+        async with client.request(method, url, **kwargs) as aiohttp_response:
+            content = await aiohttp_response.read()
+    except asyncio.TimeoutError as e:
+        raise requests.exceptions.Timeout(f'Request timed out: {url}') from e
+    except aiohttp.ClientError as e:
+        raise requests.exceptions.ConnectionError(e) from e
+
+    response = requests.Response()
+    response.status_code = aiohttp_response.status
+    response.reason = aiohttp_response.reason
+    response.headers = CaseInsensitiveDict(aiohttp_response.headers)
+    response.url = str(aiohttp_response.url)
+    response.encoding = aiohttp_response.charset or 'utf-8'
+    response._content = content
+    return response
@@ -7,6 +7,7 @@ import collections.abc
 import io
 import json
 import base64
+import functools
 
 
 def base64_encode(text):
@@ -40,7 +41,29 @@ def time_to_seconds(time):
     return int(sum(abs(int(x)) * 60 ** i for i, x in enumerate(reversed(time.replace(',', '').split(':')))) * (-1 if time[0] == '-' else 1))
 
 
-def seconds_to_time(seconds, format='{}:{:02}:{:02}', remove_leading_zeroes=True):
+_DEFAULT_TIME_FORMAT = '{}:{:02}:{:02}'
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def whole_seconds_to_time(seconds):
+    """Convert a non-negative number of whole seconds to timestamp, with the
+    default format of `seconds_to_time` (leading zeroes removed). Results are
+    cached, since the same seconds are formatted many times (e.g. message and
+    sample times).
+
+    :param seconds: Number of whole seconds
+    :type seconds: int
+    :return: The corresponding timestamp string
+    :rtype: str
+    """
+    h, remainder = divmod(seconds, 3600)
+    m, s = divmod(remainder, 60)
+    if h:
+        return f'{h}:{m:02}:{s:02}'
+    return f'{m}:{s:02}'  # i.e. without the leading '0:0?'
+
+
+def seconds_to_time(seconds, format=_DEFAULT_TIME_FORMAT, remove_leading_zeroes=True):
     """Convert seconds to timestamp.
 
     :param seconds: Number of seconds
@@ -52,6 +75,10 @@ def seconds_to_time(seconds, format='{}:{:02}:{:02}', remove_leading_zeroes=True
     :return: The corresponding timestamp string
     :rtype: str
     """
+    if format == _DEFAULT_TIME_FORMAT and remove_leading_zeroes:
+        time_string = whole_seconds_to_time(abs(int(seconds)))
+        return '-' + time_string if seconds < 0 else time_string
+
     h, remainder = divmod(abs(int(seconds)), 3600)
     m, s = divmod(remainder, 60)
     time_string = format.format(h, m, s)
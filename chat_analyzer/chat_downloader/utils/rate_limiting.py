@@ -0,0 +1,228 @@
+import threading
+import time
+import collections
+from email.utils import parsedate_to_datetime
+
+from ..debugging import log
+
+
+# Lowest rate (in requests per second) that the rate can be adapted down to
+MIN_RATE = 0.1
+# When rate limited, the rate is multiplied by this factor
+RATE_DECREASE_FACTOR = 0.5
+# Number of recent requests used to estimate the rate that got rate limited
+RATE_WINDOW = 50
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter, which can be shared by any number of threads
+    (and sessions).
+
+    Requests take a token from the bucket, which is refilled at `rate` tokens
+    per second (up to `capacity` tokens, allowing short bursts). Without a
+    rate, requests are not limited until the server rate limits them.
+
+    The rate adapts to the server (additive increase, multiplicative decrease):
+    every rate limited response (HTTP 429) halves the rate and pauses all
+    requests for the `Retry-After` duration, while successful responses
+    slowly raise the rate again, up to `max_rate`.
+    """
+
+    def __init__(self, max_rate=None, capacity=None):
+        """
+        :param max_rate: Maximum number of requests per second, defaults to
+            None (unlimited, until the server rate limits the requests)
+        :type max_rate: float, optional
+        :param capacity: Maximum number of tokens (burst size), defaults to
+            None (one second's worth of tokens)
+        :type capacity: float, optional
+        """
+        self._lock = threading.Lock()
+
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.capacity = capacity
+
+        self._tokens = self._get_capacity()
+        self._last_refill = time.monotonic()
+        self._paused_until = 0
+        self._recent_requests = collections.deque(maxlen=RATE_WINDOW)
+
+        # Counters
+        self.requests = 0
+        self.throttled_time = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+    def _get_capacity(self):
+        if self.capacity is not None:
+            return self.capacity
+        return max(self.rate or 1, 1)
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self._tokens = min(self._get_capacity(),
+                               self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def set_max_rate(self, max_rate):
+        """Set the maximum number of requests per second (None for unlimited)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.max_rate = max_rate
+            if self.rate is None or (max_rate is not None and self.rate > max_rate):
+                self.rate = max_rate
+                self._tokens = min(self._tokens, self._get_capacity())
+
+    def acquire(self):
+        """Block until a request may be made.
+
+        :return: The number of seconds spent waiting
+        :rtype: float
+        """
+        waiting_time = self.reserve()
+        if waiting_time > 0:
+            time.sleep(waiting_time)
+        return waiting_time
+
+    def reserve(self):
+        """Reserve a request, without waiting for it (e.g. to wait
+        asynchronously instead).
+
+        :return: The number of seconds to wait before making the request
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            request_time = max(now, self._paused_until)
+            if self.rate is not None:
+                # Take a token, going into debt if there are none left. The
+                # request is made once the debt has been refilled.
+                self._tokens -= 1
+                if self._tokens < 0:
+                    request_time = max(
+                        request_time, now - self._tokens / self.rate)
+
+            self.requests += 1
+            self._recent_requests.append(request_time)
+
+            waiting_time = request_time - now
+            self.throttled_time += waiting_time
+
+        return waiting_time
+
+    def on_success(self):
+        """Slowly raise the rate back up (after having been rate limited)"""
+        with self._lock:
+            if self.rate is None or self.rate == self.max_rate:
+                return
+
+            # +1 request per second, for every second's worth of successful requests
+            new_rate = self.rate + 1 / self.rate
+            if self.max_rate is not None:
+                new_rate = min(new_rate, self.max_rate)
+
+            self._refill(time.monotonic())
+            self.rate = new_rate
+
+    def on_rate_limited(self, retry_after=None):
+        """Slow down after being rate limited by the server.
+
+        :param retry_after: Number of seconds the server asked to wait, defaults
+            to None
+        :type retry_after: float, optional
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            self.rate_limited += 1
+
+            if self.rate is None:
+                # Estimate the rate that was rate limited
+                span = self._recent_requests[-1] - self._recent_requests[0] if self._recent_requests else 0
+                current_rate = (len(self._recent_requests) - 1) / span if span > 0 else 1
+            else:
+                current_rate = self.rate
+
+            self.rate = max(current_rate * RATE_DECREASE_FACTOR, MIN_RATE)
+            self._tokens = min(self._tokens, 0)
+
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            log('debug', f'Rate limited (retry after: {retry_after}), lowering rate to {self.rate:.2f} requests per second.')
+
+    def on_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def get_stats(self):
+        """Get the counters of the rate limiter
+
+        :return: Number of requests made, seconds spent waiting for the rate
+            limit, number of rate limited responses and of retried requests,
+            and the current rate (None if unlimited)
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'throttled_time': self.throttled_time,
+                'rate_limited': self.rate_limited,
+                'retries': self.retries,
+                'rate': self.rate
+            }
+
+
+_HOST_BUCKETS = {}
+_HOST_BUCKETS_LOCK = threading.Lock()
+
+
+def get_host_bucket(host):
+    """Get the token bucket of a host. Buckets are shared by every session
+    (and thread) of the process.
+
+    :param host: The host (network location) requests are made to
+    :type host: str
+    :return: The token bucket of the host
+    :rtype: TokenBucket
+    """
+    with _HOST_BUCKETS_LOCK:
+        bucket = _HOST_BUCKETS.get(host)
+        if bucket is None:
+            bucket = _HOST_BUCKETS[host] = TokenBucket()
+        return bucket
+
+
+def get_all_host_stats():
+    """Get the counters of every host's token bucket
+
+    :return: Dictionary of host to counters (see `TokenBucket.get_stats`)
+    :rtype: dict
+    """
+    with _HOST_BUCKETS_LOCK:
+        buckets = dict(_HOST_BUCKETS)
+    return {host: bucket.get_stats() for host, bucket in buckets.items()}
+
+
+def parse_retry_after(value):
+    """Parse the value of a `Retry-After` header (seconds or an HTTP date)
+
+    :return: Number of seconds to wait, or None if it could not be parsed
+    :rtype: Union[float, None]
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError, IndexError):
+        return None
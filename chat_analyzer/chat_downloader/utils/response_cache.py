@@ -0,0 +1,182 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+
+# Default maximum size of the cache (in bytes, of compressed responses)
+DEFAULT_MAX_CACHE_SIZE = 1024 * 1024 * 1024  # 1 GiB
+
+_CACHE_FILE_EXTENSION = '.json.gz'
+
+
+class ResponseCache:
+    """
+    On-disk, content-addressed cache of (immutable) HTTP responses.
+
+    Responses are keyed by the request's method, URL and body, and stored
+    gzip-compressed, one file per response. Once the cache grows past
+    `max_size` bytes, the least recently used responses are evicted. The
+    cache can be shared by any number of threads.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_CACHE_SIZE):
+        """
+        :param directory: Directory to store the responses in (created if it
+            does not exist)
+        :type directory: str
+        :param max_size: Maximum size of the cache, in bytes, defaults to
+            DEFAULT_MAX_CACHE_SIZE
+        :type max_size: int, optional
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        # key -> [size, last access time]
+        self._index = {}
+        self._size = 0
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(_CACHE_FILE_EXTENSION):
+                stat = entry.stat()
+                key = entry.name[:-len(_CACHE_FILE_EXTENSION)]
+                self._index[key] = [stat.st_size, stat.st_mtime]
+                self._size += stat.st_size
+
+    @staticmethod
+    def get_key(method, url, body=None):
+        """Get the cache key of a request.
+
+        :param method: HTTP method of the request
+        :type method: str
+        :param url: URL of the request
+        :type url: str
+        :param body: Body of the request, defaults to None. JSON bodies are
+            serialized with sorted keys
+        :type body: Union[str, bytes, dict, list], optional
+        :return: The key
+        :rtype: str
+        """
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, sort_keys=True, separators=(',', ':'))
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        key = hashlib.sha256()
+        key.update(method.upper().encode('utf-8'))
+        key.update(b'\0')
+        key.update(url.encode('utf-8'))
+        key.update(b'\0')
+        key.update(body or b'')
+        return key.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key + _CACHE_FILE_EXTENSION)
+
+    def get(self, key):
+        """Get a cached response body.
+
+        :return: The response body, or None if it is not cached
+        :rtype: Union[bytes, None]
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+        try:
+            with gzip.open(self._get_path(key), 'rb') as f:
+                content = f.read()
+        except (OSError, EOFError):  # removed or corrupt
+            with self._lock:
+                self._remove(key)
+                self.misses += 1
+            return None
+
+        now = time.time()
+        with self._lock:
+            self.hits += 1
+            entry[1] = now
+        try:
+            os.utime(self._get_path(key), (now, now))  # persist the access time
+        except OSError:
+            pass
+
+        return content
+
+    def put(self, key, content):
+        """Store a response body, and evict the least recently used responses
+        if the cache is too large.
+
+        :param content: The response body
+        :type content: bytes
+        """
+        compressed = gzip.compress(content)
+
+        # Write atomically, so that an interrupted run never leaves a partial response
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as f:
+                f.write(compressed)
+            os.replace(temporary_path, self._get_path(key))
+        except OSError:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._remove_from_index(key)
+            self._index[key] = [len(compressed), time.time()]
+            self._size += len(compressed)
+
+            if self._size > self.max_size:
+                self._evict()
+
+    def _remove_from_index(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._size -= entry[0]
+
+    def _remove(self, key):
+        self._remove_from_index(key)
+        try:
+            os.remove(self._get_path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        # Evict down to 90% of the maximum size, so not every put evicts
+        target_size = self.max_size * 0.9
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._size <= target_size:
+                break
+            self._remove(key)
+
+    def get_stats(self):
+        """Get the counters of the cache
+
+        :return: Number of hits and misses, number of cached responses and
+            size of the cache (in bytes)
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'responses': len(self._index),
+                'size': self._size
+            }
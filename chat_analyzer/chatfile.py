@@ -0,0 +1,313 @@
+import os
+import re
+import json
+import numpy as np
+
+from array import array
+
+# Size (in characters) of each read from a chatfile. Large enough that most reads contain many messages,
+# small enough that peak memory does not depend on the length of the stream.
+READ_CHUNK_SIZE = 1 << 16
+
+# Initial number of bytes read from the end of a chatfile when looking for the last message timestamp.
+# The window doubles until a timestamp is found (or the whole file has been scanned).
+TAIL_SCAN_SIZE = 1 << 14
+
+# Matches the "time_in_seconds" key of a serialized chat message (JSONCW & JSONLCW both use json.dumps)
+_TIME_IN_SECONDS_REGEX = re.compile(rb'"time_in_seconds"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)')
+
+
+def is_jsonl_chatfile(filepath: str) -> bool:
+    """Determine whether a chatfile holds a top-level JSON array (written by the chat downloader's JSONCW)
+    or JSON lines (one message per line, written by the chat downloader's JSONLCW).
+
+    :param filepath: a path to a chatfile
+    :type filepath: str
+    :returns: True if the chatfile is in the JSON lines format, False if it is a JSON array
+    :rtype: bool
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return False # Empty file, treat it as an (empty) JSON array
+            stripped = chunk.lstrip()
+            if stripped:
+                return not stripped.startswith('[')
+
+def _iter_json_array(f):
+    """Incrementally decode the items of a top-level JSON array from an open file, one item at a time.
+    Only the current (partially read) item is held in memory, regardless of the size of the file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # Skip whitespace and separators between items
+        while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ',')):
+            pos += 1
+
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError(f"Chatfile does not contain a JSON array (found '{buffer[pos]}')")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item is (probably) cut off by the end of the buffer, read more before retrying
+                if eof:
+                    raise
+            else:
+                yield item
+                pos = end
+                continue
+        elif eof:
+            # NOTE: An array that was never closed is tolerated so partially written chatfiles can still be analyzed
+            return
+
+        chunk = f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        # Drop everything that has already been decoded so the buffer never grows past ~1 item + 1 chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def _iter_json_lines(f):
+    """Decode a JSON lines file one line (message) at a time"""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_chatmsgs_from_chatfile(filepath: str):
+    """Lazily read the chat messages of a chatfile (directly from Xenovas downloader or produced by
+    --save-chatfile-output), yielding one message at a time so that peak memory stays flat no
+    matter how long the stream is.
+
+    Both a top-level JSON array (.json) and JSON lines (.jsonl) are accepted.
+
+    :param filepath: a path to a chatfile
+    :type filepath: str
+    :yields: the chat messages of the chatfile, in file order
+    :rtype: dict
+    """
+    jsonl = is_jsonl_chatfile(filepath)
+    with open(filepath, 'r', encoding='utf-8') as f:
+        if jsonl:
+            yield from _iter_json_lines(f)
+        else:
+            yield from _iter_json_array(f)
+
+def get_chatfile_duration(filepath: str):
+    """Approximate the duration of the media a chatfile belongs to by finding the timestamp of the last message
+    in the file. Only the tail of the file is read (the scanned window grows until a timestamp is found).
+
+    NOTE: We don't have the duration of the media in a chatfile, the last message's timestamp is the next best thing.
+
+    :param filepath: a path to a chatfile
+    :type filepath: str
+    :returns: the 'time_in_seconds' of the last message in the chatfile, or None if no message has one
+    :rtype: float
+    """
+    file_size = os.path.getsize(filepath)
+    window = TAIL_SCAN_SIZE
+
+    with open(filepath, 'rb') as f:
+        while True:
+            start = max(file_size - window, 0)
+            f.seek(start)
+            tail = f.read(file_size - start)
+            # The last match in the tail is the last timestamp in the file. (A key cut off by the start of the window
+            # simply doesn't match, and is found on the next, larger, pass)
+            last_match = None
+            for last_match in _TIME_IN_SECONDS_REGEX.finditer(tail):
+                pass
+            if last_match:
+                return json.loads(last_match.group(1))
+            if start == 0:
+                return None
+            window *= 2
+
+
+# The columnar cache of a chatfile lives in a directory next to it: '<chatfile>.cache/'
+CACHE_DIR_SUFFIX = '.cache'
+# Bump whenever the layout of the cache changes, older caches are then ignored (and rewritten)
+CACHE_VERSION = 1
+_CACHE_META_FILENAME = 'meta.json'
+
+# Value stored in the author column for messages that have no author
+NO_AUTHOR = -1
+
+
+class ChatColumns():
+    """
+    Compact, columnar representation of the parts of a chatlog that sampling depends on.
+
+    Every message of the chatlog corresponds to one row (in chatlog order) of three NumPy columns:
+
+    time_in_seconds: np.ndarray[float64]
+        The time of the message (NaN if the message has no time)
+    message_type: np.ndarray[int16]
+        Index of the message's type in 'message_types'
+    author: np.ndarray[int32]
+        Dense (interned) id of the message's author, in order of first appearance. NO_AUTHOR if the message has no author.
+
+    message_types: list[str]
+        The message type names, indexed by the codes of the message_type column
+    num_authors: int
+        The number of distinct authors in the author column
+    duration: float
+        The 'time_in_seconds' of the last message (what we approximate the media duration with in chatfile mode)
+    """
+
+    def __init__(self, time_in_seconds, message_type, author, message_types, num_authors, duration):
+        self.time_in_seconds = time_in_seconds
+        self.message_type = message_type
+        self.author = author
+        self.message_types = message_types
+        self.num_authors = num_authors
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.time_in_seconds)
+
+    def iter_messages(self):
+        """Yield minimal chat messages (only the fields that sampling reads) reconstructed from the columns.
+        Author ids are the interned ints, which is all that is needed to tell authors apart.
+
+        :yields: chat messages with 'time_in_seconds', 'message_type' and (if present) 'author'
+        :rtype: dict
+        """
+        message_types = self.message_types
+        for time_in_seconds, type_code, author in zip(self.time_in_seconds.tolist(), self.message_type.tolist(), self.author.tolist()):
+            msg = {'time_in_seconds': time_in_seconds, 'message_type': message_types[type_code]}
+            if author != NO_AUTHOR:
+                msg['author'] = {'id': author}
+            yield msg
+
+    def save(self, cache_dir: str):
+        """Write the columns to cache_dir as .npy files (so they can be memory-mapped when loaded)"""
+        os.makedirs(cache_dir, exist_ok=True)
+        meta_path = os.path.join(cache_dir, _CACHE_META_FILENAME)
+        # The metadata marks the cache as complete, remove it first so a half-written cache is never considered valid
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        np.save(os.path.join(cache_dir, 'time_in_seconds.npy'), self.time_in_seconds)
+        np.save(os.path.join(cache_dir, 'message_type.npy'), self.message_type)
+        np.save(os.path.join(cache_dir, 'author.npy'), self.author)
+
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'version': CACHE_VERSION,
+                'message_types': self.message_types,
+                'num_authors': self.num_authors,
+                'duration': self.duration,
+            }, f)
+
+    @staticmethod
+    def load(cache_dir: str):
+        """Load (memory-map) columns previously written with ChatColumns.save()"""
+        with open(os.path.join(cache_dir, _CACHE_META_FILENAME), 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_VERSION:
+            raise ValueError(f"Unsupported chat cache version: {meta.get('version')}")
+
+        return ChatColumns(
+            time_in_seconds=np.load(os.path.join(cache_dir, 'time_in_seconds.npy'), mmap_mode='r'),
+            message_type=np.load(os.path.join(cache_dir, 'message_type.npy'), mmap_mode='r'),
+            author=np.load(os.path.join(cache_dir, 'author.npy'), mmap_mode='r'),
+            message_types=meta['message_types'],
+            num_authors=meta['num_authors'],
+            duration=meta['duration'],
+        )
+
+class ChatColumnsBuilder():
+    """
+    Incrementally builds ChatColumns from chat messages, interning message types and author ids as they are first seen.
+    """
+
+    def __init__(self):
+        self._times = array('d')
+        self._types = array('h')
+        self._authors = array('i')
+        self._type_codes = {} # message_type -> code
+        self._author_ids = {} # author['id'] -> dense int
+        self._last_time = None
+        # Set once tee() has exhausted the iterable it wraps (i.e. the columns hold the whole chatlog)
+        self.complete = False
+
+    def append(self, msg):
+        """Add a chat message as the next row of the columns"""
+        time_in_seconds = msg.get('time_in_seconds')
+        if time_in_seconds is None:
+            time_in_seconds = float('nan')
+        else:
+            self._last_time = time_in_seconds
+        self._times.append(time_in_seconds)
+
+        message_type = msg.get('message_type')
+        type_code = self._type_codes.get(message_type)
+        if type_code is None:
+            type_code = self._type_codes[message_type] = len(self._type_codes)
+        self._types.append(type_code)
+
+        author = msg.get('author')
+        if author is None:
+            self._authors.append(NO_AUTHOR)
+        else:
+            author_id = author.get('id')
+            author_code = self._author_ids.get(author_id)
+            if author_code is None:
+                author_code = self._author_ids[author_id] = len(self._author_ids)
+            self._authors.append(author_code)
+
+    def tee(self, messages):
+        """Pass through an iterable of chat messages, adding each message to the columns as it goes by"""
+        for msg in messages:
+            self.append(msg)
+            yield msg
+        self.complete = True
+
+    def build(self) -> ChatColumns:
+        """Convert the accumulated rows into ChatColumns"""
+        return ChatColumns(
+            time_in_seconds=np.frombuffer(self._times, dtype=np.float64).copy(),
+            message_type=np.frombuffer(self._types, dtype=np.int16).copy(),
+            author=np.frombuffer(self._authors, dtype=np.int32).copy(),
+            message_types=list(self._type_codes), # dicts preserve insertion order, so names line up with codes
+            num_authors=len(self._author_ids),
+            duration=self._last_time,
+        )
+
+def get_chatfile_cache_dir(filepath: str) -> str:
+    """The directory holding the columnar cache of a chatfile"""
+    return filepath + CACHE_DIR_SUFFIX
+
+def load_chatfile_cache(filepath: str):
+    """Load the columnar cache of a chatfile, as long as it exists and is fresher than the chatfile itself.
+
+    :param filepath: a path to a chatfile
+    :type filepath: str
+    :returns: the cached columns, or None if there is no usable cache
+    :rtype: ChatColumns
+    """
+    cache_dir = get_chatfile_cache_dir(filepath)
+    meta_path = os.path.join(cache_dir, _CACHE_META_FILENAME)
+    if not os.path.exists(meta_path) or os.path.getmtime(meta_path) < os.path.getmtime(filepath):
+        return None
+    try:
+        return ChatColumns.load(cache_dir)
+    except (OSError, ValueError, KeyError):
+        return None # Unreadable/outdated cache, treat it as if it didn't exist (it will be rewritten)
+
+def save_chatfile_cache(filepath: str, columns: ChatColumns):
+    """Write the columnar cache of a chatfile next to it (see get_chatfile_cache_dir)"""
+    columns.save(get_chatfile_cache_dir(filepath))
@@ -1,4 +1,6 @@
 import argparse
+import datetime
+import json
 
 from .metadata import (
     __version__,
@@ -6,8 +8,11 @@ from .metadata import (
     __program__
 )
 
-from .analyzer import run, MAX_INTERVAL, MIN_INTERVAL
-from .dataformat import SUPPORTED_PLATFORMS, SUPPORTED_PLATFORMS_SHORTHANDS
+from .analyzer import run, get_ChatAnalytics_from_file, MAX_INTERVAL, MIN_INTERVAL
+from .batch import run_batch, get_batch_sources, is_url_source
+from .channel import run_channel, parse_channel, CHANNEL_DATE_FORMAT
+from .dataformat import SUPPORTED_PLATFORMS, SUPPORTED_PLATFORMS_SHORTHANDS, SPIKE_ALGORITHMS, SPIKE_BASE_THRESHOLD, METRIC_TO_FIELD, seconds_to_time
+from .store import AnalyticsStore, METRIC_TO_MEDIA_FIELD, RANKED_SAMPLE_FIELDS, RANKED_MEDIA_FIELDS, RANKED_HIGHLIGHT_FIELDS
 
 def check_interval(interval):
     """
@@ -20,6 +25,22 @@ def check_interval(interval):
         raise argparse.ArgumentTypeError(f"Interval must be at most {MAX_INTERVAL} and at least {MIN_INTERVAL}")
     return interval
 
+def check_intervals(intervals):
+    """
+    Check a comma-separated list of intervals (ex: 1,5,30) with check_interval.
+    A single interval is kept as a single value, several (distinct) intervals are given as a list"""
+    intervals = list(dict.fromkeys(check_interval(interval) for interval in intervals.split(',')))
+    return intervals[0] if len(intervals) == 1 else intervals
+
+def check_date(value):
+    """
+    Check that the value is a date (YYYY-MM-DD)"""
+    try:
+        datetime.datetime.strptime(value, CHANNEL_DATE_FORMAT)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Date must be in the format YYYY-MM-DD")
+    return value
+
 def check_positive_int(value):
     """
     Check that the value is a positive integer"""
@@ -28,6 +49,36 @@ def check_positive_int(value):
         raise argparse.ArgumentTypeError("Value must be a positive integer")
     return value
 
+def check_nonzero_positive_int(value):
+    """
+    Check that the value is a positive integer greater than 0"""
+    value = int(value)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("Value must be a positive integer greater than 0")
+    return value
+
+def check_windows(windows):
+    """
+    Check a comma-separated list of window lengths (ex: 60,300,600) with check_nonzero_positive_int.
+    The (distinct) lengths are given as a list"""
+    return list(dict.fromkeys(check_nonzero_positive_int(window) for window in windows.split(',')))
+
+def check_nonzero_positive_float(value):
+    """
+    Check that the value is a number greater than 0"""
+    value = float(value)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("Value must be greater than 0")
+    return value
+
+def check_fraction_float(value):
+    """
+    Check that the value is between 0 and 1 inclusive"""
+    value = float(value)
+    if value < 0 or value > 1:
+        raise argparse.ArgumentTypeError("Value must be between 0 and 1 inclusive")
+    return value
+
 def check_percentile_float(value):
     """
     Check that the value is between 0 and 100 exclusive"""
@@ -108,7 +159,11 @@ def main():
         when using this mode.
 
         In mode=\033[1m'reanalyze'\033[0m, source is a filepath to a .json file previously produced by this program which contains \033[3mexisting sample data to reanalyze\033[0m.
-        (Highlights and spikes are regenerated, the existing samples are not affected).""")
+        (Highlights and spikes are regenerated, the existing samples are not affected).
+
+        With --batch, source is a list file (one url or filepath per line) or a glob pattern of files to process, see --batch.
+
+        With --channel, source is the url of a channel whose past broadcasts to process, see --channel.""")
 
     parser.add_argument("--platform", type=str, choices=dict.keys(SUPPORTED_PLATFORMS_SHORTHANDS), help="""
     When reading from a chatfile, specify the platform the chat was downloaded from. 
@@ -140,14 +195,66 @@ def main():
     so that the raw data can be \033[3mfully\033[0m reprocessed and analyzed again quickly (using mode='chatfile').
     NOTE: Chatfiles are *much* larger in comparison to the analytics file.  
     NOTE: json file extension is enforced because it affects the content that the chat downloader writes to the file.""")
+    mode_group.add_argument("--resume", action="store_true", help="""
+    (With --save-chatfile-output) Resume an interrupted download: while downloading, a checkpoint is saved next to the chatfile ('[CHATFILE].checkpoint').
+    The download continues from the checkpoint and the new messages are appended to the chatfile, so only the missing part of the chat is downloaded.
+    The whole chat (saved and downloaded) is then processed. If there is no checkpoint, the chat is downloaded from the start.""")
+    mode_group.add_argument("--no-cache", action="store_true", help="""
+    Do not read or write the columnar chat cache ('[CHATFILE].cache/') that is normally stored next to a chatfile.
+    The cache holds only the fields needed for sampling, so that re-processing a chatfile (e.g. with a different interval)
+    does not have to parse the raw chat data again. It is used automatically in mode='chatfile' when it is newer than the chatfile.""")
+
+    mode_group.add_argument("--batch", action="store_true", help="""
+    Process many sources in one run. The source is a list file, with one url or filepath per line (empty lines and lines starting with '#' are ignored),
+    or a quoted glob pattern of files (ex: 'chats/**/*.json'). Urls are processed in mode='url', files in mode='chatfile' (or mode='reanalyze' if specified).
+    Sources are processed in parallel by a pool of worker processes (see --batch-workers). --output is the output directory, where each source
+    is written to '[NAME].json' (and its console output to '[NAME].log'), along with a summary of every source ('index.json').
+    --save-chatfile-output is the directory to save the chatfiles of the urls to. A source that fails is recorded in the summary, and the other sources carry on.""")
+    mode_group.add_argument("--channel", action="store_true", help="""
+    Process the past broadcasts of a channel. The source is the url of a Twitch channel (https://www.twitch.tv/[USERNAME]) or of a YouTube channel
+    (https://www.youtube.com/channel/[ID], /c/[NAME] or /user/[ID]). The broadcasts are processed like a --batch of urls, where --output is the output directory
+    and each broadcast is written to '[VIDEO ID].json'. Broadcasts that already have an output file are skipped, so re-running on the same output directory
+    only processes the new broadcasts. A rollup of the channel (totals and highlight density per hour, across the broadcasts) is written to 'channel.json'.""")
+    mode_group.add_argument("--since", type=check_date, help="(With --channel, Twitch only) Only process the broadcasts published on or after this date (YYYY-MM-DD, UTC).")
+    mode_group.add_argument("--until", type=check_date, help="(With --channel, Twitch only) Only process the broadcasts published on or before this date (YYYY-MM-DD, UTC).")
+    mode_group.add_argument("--channel-limit", type=check_nonzero_positive_int, help="(With --channel) The maximum number of (most recent) broadcasts to process.")
+    mode_group.add_argument("--batch-workers", type=check_nonzero_positive_int, help="(With --batch or --channel) The number of worker processes. Defaults to the number of CPUs.")
+    mode_group.add_argument("--skip-existing", action="store_true", help="""
+    (With --batch) Skip the sources that already have an output file, ex: to continue an interrupted batch.""")
+
+    mode_group.add_argument("--download-workers", "-w", default=1, type=check_nonzero_positive_int, help="""
+    (mode=\033[1m\'url\'\033[0m only) The maximum number of concurrent requests used to download the chat. The VOD is split into time ranges
+    that are downloaded in parallel and merged back in order, so the download time goes down with the number of workers.
+    Supported for Twitch VODs and YouTube chat replays.""")
+    mode_group.add_argument("--max-requests-per-second", type=check_nonzero_positive_float, help="""
+    (mode=\033[1m\'url\'\033[0m only) The maximum number of requests per second made to each of the platform's hosts, shared by all the download workers.
+    Whether or not it is set, the rate is lowered automatically when the platform rate limits the requests (HTTP 429), and rate limited requests are retried after the delay the platform asks for.
+    With --debug, the number of requests, retries and the time spent waiting on the rate limit are printed.""")
+    mode_group.add_argument("--response-cache", type=str, help="""
+    (mode=\033[1m\'url\'\033[0m only) Directory in which to cache the downloaded pages of chat replays (compressed). When the same VOD is downloaded again
+    (ex: after a crash, or to analyze it differently), the cached pages are used instead of downloading them again. Only the video's metadata is downloaded again.""")
+    mode_group.add_argument("--response-cache-size", default=1024, type=check_nonzero_positive_float, help="""
+    (With --response-cache) The maximum size of the response cache (in MiB). Once the cache is full, the least recently used pages are removed.""")
 
     # Processing Arguments
     sampling_group = parser.add_argument_group("Processing (Sampling)")
-    sampling_group.add_argument("--interval", "-i" , default=5, type=check_interval, help="""
+    sampling_group.add_argument("--interval", "-i" , default=5, type=check_intervals, help="""
             The time interval (in seconds) at which to compress datapoints into samples. i.e. Duration of the samples. The smaller the interval, the more 
             granular the analytics are. At interval=5, each sample contains 5 seconds of cumulative data.
-            *(With the exception of the last sample, which may be shorter than the interval).*""")
+            *(With the exception of the last sample, which may be shorter than the interval).*
+            Several comma-separated intervals can be provided (ex: -i 1,5,30,120), the chat is then downloaded/read once and sampled at every interval.
+            Each interval is written to its own output file, suffixed with the interval ('[OUTPUT]_[INTERVAL]s.json').""")
     sampling_group.add_argument("--print-interval", default=100, type=int, help="Number of messages between progress updates to the console. If <= 0, progress is not printed.")
+    sampling_group.add_argument("--engine", default="auto", choices=["auto", "loop", "vectorized"], type=str, help="""R|How the chat data is processed into samples:
+        \033[1m\'loop\'\033[0m processes the messages one at a time, as they are downloaded/read.
+        \033[1m\'vectorized\'\033[0m reads/downloads the whole chatlog first and then processes it at once with array operations (much faster, and samples several intervals in one pass).
+        \033[1m\'auto\'\033[0m uses 'vectorized' in mode='chatfile' or when several intervals are provided, and 'loop' otherwise.
+        Both engines produce identical samples.""")
+    sampling_group.add_argument("--pipeline", action="store_true", help="""
+            (mode=\033[1m\'url\'\033[0m only) Download the chat in a background thread while it is being processed, instead of alternating between the two.
+            Messages are handed over in batches through a bounded queue. With --debug, the queue statistics are printed, showing whether the run was network-bound or CPU-bound.""")
+    sampling_group.add_argument("--pipeline-prefetch-depth", default=8, type=check_nonzero_positive_int, help="(With --pipeline) The maximum number of downloaded batches waiting to be processed.")
+    sampling_group.add_argument("--pipeline-batch-size", default=500, type=check_nonzero_positive_int, help="(With --pipeline) The number of messages per batch handed over to the analysis (unrelated to --batch).")
     
     
     # Post Processing (Analyzing) Arguments
@@ -166,14 +273,26 @@ def main():
     \033[1m\'{metric_choices[2]}\'\033[0m compares samples based off of the average number of any type of message that appears in the chat per second of the sample.\n 
     """)
 
-    # TODO: spike sensitivity
-    # TODO: spike metric
-
-    # mutex_postprocess_group = postprocess_group.add_mutually_exclusive_group()
-     # mutex_postprocess_group.add_argument("--spike-time", default=120, type=check_positive_int, help="Specify the total amount of cumulative spike time (in seconds) that we want output.")
-    # TODO: More settings for finding spike. Sensitivity based, or "top-5 based" or...?
-
-    # TODO: Allow user to specify which field they want spike detection on (possibly multiple fields resulting in multiple types of spikes in the list)
+    postprocess_group.add_argument("--spike-metric", "-sm", default=metric_choices[0], choices=metric_choices, type=str, help="""
+    The metric to detect spikes in (sudden increases relative to the preceding samples). The choices are the same as for --highlight-metric.""")
+    postprocess_group.add_argument("--spike-sensitivity", "-ss", default=1.0, type=check_nonzero_positive_float, help=f"""
+    How sensitive the spike detector is at picking up spikes. Higher sensitivity means more spikes are detected.
+    A sample spikes if it is more than {SPIKE_BASE_THRESHOLD:g}/SPIKE_SENSITIVITY standard deviations above the average of the SPIKE_LAG samples preceding it.""")
+    postprocess_group.add_argument("--spike-algorithm", default=SPIKE_ALGORITHMS[0], choices=SPIKE_ALGORITHMS, type=str, help=f"""R|\
+    The algorithm used to detect spikes. \n
+    \033[1m\'{SPIKE_ALGORITHMS[0]}\'\033[0m (smoothed z-score): contiguous spiking samples make up one spike. Spiking samples have less influence (see --spike-influence) on the baseline of the following samples, so sustained activity keeps standing out.\n
+    \033[1m\'{SPIKE_ALGORITHMS[1]}\'\033[0m (local maxima): a spike is a single sample that is also the maximum of the SPIKE_LAG samples on either side of it.\n
+    """)
+    postprocess_group.add_argument("--spike-lag", default=12, type=check_nonzero_positive_int, help="The number of preceding samples that a sample is compared to when detecting spikes.")
+    postprocess_group.add_argument("--spike-influence", default=0.5, type=check_fraction_float, help="""
+    (zscore algorithm) A number between 0 and 1, the weight of spiking samples in the baseline of the following samples. 
+    At 0, spikes never affect the baseline, at 1 they affect it as much as any other sample.""")
+    postprocess_group.add_argument("--engagement-metric", default=metric_choices[0], choices=metric_choices, type=str, help="""
+    The metric to rank the most engaging sections of the chatlog by (see --engagement-windows). The choices are the same as for --highlight-metric.""")
+    postprocess_group.add_argument("--engagement-windows", default=[60, 300, 600], type=check_windows, help="""
+    The comma-separated lengths (in seconds) of the most engaging sections to find (ex: 60,300,600, the default: the best 1, 5 and 10 minutes of the chatlog).
+    Lengths are rounded to a whole number of samples.""")
+    postprocess_group.add_argument("--engagement-count", default=5, type=check_positive_int, help="The number of (non-overlapping) most engaging sections to find for every window length.")
 
    
     # Output Arguments
@@ -182,6 +301,10 @@ def main():
     output_group.add_argument("--output", "-o", type=str, help="""The filepath to write the output to. If not specified, the output is written to '[MEDIA TITLE].json.' 
                                                     If the provided file path does not end in '.json', the '.json' file extension is appended automaticaly to the filepath (disable with --nojson).""")
     output_group.add_argument("--nojson", action="store_true", help="Disable the automatic appending of the '.json' file extension to the provided output filepath.")
+    output_group.add_argument("--store", type=str, help="""
+    Filepath of an analytics store (SQLite database, created if it doesn't exist) to also append the analytics to. The totals, samples and highlights
+    of every chatlog added to the store can then be queried at once with chat_analyzer_query (ex: the most active samples across the last 200 streams).
+    Re-analyzing a chatlog (same source and interval) replaces its analytics in the store. Works with --batch and --channel.""")
     # TODO: Add a console output group (verbose, quiet, progress update, etc...)
 
     debug = parser.add_argument_group('Debugging')
@@ -192,23 +315,143 @@ def main():
     kwargs = args.__dict__
 
     # Argument dependency-checks:
-    if(kwargs['mode'] == 'chatfile' and kwargs['platform']== None):
+    if(kwargs['batch']):
+        if(kwargs['channel']):
+            parser.error('The --batch and --channel flags cannot be used together.')
+        try:
+            batch_sources = get_batch_sources(kwargs['source'])
+        except ValueError as exception:
+            parser.error(str(exception))
+        if(not batch_sources):
+            parser.error(f"No sources found in {kwargs['source']}")
+        if(kwargs['mode'] != 'reanalyze' and kwargs['platform'] == None and not all(is_url_source(source) for source in batch_sources)):
+            parser.error('When processing chatfiles, you must specify the platform the chatfiles are from with --platform argument.')
+    elif(kwargs['skip_existing']):
+        parser.error('The --skip-existing flag can only be used with --batch.')
+    if(kwargs['channel']):
+        try:
+            channel_platform, _ = parse_channel(kwargs['source'])
+        except ValueError as exception:
+            parser.error(str(exception))
+        if(kwargs['mode'] != 'url'):
+            parser.error('The --channel flag can only be used in mode=\033[1m\'url\'\033[0m.')
+        if((kwargs['since'] or kwargs['until']) and channel_platform != 'twitch'):
+            parser.error('The --since and --until flags can only be used with Twitch channels (YouTube does not list the publication dates of videos).')
+        if(kwargs['since'] and kwargs['until'] and kwargs['since'] > kwargs['until']):
+            parser.error('The --since date must not be after the --until date.')
+    elif(kwargs['since'] or kwargs['until'] or kwargs['channel_limit']):
+        parser.error('The --since, --until and --channel-limit flags can only be used with --channel.')
+    if(kwargs['batch_workers'] and not (kwargs['batch'] or kwargs['channel'])):
+        parser.error('The --batch-workers flag can only be used with --batch or --channel.')
+    if(kwargs['mode'] == 'chatfile' and kwargs['platform']== None and not kwargs['batch']):
         parser.error('When reading from a chatfile, you must specify the platform the chatfile is from with --platform argument.')
         # TODO: Add description of this to the chatfile desc and add the actual platform arg itself
     if(kwargs['save_chatfile_output']):  
         if(kwargs['mode'] != 'url'):
             parser.error('The --save-chatfile-output flag can only be used in mode=\033[1m\'url\'\033[0m.')
-        if(not kwargs['save_chatfile_output'].endswith('.json')):
+        if(not kwargs['save_chatfile_output'].endswith('.json') and not (kwargs['batch'] or kwargs['channel'])): # (A directory in batch/channel mode)
             kwargs['save_chatfile_output'] += '.json'
-    if(kwargs['output']):
+    if(kwargs['resume'] and not kwargs['save_chatfile_output']):
+        parser.error('The --resume flag can only be used with --save-chatfile-output (the chatfile of the interrupted download).')
+    if(kwargs['download_workers'] > 1 and kwargs['mode'] != 'url'):
+        parser.error('The --download-workers flag can only be used in mode=\033[1m\'url\'\033[0m.')
+    if(kwargs['max_requests_per_second'] and kwargs['mode'] != 'url'):
+        parser.error('The --max-requests-per-second flag can only be used in mode=\033[1m\'url\'\033[0m.')
+    if(kwargs['response_cache'] and kwargs['mode'] != 'url'):
+        parser.error('The --response-cache flag can only be used in mode=\033[1m\'url\'\033[0m.')
+    if(kwargs['pipeline'] and kwargs['mode'] != 'url'):
+        parser.error('The --pipeline flag can only be used in mode=\033[1m\'url\'\033[0m.')
+    if(kwargs['engine'] == 'loop' and isinstance(kwargs['interval'], list) and len(set(kwargs['interval'])) > 1):
+        parser.error('The loop engine can only sample one interval at a time, use --engine=vectorized to sample several intervals.')
+    if(kwargs['output'] and not (kwargs['batch'] or kwargs['channel'])): # (A directory in batch/channel mode)
         if(not kwargs['output'].endswith('.json') and not kwargs['nojson']):
             kwargs['output'] += '.json'
     # TODO: Interval should not be allowed with mode = reanalyze (clarify again what reanalyze is for)
     # TODO: Low percentiles result in no highlights... why?
 
-    run(**kwargs)
+    if(kwargs['batch'] or kwargs['channel']):
+        entries = run_batch(**kwargs) if kwargs['batch'] else run_channel(**kwargs)
+        failed = [entry for entry in entries if entry['status']=='failed']
+        if(failed):
+            exit(1)
+    else:
+        run(**kwargs)
+
+
+
+def _print_rows(rows, columns):
+    """Print query results as a table of the given columns (times are printed as hh:mm:ss)"""
+    if(not rows):
+        print("No results")
+        return
+    table = [[seconds_to_time(row[column]) if column in ('startTime', 'endTime') else
+              f"{row[column]:.3f}" if isinstance(row[column], float) else str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in table)) for i, column in enumerate(columns)]
+    print("\033[1m"+"  ".join(column.ljust(width) for column, width in zip(columns, widths))+"\033[0m")
+    for line in table:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)))
+
+def query_main():
+    """
+    Entry point of chat_analyzer_query: queries (or adds output files to) an analytics store created with --store"""
+    parser = argparse.ArgumentParser(description="Query the analytics of many chatlogs at once, from an analytics store created with chat_analyzer --store.", formatter_class=SmartFormatter)
+    parser.prog = __program__+'_query'
+    parser.add_argument('--version', action='version', version=__version__)
+    parser.add_argument("store", type=str, help="Filepath of the analytics store")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON (with every field) instead of a table")
+    subparsers = parser.add_subparsers(dest="query", title="Queries", required=True)
+
+    metric_choices = list(dict.keys(METRIC_TO_MEDIA_FIELD))
+    def add_ranking_arguments(query_parser, metrics, default_metric):
+        query_parser.add_argument("--metric", "-m", default=default_metric, choices=metrics, type=str, help="The metric to rank by")
+        query_parser.add_argument("--limit", "-n", default=10, type=check_nonzero_positive_int, help="The number of results")
+        query_parser.add_argument("--last", type=check_nonzero_positive_int, help="Only rank the last LAST chatlogs added to the store")
+        query_parser.add_argument("--interval", "-i", type=check_interval, help="Only rank the chatlogs sampled at this interval (so samples of the same length are compared)")
+
+    samples_parser = subparsers.add_parser("samples", help="The samples with the highest value of a metric, across chatlogs", formatter_class=SmartFormatter)
+    add_ranking_arguments(samples_parser, metric_choices + list(RANKED_SAMPLE_FIELDS), metric_choices[0])
+    highlights_parser = subparsers.add_parser("highlights", help="The highlights with the highest peak/average/duration, across chatlogs", formatter_class=SmartFormatter)
+    add_ranking_arguments(highlights_parser, list(RANKED_HIGHLIGHT_FIELDS), RANKED_HIGHLIGHT_FIELDS[0])
+    streams_parser = subparsers.add_parser("streams", help="The chatlogs with the highest total/overall average of a metric", formatter_class=SmartFormatter)
+    add_ranking_arguments(streams_parser, metric_choices + list(RANKED_MEDIA_FIELDS), 'totalActivity')
+    scan_parser = subparsers.add_parser("scan", help="The samples of a chatlog within a time range", formatter_class=SmartFormatter)
+    scan_parser.add_argument("source", type=str, help="The source of the chatlog (its url or chatfile, as it was analyzed)")
+    scan_parser.add_argument("--start", type=check_positive_int, help="The start of the time range (in seconds). Defaults to the start of the chatlog")
+    scan_parser.add_argument("--end", type=check_positive_int, help="The end of the time range (in seconds). Defaults to the end of the chatlog")
+    scan_parser.add_argument("--interval", "-i", type=check_interval, help="The interval of the samples, if the chatlog was stored at several intervals. Defaults to the smallest")
+    add_parser = subparsers.add_parser("add", help="Add output files previously produced by this program to the store", formatter_class=SmartFormatter)
+    add_parser.add_argument("files", nargs='+', type=str, help="The output files to add")
 
+    args = parser.parse_args()
 
+    with AnalyticsStore(args.store) as store:
+        if(args.query == 'add'):
+            for filepath in args.files:
+                store.add(get_ChatAnalytics_from_file(filepath))
+                print(f"Added {filepath}")
+            return
+        try:
+            if(args.query == 'samples'):
+                rows = store.top_samples(args.metric, args.limit, args.last, args.interval)
+                columns = ['mediaTitle', 'startTime', 'endTime', METRIC_TO_FIELD.get(args.metric, args.metric), 'mediaSource']
+            elif(args.query == 'highlights'):
+                rows = store.top_highlights(args.metric, args.limit, args.last, args.interval)
+                columns = ['mediaTitle', 'startTime', 'endTime', 'peak', 'avg', 'type', 'mediaSource']
+            elif(args.query == 'streams'):
+                rows = store.top_media(args.metric, args.limit, args.last, args.interval)
+                columns = ['mediaTitle', 'interval', METRIC_TO_MEDIA_FIELD.get(args.metric, args.metric), 'mediaSource']
+            else:
+                if(args.start != None and args.end != None and args.start >= args.end):
+                    parser.error('The --start of the time range must be before its --end.')
+                rows = store.get_samples(args.source, args.start, args.end, args.interval)
+                columns = ['startTime', 'endTime', 'activity', 'chatMessages', 'uniqueUsers', 'avgUniqueUsersPerSecond']
+        except ValueError as exception:
+            parser.error(str(exception))
+
+    if(args.json):
+        print(json.dumps(rows, indent=4))
+    else:
+        _print_rows(rows, list(dict.fromkeys(columns)))
 
 
 # Some testing URLs
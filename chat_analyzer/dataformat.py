@@ -4,11 +4,15 @@ import logging
 
 from argparse import ArgumentTypeError
 from dataclasses import dataclass,field
+from dataclasses import fields as dataclass_fields
 from abc import ABC, abstractclassmethod
 from .chat_downloader.sites.common import Chat
 from typing import List
 
-from .chat_downloader.utils.core import seconds_to_time
+from .chat_downloader.utils.core import seconds_to_time, whole_seconds_to_time
+from .chatfile import ChatColumns
+from .sampler import sample_columns
+from .analysis import find_runs, max_of_runs, sum_of_runs, zscore_signals, local_maxima, prefix_sums, top_windows
 
 # The platforms we currently support downloading from.
 # Each has a corresponding ChatAnalytics/Sample extension with site-specific behavior
@@ -33,6 +37,10 @@ METRIC_TO_FIELD = {
     "usersPSec" : "avgUniqueUsersPerSecond",
 }
 
+SPIKE_ALGORITHMS = ["zscore", "localmax"]
+# The number of standard deviations above the baseline a sample must be to be a spike, at spike_sensitivity=1 (divided by the sensitivity)
+SPIKE_BASE_THRESHOLD = 3.0
+
 @dataclass
 class ProcessSettings():
     """
@@ -48,6 +56,20 @@ class ProcessSettings():
         The metric to use for engagement analysis to build highlights. NOTE: must be converted into actual Sample field name before use.
     spike_sensitivity: float 
         How sensitive the spike detector is at picking up spikes. Higher sensitivity means more spikes are detected.
+    spike_metric: str
+        The metric to detect spikes in. NOTE: must be converted into actual Sample field name before use.
+    spike_algorithm: str
+        The spike detection algorithm, one of SPIKE_ALGORITHMS
+    spike_lag: int
+        The number of preceding samples that a sample is compared to (the baseline) when detecting spikes
+    spike_influence: float
+        (zscore algorithm) The weight (0-1) of spiking samples in the baseline of the following samples
+    engagement_metric: str
+        The metric to rank the engagement windows by. NOTE: must be converted into actual Sample field name before use.
+    engagement_windows: list[int]
+        The lengths (in seconds) of the engagement windows to find
+    engagement_count: int
+        The number of (non-overlapping) engagement windows to find for every window length
 
     """
     # Processing (Sampling) Arguments
@@ -57,6 +79,13 @@ class ProcessSettings():
     highlight_percentile: float
     highlight_metric: str
     spike_sensitivity: float
+    spike_metric: str
+    spike_algorithm: str
+    spike_lag: int
+    spike_influence: float
+    engagement_metric: str
+    engagement_windows: list
+    engagement_count: int
 
 
 # NOTE: Yes CamelCased fields in the dataclasses are unpythonic, but the primary intention is to convert these dataclasses into JSON objects and it is one less step to handle then!
@@ -98,12 +127,12 @@ class Sample():
         because not all sites (YT/Twitch) provide information on whether chat was sent by a registered bot or not.
     firstTimeChatters: int
         The total number of users who sent their first message of the whole stream during this sample interval
+    uniqueUsers: int
+        The total number of unique users that sent a chat message across this sample interval
 
 
     **[Defined w/ default and modified AFTER analysis of sample]**:
     
-    uniqueUsers: int
-        The total number of unique users that sent a chat message across this sample interval (len(self._userChats))
     avgActivityPerSecond: float
         The average activity per second across this sample interval. (activity/sampleDuration)
     avgChatMessagesPerSecond: float
@@ -126,16 +155,13 @@ class Sample():
     activity: int = 0 
     chatMessages: int = 0
     firstTimeChatters: int = 0
+    uniqueUsers: int = 0
 
     # Defined w/ default and modified AFTER analysis of sample
-    uniqueUsers: int = 0
     avgActivityPerSecond: float = 0
     avgChatMessagesPerSecond: float = 0
     avgUniqueUsersPerSecond: float = 0
 
-    # Internal Fields used for calculation but are #NOTE: NOT EXPORTED during json dump (deleted @ post_process)
-    _userChats: dict = field(default_factory=dict) # author['id'] -> numChats for current sample
-
     def __post_init__(self):
             self.startTime_text = seconds_to_time(self.startTime)
             self.endTime_text = seconds_to_time(self.endTime)
@@ -145,20 +171,19 @@ class Sample():
         """
         After we have finished adding messages to a particular sample (moving on to the next sample),
         we call sample_post_process() to process the cumulative data points (so we don't have to do this every time we add a message)
-
-        Also removes the internal fields that don't need to be output in the JSON object.
-
         """
-        self.uniqueUsers = len(self._userChats)
+        self.calculate_averages()
 
+    def calculate_averages(self):
+        """
+        Calculates the per-second averages of the sample from its (final) counts.
+        """
         if self.sampleDuration > 0:
             self.avgActivityPerSecond = self.activity/self.sampleDuration
             self.avgChatMessagesPerSecond = self.chatMessages/self.sampleDuration
             self.avgUniqueUsersPerSecond = self.uniqueUsers/self.sampleDuration
         else:
             logging.warning(f"Sample was created with duration < 0 (duration: {self.sampleDuration}): {self}")
-
-        self._userChats.clear()
 @dataclass
 class TwitchSample(Sample):
     """
@@ -197,7 +222,231 @@ class YoutubeSample(Sample):
     # Defined w/ default and modified DURING analysis of sample
     superchats: int = 0
     memberships: int = 0
-    
+
+
+# Sample fields holding times, exported as ints when they are whole numbers (like the sample boundaries: 0, 5, 10, ...)
+_SAMPLE_TIME_FIELDS = {'startTime', 'endTime', 'sampleDuration'}
+def _time_value(t: float):
+    """Times read from NumPy columns are floats, whole numbers are given back as ints (as they were before being stored)"""
+    return int(t) if t.is_integer() else t
+
+def seconds_to_time_array(seconds) -> list:
+    """
+    Format a whole array of times (ex: a column of sample times) like seconds_to_time.
+    Times are truncated to whole seconds at once, and each distinct time is only formatted once.
+
+    :param seconds: The times, in seconds
+    :type seconds: np.ndarray
+    :returns: The timestamp text of each time
+    :rtype: list[str]
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    if(seconds.size == 0):
+        return []
+    whole_seconds, inverse = np.unique(np.abs(np.trunc(seconds)).astype(np.int64), return_inverse=True)
+    texts = np.array([whole_seconds_to_time(t) for t in whole_seconds.tolist()], dtype=object)[inverse.reshape(-1)]
+    negative = seconds < 0
+    if(negative.any()):
+        texts[negative] = '-' + texts[negative]
+    return texts.tolist()
+
+# Per-second averages of a sample -> the count they are calculated from
+_SAMPLE_AVERAGE_FIELDS = {
+    'avgActivityPerSecond': 'activity',
+    'avgChatMessagesPerSecond': 'chatMessages',
+    'avgUniqueUsersPerSecond': 'uniqueUsers',
+}
+# NumPy types used to store the sample fields in a SampleTable
+_SAMPLE_FIELD_DTYPES = {
+    int: np.int32,
+    float: np.float64,
+}
+
+class SampleTable():
+    """
+    Memory-compact store of the samples of a chatlog (struct-of-arrays).
+
+    Every (exported) field of the sample type is kept as a typed NumPy column indexed by sample number, instead of
+    keeping one Sample dataclass instance per sample. Fields that can be derived from other fields are not stored at all:
+    text fields (startTime_text, endTime_text) are rendered from the corresponding time field when the samples are exported,
+    and sampleDuration & the per-second averages are calculated from the times and counts when they are read.
+
+    For compatibility, indexing/iterating the table gives SampleView objects that read/write the columns like a Sample would.
+    Whole columns can be read directly with column().
+
+    ---
+
+    sample_type: type
+        The Sample (sub)class whose fields are stored (Sample, YoutubeSample or TwitchSample)
+    """
+
+    def __init__(self, sample_type: type = Sample):
+        self.sample_type = sample_type
+        self.field_names = [] # All exported fields, in the order of the dataclass fields
+        self.text_fields = {} # text field -> the time field it is rendered from
+        self._columns = {} # stored field -> column (the first len(self) entries are used, the rest is spare capacity)
+        self._size = 0
+
+        for f in dataclass_fields(sample_type):
+            if(f.name.startswith('_')):
+                continue # Internal fields are not exported
+            self.field_names.append(f.name)
+            if(f.name.endswith('_text')):
+                self.text_fields[f.name] = f.name[:-len('_text')]
+            elif(f.name != 'sampleDuration' and f.name not in _SAMPLE_AVERAGE_FIELDS):
+                self._columns[f.name] = np.zeros(0, dtype=_SAMPLE_FIELD_DTYPES[f.type])
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index: int):
+        if(index < 0):
+            index += self._size
+        if(not 0 <= index < self._size):
+            raise IndexError('sample index out of range')
+        return SampleView(self, index)
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield SampleView(self, index)
+
+    def column(self, field_name: str) -> np.ndarray:
+        """The values of a (non-text) field for every sample, as a NumPy array.
+        (A view of the stored column, or a new array for derived fields)"""
+        if(field_name in self._columns):
+            return self._columns[field_name][:self._size]
+        if(field_name == 'sampleDuration'):
+            return self.column('endTime') - self.column('startTime')
+        if(field_name in _SAMPLE_AVERAGE_FIELDS):
+            # Same as Sample.calculate_averages, samples without a (positive) duration have an average of 0
+            duration = self.column('sampleDuration')
+            return np.divide(self.column(_SAMPLE_AVERAGE_FIELDS[field_name]), duration, out=np.zeros(self._size), where=duration > 0)
+        raise KeyError(field_name)
+
+    def get_value(self, field_name: str, index: int):
+        """The value of a (non-text) field of a single sample"""
+        if(field_name in _SAMPLE_TIME_FIELDS):
+            return _time_value(self._get_time(field_name, index))
+        if(field_name in self._columns):
+            return self._columns[field_name][index].item()
+        if(field_name in _SAMPLE_AVERAGE_FIELDS):
+            duration = self._get_time('sampleDuration', index)
+            return self._columns[_SAMPLE_AVERAGE_FIELDS[field_name]][index].item()/duration if duration > 0 else 0.0
+        raise KeyError(field_name)
+
+    def _get_time(self, field_name: str, index: int) -> float:
+        if(field_name == 'sampleDuration'):
+            return (self._columns['endTime'][index] - self._columns['startTime'][index]).item()
+        return self._columns[field_name][index].item()
+
+    def _reserve(self, capacity: int):
+        """Grow the columns so they can hold at least 'capacity' samples"""
+        old_capacity = len(next(iter(self._columns.values())))
+        if(capacity <= old_capacity):
+            return
+        new_capacity = max(capacity, 2*old_capacity, 64)
+        for field_name, column in self._columns.items():
+            new_column = np.zeros(new_capacity, dtype=column.dtype)
+            new_column[:self._size] = column[:self._size]
+            self._columns[field_name] = new_column
+
+    def append(self, sample: Sample):
+        """Append a (finished) sample to the table"""
+        self._reserve(self._size + 1)
+        for field_name, column in self._columns.items():
+            column[self._size] = getattr(sample, field_name)
+        self._size += 1
+
+    def trim(self):
+        """Release the spare capacity of the columns (once no more samples will be appended)"""
+        for field_name, column in self._columns.items():
+            self._columns[field_name] = column[:self._size].copy()
+
+    def set_columns(self, num_samples: int, columns: dict):
+        """
+        Replace the contents of the table with num_samples samples, whose values are provided as whole columns.
+        Fields without a provided column are set to 0. (Provided columns of derived fields are ignored)
+
+        :param num_samples: The number of samples
+        :type num_samples: int
+        :param columns: field -> the value of that field for every sample
+        :type columns: dict[str, np.ndarray]
+        """
+        for field_name, column in self._columns.items():
+            new_column = np.zeros(num_samples, dtype=column.dtype)
+            if(field_name in columns):
+                new_column[:] = columns[field_name]
+            self._columns[field_name] = new_column
+        self._size = num_samples
+
+    def check_durations(self):
+        """
+        Warns about samples without a (positive) duration, whose averages can't be calculated (see Sample.calculate_averages)
+        """
+        duration = self.column('sampleDuration')
+        for index in np.flatnonzero(duration <= 0):
+            logging.warning(f"Sample was created with duration < 0 (duration: {duration[index]}): {self[index]}")
+
+    def to_records(self) -> list:
+        """
+        The samples as a list of dicts (one per sample, with every exported field of the sample type in order), for JSON export.
+        """
+        values = {}
+        for field_name in self.field_names:
+            if(field_name in self.text_fields):
+                values[field_name] = seconds_to_time_array(self.column(self.text_fields[field_name]))
+            elif(field_name in _SAMPLE_TIME_FIELDS):
+                values[field_name] = [_time_value(t) for t in self.column(field_name).tolist()]
+            else:
+                values[field_name] = self.column(field_name).tolist()
+
+        columns = [values[field_name] for field_name in self.field_names]
+        return [dict(zip(self.field_names, row)) for row in zip(*columns)]
+
+    @staticmethod
+    def from_records(sample_type: type, records: list):
+        """
+        Create a table from samples previously exported with to_records (i.e. read back from an output file).
+        Unknown fields (and text fields, which are rendered on export) are ignored.
+
+        :param sample_type: The Sample (sub)class whose fields are stored
+        :type sample_type: type
+        :param records: The exported samples
+        :type records: list[dict]
+        """
+        table = SampleTable(sample_type)
+        table.set_columns(len(records), {field_name: [record.get(field_name, 0) for record in records] for field_name in table._columns})
+        return table
+
+class SampleView():
+    """
+    A single sample of a SampleTable, read/written through the fields of the table like a Sample object.
+    Views are created on demand and hold no data themselves.
+    """
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: SampleTable, index: int):
+        object.__setattr__(self, '_table', table)
+        object.__setattr__(self, '_index', index)
+
+    def __getattr__(self, name):
+        table = self._table
+        if(name in table.text_fields):
+            return seconds_to_time(table.get_value(table.text_fields[name], self._index))
+        try:
+            return table.get_value(name, self._index)
+        except KeyError:
+            raise AttributeError(f"'{table.sample_type.__name__}' has no attribute '{name}'") from None
+
+    def __setattr__(self, name, value):
+        table = self._table
+        if(name not in table._columns):
+            raise AttributeError(f"'{table.sample_type.__name__}' has no settable attribute '{name}' (it is derived from the other fields)")
+        table._columns[name][self._index] = value
+
+    def __repr__(self):
+        return f"{self._table.sample_type.__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self._table.field_names)})"
+
 
 @dataclass
 class Section():
@@ -263,18 +512,69 @@ class Highlight(Section):
     peak: float
     avg: float
 
+@dataclass
 class Spike(Section):
     """
-    Contains information about an activity spike in the chatlog
+    Spikes reference a sudden increase of the provided metric, relative to the samples preceding it (the baseline).
+    
+    ---
+
+    type: str
+        The metric the spike was detected in. i.e. "avgActivityPerSecond", "avgChatMessagesPerSecond", "avgUniqueUsersPerSecond", etc.
+        NOTE: It is stored as its converted value (the name of the actual field), NOT the metric str the user provided in the CLI.
+    algorithm: str
+        The algorithm that detected the spike, one of SPIKE_ALGORITHMS ("zscore": may last for multiple samples, "localmax": always a single sample)
+    peak: float
+        The maximum value of the metric throughout the whole Spike (among the samples in the Spike).
+    avg: float
+        The average value of the metric throughout the whole Spike (among the samples in the Spike).
+    baseline: float
+        The average value of the metric in the samples preceding the Spike.
     
-    TODO: Implement
+    """
+    type: str
+    algorithm: str
+    peak: float
+    avg: float
+    baseline: float
+
+@dataclass
+class EngagementSection(Section):
+    """
+    Engagement sections reference the most engaging periods of a fixed length (i.e. the best 1, 5, 10 minutes) of the chatlog,
+    ranked by the average value of the provided metric.
 
     ---
-    ...
+
+    type: str
+        The engagement metric. i.e. "avgActivityPerSecond", "avgChatMessagesPerSecond", "avgUniqueUsersPerSecond", etc.
+        NOTE: It is stored as its converted value (the name of the actual field), NOT the metric str the user provided in the CLI.
+    window: int
+        The requested length (in seconds) of the section. NOTE: the actual duration is a whole number of samples, so may differ slightly.
+    rank: int
+        The rank of the section among the sections of the same window length (1 is the most engaging)
+    peak: float
+        The maximum value of the engagement metric throughout the whole section (among the samples in the section).
+    avg: float
+        The average value of the engagement metric throughout the whole section (among the samples in the section).
+
     """
-    # TODO: Implement
+    type: str
+    window: int
+    rank: int
+    peak: float
+    avg: float
 
 
+def to_json_default(o):
+    """
+    Converts the objects of the analytics data into something JSON serializable (used as json.dumps' default).
+    Internal fields (starting with '_') are not exported.
+    """
+    if(isinstance(o, SampleTable)):
+        return o.to_records()
+    return {k: v for k, v in o.__dict__.items() if not k.startswith('_')}
+
 @dataclass
 class ChatAnalytics(ABC):
     """
@@ -327,9 +627,10 @@ class ChatAnalytics(ABC):
         The title of the media associated with the chatlog.
     mediaSource: str
         The link to the media associated with the chatlog (url that it was origianlly downloaded from or filepath of a chatfile).
-    samples: List[Sample]
+    samples: SampleTable
         An array of sequential samples, each corresponding to data about a section of chat of 'interval' seconds long.
         Each sample has specific data corresponding to a time interval of the vid. See the 'Sample' class
+        (Stored column-wise in a SampleTable, indexing/iterating it gives views that behave like Sample objects)
     totalActivity: int
         The total number of messages/things (of any type!) that appeared in chat. (Sum of intervalActivity from all samples) 
         Includes messages,notifications,subscriptions, superchats, . . . *anything* that appeared in chat
@@ -359,8 +660,25 @@ class ChatAnalytics(ABC):
     highlights_duration_text: str
         The cumulative duration of the highlights represented in text format (i.e. hh:mm:ss)
     spikes: List[Spike]
-        Not yet implemented TODO
         A list of the calculated spikes in the chatlog. May contain spikes of different types, identifiable by the spike's type field.
+    spike_sensitivity: float
+        How sensitive the spike detector was at picking up spikes
+    spike_metric: str
+        The metric spikes were detected in
+    spike_algorithm: str
+        The spike detection algorithm
+    spike_lag: int
+        The number of preceding samples that a sample was compared to when detecting spikes
+    spike_influence: float
+        (zscore algorithm) The weight of spiking samples in the baseline of the following samples
+    engagement_sections: List[EngagementSection]
+        The most engaging (non-overlapping) sections of every requested window length, ordered by window length then rank.
+    engagement_metric: str
+        The metric the engagement sections were ranked by
+    engagement_windows: List[int]
+        The requested window lengths (in seconds)
+    engagement_count: int
+        The (maximum) number of engagement sections per window length
     """
     # Defined when class Initialized
     duration: float
@@ -377,7 +695,7 @@ class ChatAnalytics(ABC):
     mediaTitle: str = 'No Media Title'
     mediaSource: str = 'No Media Source'
 
-    samples: List[Sample] = field(default_factory=list)
+    samples: SampleTable = None # Created on post-init (the type of the samples depends on the platform)
 
     totalActivity: int = 0
     totalChatMessages: int = 0
@@ -392,18 +710,32 @@ class ChatAnalytics(ABC):
     highlights_duration_text: str = ''
     highlight_percentile: float = 0
     highlight_metric: str = ''
-    spikes: List[Spike] = field(default_factory=list) # TODO: Not implemented yet
+    spikes: List[Spike] = field(default_factory=list)
+    spike_sensitivity: float = 0
+    spike_metric: str = ''
+    spike_algorithm: str = ''
+    spike_lag: int = 0
+    spike_influence: float = 0
+    engagement_sections: List[EngagementSection] = field(default_factory=list)
+    engagement_metric: str = ''
+    engagement_windows: List[int] = field(default_factory=list)
+    engagement_count: int = 0
 
     # Internal Fields used for calculation but are #NOTE: NOT EXPORTED during json dump (deleted @ post_process)
-    _overallUserChats: dict = field(default_factory=dict) # author['id'] -> numChats for full duration
+    _authorIndices: dict = field(default_factory=dict) # author['id'] -> author index (dense int, in order of first chat), interned once per author
+    _authorLastSample: list = field(default_factory=list) # author index -> index of the last sample the author chatted in
     _currentSample: Sample = None # field(default_factory=None)
+    _currentSampleIndex: int = -1 # The index the current sample will have in the samples
 
     # Constants (not dumped in json)
     _txt_msg_types = {'text_message'} # Messages we just consider regular text_message
+    _counted_msg_types = {} # Site-specific counts. sample field -> (ChatAnalytics total field, message types that are counted)
 
     def __post_init__(self):
         self.duration_text = seconds_to_time(self.duration)
         self.interval_text = seconds_to_time(self.interval)
+        if(self.samples == None):
+            self.samples = SampleTable(self.get_sample_type())
     
     def create_new_sample(self):
         """
@@ -418,33 +750,53 @@ class ChatAnalytics(ABC):
         # We need a new sample, process the last one and create a new sample
         new_sample_start_time = 0 # NOTE: Some chatlogs have chats that start at negative time samples. (Presumably chats right before the video starts). We ignore these for now
         if(self._currentSample != None):
-            # process the last sample before creating new one (should have already been appended on creation)
-            self._currentSample.sample_post_process()
+            # process the last sample and store it before creating new one
             new_sample_start_time = self._currentSample.endTime
+            self.flush_current_sample()
         
         # New sample end time will not extend past the length of the video
         new_sample_end_time = min(new_sample_start_time + self.interval, self.duration)
 
+        # NOTE: Only the sample currently being built is a full Sample object, finished samples are stored in the (compact) SampleTable
+        self._currentSample = self.get_sample_type()(startTime=new_sample_start_time, endTime=new_sample_end_time)
+        self._currentSampleIndex = len(self.samples)
+
+    def flush_current_sample(self):
+        """
+        Post-processes the sample currently being built and appends it to the samples.
+        """
+        self._currentSample.sample_post_process()
+        self.samples.append(self._currentSample)
+        self._currentSample = None
+
+    def get_sample_type(self) -> type:
+        """The type of sample corresponding to the platform of the chatlog"""
         if(self.platform==YOUTUBE_NETLOC or self.platform==YOUTUBE_SHORT_NETLOC):
-            self._currentSample = YoutubeSample(startTime=new_sample_start_time, endTime=new_sample_end_time)
+            return YoutubeSample
         elif(self.platform==TWITCH_NETLOC):
-            self._currentSample = TwitchSample(startTime=new_sample_start_time, endTime=new_sample_end_time)
+            return TwitchSample
         else:
             # If we have arrived here, we assume we support the platform but it has no sample-specific concerns
-            self._currentSample = Sample(startTime=new_sample_start_time, endTime=new_sample_end_time)
+            return Sample
 
-        self.samples.append(self._currentSample)
+    def process_message(self, msg) -> bool:
+        """Given a msg object from chat, update appropriate statistics based on the chat
 
-    def process_message(self, msg):
-        """Given a msg object from chat, update appropriate statistics based on the chat"""
+        :returns: Whether the message was counted (False if it was ignored)
+        :rtype: bool
+        """
 
         msg_time_in_seconds = msg['time_in_seconds']
 
-        if(msg_time_in_seconds < 0 or msg_time_in_seconds > self.duration):
-            return # If the message comes before or after the duration of associated media, ignore the msg and don't process it
+        if(not (0 <= msg_time_in_seconds <= self.duration)):
+            return False # If the message comes before or after the duration of associated media (or has no time), ignore the msg and don't process it
 
-        # Before processing the msg, make sure that msg belongs with the current sample
-        if(self._currentSample == None or msg_time_in_seconds >= self._currentSample.endTime):
+        # Before processing the msg, make sure that msg belongs with the current sample.
+        # If there was no chat for a while, create the (empty) samples in between as well.
+        # NOTE: A msg at exactly the end of the media belongs to the last sample (which ends at self.duration)
+        if(self._currentSample == None):
+            self.create_new_sample()
+        while(msg_time_in_seconds >= self._currentSample.endTime and self._currentSample.endTime < self.duration):
             self.create_new_sample()
 
         # Every type of message contributes to total activity
@@ -458,30 +810,131 @@ class ChatAnalytics(ABC):
             if 'author' in msg:
                 author = msg['author']
                 authID = author['id']
-                if authID in self._overallUserChats:
-                    self._overallUserChats[authID] = self._overallUserChats[authID] + 1
-                else:
-                    self._overallUserChats[authID] = 1
+                author_indices = self._authorIndices
+                author_index = author_indices.get(authID)
+                if author_index is None:
+                    # First chat of this user
+                    author_index = len(author_indices)
+                    author_indices[authID] = author_index
+                    self._authorLastSample.append(-1)
                     self._currentSample.firstTimeChatters += 1
 
                 # keeps track of unique user per *sample*
-                self._currentSample._userChats[authID] = self._currentSample._userChats[authID] + 1 if authID in self._currentSample._userChats else 1
+                author_last_sample = self._authorLastSample
+                if author_last_sample[author_index] != self._currentSampleIndex:
+                    author_last_sample[author_index] = self._currentSampleIndex
+                    self._currentSample.uniqueUsers += 1
 
-    # def get_engagement_sections(self):
-    #     # Use a two pointer approach to find the start and end of each engagement section
-    #     # (1 min, 5 min, 10 min, highest engagement, or smth like that)
-    #     raise NotImplementedError
-    def get_spikes(self, spike_sensitivity, spike_metric):
+        return True
+
+    def get_engagement_sections(self, engagement_metric: str, engagement_windows: List[int], engagement_count: int):
         """
-        A spike is a point in the chatlog where from one sample to the next, there is a sharp increase in the provided metric.
+        Find the 'engagement_count' most engaging non-overlapping sections of every window length (i.e. the best 1, 5, 10 minutes),
+        ranked by the average value of the provided metric over the samples of the section.
+
+        A window length is rounded to a whole number of samples, window lengths longer than the chatlog are skipped.
+
+        The prefix sums of the metric are computed once and shared by all window lengths, so every window sum is O(1)
+        and the sections of a window length are found in O(n log n) (see analysis.top_windows).
+
+        This method should only be called after the averages have been calculated.
 
-        ...? Are spikes sustained or..?
-        ?:
-        A spike is a point in the chatlog where the activity is significantly different from the average activity.
-        Activity is significantly different if it is > avg*SPIKE_MULT_THRESHOLD.
-        We detect a spike if the high activity level is maintained for at least SPIKE_SUSTAIN_REQUIREMENT # of samples.
-        """    
-        raise NotImplementedError
+        :param engagement_metric: The metric the sections are ranked by. NOTE: Internally converted to the actual field name of a sample field.
+        :type engagement_metric: str
+        :param engagement_windows: The lengths (in seconds) of the sections
+        :type engagement_windows: List[int]
+        :param engagement_count: The (maximum) number of sections to find for every window length
+        :type engagement_count: int
+        :return: the engagement sections, ordered by window length then rank
+        :rtype: List[EngagementSection]
+        """
+        field_to_use = METRIC_TO_FIELD[engagement_metric]
+        field_values = self.samples.column(field_to_use)
+        prefix = prefix_sums(field_values)
+        start_times = self.samples.column('startTime')
+        end_times = self.samples.column('endTime')
+
+        sections: List[EngagementSection] = []
+        for window in sorted(set(engagement_windows)):
+            window_samples = max(round(window/self.interval), 1)
+            starts = top_windows(prefix, window_samples, engagement_count)
+            ends = starts + window_samples
+            peaks = max_of_runs(field_values, starts, ends).tolist()
+            # (Summed directly rather than from the prefix sums, whose differences accumulate rounding errors over long chatlogs)
+            avgs = (sum_of_runs(field_values, starts, ends) / window_samples).tolist()
+            for rank, (start, end, peak, avg) in enumerate(zip(starts.tolist(), ends.tolist(), peaks, avgs), start=1):
+                sections.append(EngagementSection(
+                    startTime=_time_value(start_times[start].item()),
+                    endTime=_time_value(end_times[end-1].item()),
+                    peak=peak,
+                    avg=avg,
+                    type=field_to_use,
+                    window=window,
+                    rank=rank,
+                    description=f"#{rank} most engaging {seconds_to_time(window)} by {field_to_use}"))
+
+        return sections
+
+    def get_spikes(self, spike_metric: str, spike_sensitivity: float, spike_algorithm: str, spike_lag: int, spike_influence: float):
+        """
+        A spike is a sudden increase of the provided metric, relative to the 'spike_lag' samples preceding it (the baseline).
+        A sample spikes if it is more than SPIKE_BASE_THRESHOLD/spike_sensitivity standard deviations above its baseline.
+
+        Two algorithms are available (see analysis.zscore_signals and analysis.local_maxima):
+            - 'zscore': smoothed z-score detection. Contiguous spiking samples make up a single spike, spiking samples only
+              have 'spike_influence' weight in the baseline of the following samples (so sustained activity still stands out for a while).
+            - 'localmax': a spike is a single sample that is also the maximum of the 'spike_lag' samples on either side of it.
+
+        Both run over the whole metric column in a single pass, so this is cheap enough to redo on every reanalysis.
+
+        This method should only be called after the averages have been calculated.
+
+        :param spike_metric: The metric to detect spikes in. NOTE: Internally converted to the actual field name of a sample field.
+        :type spike_metric: str
+        :param spike_sensitivity: How sensitive the detector is, higher sensitivity means more spikes are detected
+        :type spike_sensitivity: float
+        :param spike_algorithm: The spike detection algorithm, one of SPIKE_ALGORITHMS
+        :type spike_algorithm: str
+        :param spike_lag: The number of preceding samples that the baseline is computed from
+        :type spike_lag: int
+        :param spike_influence: (zscore algorithm) The weight (0-1) of spiking samples in the baseline of the following samples
+        :type spike_influence: float
+        :return: a list of the spikes in the provided metric
+        :rtype: List[Spike]
+        """
+        field_to_use = METRIC_TO_FIELD[spike_metric]
+        field_values = self.samples.column(field_to_use)
+        threshold = SPIKE_BASE_THRESHOLD/spike_sensitivity
+
+        if(spike_algorithm == 'zscore'):
+            signals, baselines = zscore_signals(field_values, spike_lag, threshold, spike_influence)
+            run_starts, run_ends = find_runs(signals == 1) # Only increases are spikes
+        elif(spike_algorithm == 'localmax'):
+            is_peak, baselines = local_maxima(field_values, spike_lag, threshold)
+            run_starts = np.flatnonzero(is_peak)
+            run_ends = run_starts + 1
+        else:
+            raise ValueError(f"Unknown spike algorithm '{spike_algorithm}', expected one of {SPIKE_ALGORITHMS}")
+
+        peaks = max_of_runs(field_values, run_starts, run_ends).tolist()
+        avgs = (sum_of_runs(field_values, run_starts, run_ends) / (run_ends - run_starts)).tolist()
+        start_baselines = baselines[run_starts].tolist()
+        start_times = self.samples.column('startTime')[run_starts].tolist()
+        end_times = self.samples.column('endTime')[run_ends - 1].tolist()
+
+        spikes: List[Spike] = []
+        for start_time, end_time, peak, avg, baseline in zip(start_times, end_times, peaks, avgs, start_baselines):
+            spikes.append(Spike(
+                startTime=_time_value(start_time),
+                endTime=_time_value(end_time),
+                peak=peak,
+                avg=avg,
+                baseline=baseline,
+                type=field_to_use,
+                algorithm=spike_algorithm,
+                description=f"{field_to_use} more than {threshold:g} standard deviations above the preceding {spike_lag} samples"))
+
+        return spikes
 
     def get_highlights(self, highlight_metric: str, highlight_percentile: float):
         """
@@ -490,6 +943,7 @@ class ChatAnalytics(ABC):
         the highlight_percentile for contiguous period of time of the referenced samples.
 
         A highlight may reference more than one sample if contiguous samples meet the percentile cutoff.
+        The runs of contiguous samples are found over the whole metric column at once (see analysis.find_runs).
 
         Samples in the top 'percentile'% of the selected engagement metric will be considered high-engagement samples and included in the highlights output list. 
         The larger the percentile, the greater the metric requirement before being reported. If 'engagement-percentile'=93.0, any sample in the 93rd percentile (top 7.0%%) of the selected metric will be considered an engagement highlight.
@@ -507,53 +961,29 @@ class ChatAnalytics(ABC):
         :rtype: List[Highlight]
         """        
 
-        highlights: List[Highlight] = []
-
         field_to_use = METRIC_TO_FIELD[highlight_metric]
 
         # In order to calculate the percentile cutoff, we have to do two passes. 
         # First to calculate the cutoff, second to find the samples that meet the cutoff.
-        field_values = [getattr(s, field_to_use) for s in self.samples]
+        field_values = self.samples.column(field_to_use)
         percentile_value_cutoff = np.percentile(field_values, [highlight_percentile])
 
-        _firstSample: Sample = None
-        _lastSample: Sample = None
-        _peak: float = 0
-        _avg: float = 0
-        _num_samples_in_highlight: int = 0
-
-        for sample in self.samples:
-            if(getattr(sample, field_to_use) >= percentile_value_cutoff):
-                _num_samples_in_highlight += 1
-                # If first sample is not null set first sample to current sample
-                if(_firstSample == None):
-                    _firstSample = sample
-                # TODO: Bugcheck _peak on summit's 14hr and ensure there is exactly 1 highlight w peak of 11 (highlight startTime: 31590, endTime: 31700)
-                _peak = max(_peak, getattr(sample, field_to_use)) # peak = max of the current peak and the current sample's activity
-                _avg += getattr(sample, field_to_use) # average calculated right before highlight constructed
-                # Set the last sample to the current sample
-                _lastSample = sample
-            else:
-                # We are either finished with a highlight, or we are not in a highlight
-                # If we were building a highlight, append the highlight to the highlight list and reset internal variables
-                if(_firstSample != None):
-                    if(_avg!=0):
-                        _avg /= _num_samples_in_highlight
-                    highlight = Highlight(
-                        startTime=_firstSample.startTime,
-                        endTime=_lastSample.endTime, 
-                        peak=_peak, 
-                        avg=_avg, 
-                        type=field_to_use, 
-                        description=f"{field_to_use} sustained at or above {percentile_value_cutoff}")
-                    highlights.append(highlight)
-                    self.highlights_duration += highlight.duration
-                    # Reset calculation vals for the next highlight
-                    _firstSample = None
-                    _lastSample = None
-                    _peak = 0
-                    _avg = 0
-                    _num_samples_in_highlight = 0
+        # Each run of contiguous samples that meet the cutoff is a highlight
+        run_starts, run_ends = find_runs(field_values >= percentile_value_cutoff[0])
+        peaks = max_of_runs(field_values, run_starts, run_ends).tolist()
+        avgs = (sum_of_runs(field_values, run_starts, run_ends) / (run_ends - run_starts)).tolist()
+        start_times = self.samples.column('startTime')[run_starts].tolist()
+        end_times = self.samples.column('endTime')[run_ends - 1].tolist()
+
+        highlights: List[Highlight] = []
+        for start_time, end_time, peak, avg in zip(start_times, end_times, peaks, avgs):
+            highlights.append(Highlight(
+                startTime=_time_value(start_time),
+                endTime=_time_value(end_time),
+                peak=peak,
+                avg=avg,
+                type=field_to_use,
+                description=f"{field_to_use} sustained at or above {percentile_value_cutoff}"))
 
         return highlights
 
@@ -572,11 +1002,18 @@ class ChatAnalytics(ABC):
         print(f"\nDownloaded & Processed {self.totalActivity} messages.")
         print("Post-processing (Analyzing)...")
 
-        self.totalUniqueUsers = len(self._overallUserChats)
+        if(self._authorIndices): # Empty if the chat was not sampled message by message (vectorized engine, or reanalyzing a file)
+            self.totalUniqueUsers = len(self._authorIndices)
 
         self.highlight_percentile = settings.highlight_percentile
         self.highlight_metric = settings.highlight_metric
 
+        # Process and store the final sample from the currentSample field
+        # NOTE: Has to happen before the overall averages, which include the final sample
+        if(self._currentSample): # Won't exist if we read in the obj from a file with it missing already
+            self.flush_current_sample()
+            self.samples.trim()
+
         # NOTE: We calculate actualDuration because if the analyzer is stopped before processing all samples, the duration of the samples does not correspond to the media length
         # This is an unusual case, generally only important when testing, but also keeps in mind future extensibility
         actualDuration = (len(self.samples)-1)*self.interval
@@ -585,22 +1022,26 @@ class ChatAnalytics(ABC):
         self.overallAvgActivityPerSecond = self.totalActivity/actualDuration
         self.overallAvgChatMessagesPerSecond = self.totalChatMessages/actualDuration
         # Need to calculate unique users per second based on sample unique users, totalUniqueUsers/duration doesn't tell us what we want to know
-        self.overallAvgUniqueUsersPerSecond =  sum(s.avgUniqueUsersPerSecond for s in self.samples)/len(self.samples) 
-
-        # Process and remove the final sample from the currentSample field
-        if(self._currentSample): # Won't exist if we read in the obj from a file with it missing already
-            self._currentSample.sample_post_process()
+        self.overallAvgUniqueUsersPerSecond =  sum(self.samples.column('avgUniqueUsersPerSecond').tolist())/len(self.samples) 
 
         # Highlights & Spikes are determined after the final averages have been calculated
         self.highlights = self.get_highlights(settings.highlight_metric, settings.highlight_percentile)
+        self.highlights_duration = sum(highlight.duration for highlight in self.highlights)
         self.highlights_duration_text = seconds_to_time(self.highlights_duration)
-        # self.spikes = self.get_spikes('avgUniqueUsersPerSecond', settings.spike_percentile) #TODO: Implement spikes
+        self.spike_sensitivity = settings.spike_sensitivity
+        self.spike_metric = settings.spike_metric
+        self.spike_algorithm = settings.spike_algorithm
+        self.spike_lag = settings.spike_lag
+        self.spike_influence = settings.spike_influence
+        self.spikes = self.get_spikes(settings.spike_metric, settings.spike_sensitivity, settings.spike_algorithm, settings.spike_lag, settings.spike_influence)
+        self.engagement_metric = settings.engagement_metric
+        self.engagement_windows = sorted(set(settings.engagement_windows))
+        self.engagement_count = settings.engagement_count
+        self.engagement_sections = self.get_engagement_sections(settings.engagement_metric, settings.engagement_windows, settings.engagement_count)
 
         # Remove all other internal variables not suitable for output
-        # del self._overallUserChats
-        self._overallUserChats.clear()
-        # del self._currentSample
-        self._currentSample = None
+        self._authorIndices.clear()
+        self._authorLastSample.clear()
 
         print("Post-processing (Analyzing) complete!")
 
@@ -643,6 +1084,44 @@ class ChatAnalytics(ABC):
         # Calculate the [Defined w/ default and modified after analysis] fields of the ChatAnalytics
         self.chatlog_post_process(settings)
 
+    def process_columns(self, columns: ChatColumns, title: str, source: str, settings: ProcessSettings):
+        """
+        Calculates the same analytical data as process_chatlog, but samples the whole chatlog at once
+        using the vectorized engine (see sampler.py) instead of processing it message by message.
+
+        :param columns: The chatlog (already in memory, i.e. read from a chatfile or its cache)
+        :type columns: chatfile.ChatColumns
+        :param title: The title of the media associated w the chatlog
+        :type title: str
+        :param source: The source of the media associated w the chatlog. URL of the media we have downloaded the log from, or a filepath
+        :type source: str
+        :param settings: Utility class for passing information from the analyzer to the chatlog processor and post-processor
+        :type settings: ProcessSettings
+        """
+        process_columns_for_intervals([self], columns, title, source, settings)
+
+    def set_sampled_counts(self, num_samples: int, counts: dict, total_unique_users: int):
+        """
+        Creates the samples and totals from the per-sample counts computed by the vectorized engine (see sampler.sample_columns).
+
+        :param num_samples: The number of samples
+        :type num_samples: int
+        :param counts: sample field -> the value of that field for every sample
+        :type counts: dict[str, np.ndarray]
+        :param total_unique_users: The total number of unique users that sent a chat message
+        :type total_unique_users: int
+        """
+        self.totalUniqueUsers = total_unique_users
+        self.totalActivity = int(counts['activity'].sum())
+        self.totalChatMessages = int(counts['chatMessages'].sum())
+        for sample_field, (total_field, _) in self._counted_msg_types.items():
+            setattr(self, total_field, int(counts[sample_field].sum()))
+
+        start_times = np.arange(num_samples, dtype=np.float64) * self.interval
+        end_times = np.minimum(start_times + self.interval, self.duration)
+        self.samples.set_columns(num_samples, dict(counts, startTime=start_times, endTime=end_times))
+        self.samples.check_durations()
+
     def print_process_progress(self, msg, idx, finished=False):
         """
         Prints progress of the chat download/process to the console.
@@ -657,13 +1136,13 @@ class ChatAnalytics(ABC):
         else:
             # Progress stats
             completion: float = round((float(msg['time_in_seconds'])/self.duration)*100, 2) # Completion %
-            processed_media_time: str = msg['time_text']
+            processed_media_time: str = seconds_to_time(msg['time_in_seconds'])
             total_duration: str = seconds_to_time(self.duration)
             msgs_processed: int = idx
             print(PROG_PRINT_TEMPLATE.format(f"({completion}%)", f"{processed_media_time} / {total_duration}", f"{self.totalActivity}", f"Processed {msgs_processed} messages"), end='\r')
 
     def to_JSON(self):
-        return json.dumps(self, indent = 4, default=lambda o: o.__dict__)
+        return json.dumps(self, indent = 4, default=to_json_default)
 @dataclass
 class YoutubeChatAnalytics(ChatAnalytics):
     """
@@ -694,6 +1173,11 @@ class YoutubeChatAnalytics(ChatAnalytics):
 
     # Constants (not dumped in json)
     _superchat_msg_types = {'paid_message', 'paid_sticker', 'ticker_paid_message_item', 'ticker_paid_sticker_item', 'ticker_sponsor_item'}
+    _membership_msg_types = {'membership_item'}
+    _counted_msg_types = {
+        'superchats': ('totalSuperchats', _superchat_msg_types),
+        'memberships': ('totalMemberships', _membership_msg_types),
+    }
 
     def __post_init__(self):
         super().__post_init__()
@@ -702,14 +1186,16 @@ class YoutubeChatAnalytics(ChatAnalytics):
 
     def process_message(self, msg):
         """Given a msg object from chat, update common fields and youtube-specific fields"""
-        super().process_message(msg)
+        if(not super().process_message(msg)):
+            return False
                
         if(msg['message_type'] in self._superchat_msg_types):
             self.totalSuperchats += 1
             self._currentSample.superchats += 1
-        if(msg['message_type'] == 'membership_item'):
+        if(msg['message_type'] in self._membership_msg_types):
             self.totalMemberships += 1
             self._currentSample.memberships += 1
+        return True
     
     #  # TODO: Remove Print statements [DEBUG]
     #     if(msg['message_type']!='text_message' and msg['message_type'] not in self._superchat_msg_types and msg['message_type']!='membership_item'):
@@ -718,7 +1204,7 @@ class YoutubeChatAnalytics(ChatAnalytics):
     #         print(msg)
 
     def to_JSON(self):
-        return json.dumps(self, indent = 4, default=lambda o: o.__dict__)
+        return json.dumps(self, indent = 4, default=to_json_default)
 @dataclass
 class TwitchChatAnalytics(ChatAnalytics):
     """
@@ -753,12 +1239,17 @@ class TwitchChatAnalytics(ChatAnalytics):
     _subscription_msg_types = {'subscription', 'resubscription', 'extend_subscription', 'standard_pay_forward', 'community_pay_forward'}
     _gift_sub_msg_types = {'subscription_gift' , 'anonymous_subscription_gift' , 'anonymous_mystery_subscription_gift', 'mystery_subscription_gift', 'prime_community_gift_received'}
     _upgrade_sub_msg_types = {'prime_paid_upgrade', 'gift_paid_upgrade', 'reward_gift', 'anonymous_gift_paid_upgrade'}
+    _counted_msg_types = {
+        'subscriptions': ('totalSubscriptions', _subscription_msg_types),
+        'giftSubscriptions': ('totalGiftSubscriptions', _gift_sub_msg_types),
+        'upgradeSubscriptions': ('totalUpgradeSubscriptions', _upgrade_sub_msg_types),
+    }
+    # Add these to text message types so that txt messages are processed in super process along with other txt messages
+    # NOTE: A separate set, so that the twitch-specific types don't leak into the (shared) ChatAnalytics._txt_msg_types
+    _txt_msg_types = ChatAnalytics._txt_msg_types | {'highlighted_message', 'send_message_in_subscriber_only_mode'}
 
     def __post_init__(self):
         super().__post_init__()
-        # Add this to text message types so that txt messages are processed in super process along with other txt messages
-        self._txt_msg_types.add('highlighted_message')
-        self._txt_msg_types.add('send_message_in_subscriber_only_mode')
         # Adds typing to the current sample (safer dev to ensure fields contained within specific sample type)
         self._currentSample: TwitchSample = self._currentSample
 
@@ -767,7 +1258,8 @@ class TwitchChatAnalytics(ChatAnalytics):
 
     def process_message(self, msg):
         """Given a msg object from chat, update common fields and twitch-specific fields"""
-        super().process_message(msg)
+        if(not super().process_message(msg)):
+            return False
         if(msg['message_type'] in self._subscription_msg_types):
             self.totalSubscriptions += 1
             self._currentSample.subscriptions += 1
@@ -779,6 +1271,7 @@ class TwitchChatAnalytics(ChatAnalytics):
         if(msg['message_type'] in self._upgrade_sub_msg_types):
             self.totalUpgradeSubscriptions += 1
             self._currentSample.upgradeSubscriptions += 1
+        return True
 
     # # TODO: Remove Print statements [DEBUG]
     # if(msg['message_type'] not in self._txt_msg_types and msg['message_type'] not in self._subscription_msg_types and msg['message_type'] not in self._upgrade_sub_msg_types and msg['message_type'] not in self._gift_sub_msg_types):
@@ -786,4 +1279,45 @@ class TwitchChatAnalytics(ChatAnalytics):
     #     # print(msg)
     
     def to_JSON(self):
-        return json.dumps(self, indent = 4, default=lambda o: o.__dict__)
+        return json.dumps(self, indent = 4, default=to_json_default)
+
+def process_columns_for_intervals(chatAnalyticsList: List[ChatAnalytics], columns: ChatColumns, title: str, source: str, settings: ProcessSettings):
+    """
+    Samples a chatlog for several ChatAnalytics at once (see ChatAnalytics.process_columns). The ChatAnalytics must all be of the same type
+    and media (duration), and only differ in their interval. 
+    
+    The chatlog is only sampled once, so the work that doesn't depend on the interval is shared and coarser intervals are derived from finer ones.
+
+    :param chatAnalyticsList: The ChatAnalytics to calculate the analytical data of, one per interval
+    :type chatAnalyticsList: List[ChatAnalytics]
+    :param columns: The chatlog (already in memory, i.e. read from a chatfile or its cache)
+    :type columns: chatfile.ChatColumns
+    :param title: The title of the media associated w the chatlog
+    :type title: str
+    :param source: The source of the media associated w the chatlog. URL of the media we have downloaded the log from, or a filepath
+    :type source: str
+    :param settings: Utility class for passing information from the analyzer to the chatlog processor and post-processor
+    :type settings: ProcessSettings
+    """
+    print("Processing (Sampling) chat data...")
+
+    if(settings.msg_break >= 0):
+        # Same as process_chatlog, only the first BREAK messages are processed
+        columns = ChatColumns(columns.time_in_seconds[:settings.msg_break], columns.message_type[:settings.msg_break], columns.author[:settings.msg_break],
+            columns.message_types, columns.num_authors, columns.duration)
+
+    template = chatAnalyticsList[0]
+    sampled_intervals, total_unique_users = sample_columns(columns, [chatAnalytics.interval for chatAnalytics in chatAnalyticsList], template.duration,
+        template._txt_msg_types, {sample_field: msg_types for sample_field, (_, msg_types) in template._counted_msg_types.items()})
+
+    for chatAnalytics in chatAnalyticsList:
+        chatAnalytics.mediaTitle = title
+        chatAnalytics.mediaSource = source
+
+        num_samples, counts = sampled_intervals[chatAnalytics.interval]
+        chatAnalytics.set_sampled_counts(num_samples, counts, total_unique_users)
+
+        if(settings.print_interval > 0):
+            chatAnalytics.print_process_progress(None, None, finished=True)
+
+        chatAnalytics.chatlog_post_process(settings)
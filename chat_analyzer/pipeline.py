@@ -0,0 +1,151 @@
+"""
+Producer/consumer pipeline that overlaps downloading the chat with processing it.
+
+The chat downloader's generators block on HTTP requests (and the rate limiting sleeps in between them) while the processing
+of the chat waits, and the processing in turn blocks the downloading. With the pipeline, a background thread pulls (downloads & parses)
+the messages into a bounded queue of batches, while the analyzer consumes the batches. (The GIL is released while waiting on the network)
+"""
+
+import queue
+import threading
+import time
+
+from .util import dprint
+
+# The number of batches that can be waiting in the queue before the producer blocks
+DEFAULT_PREFETCH_DEPTH = 8
+# The number of messages per batch (messages are handed from the producer to the consumer a batch at a time, to limit the locking overhead)
+DEFAULT_BATCH_SIZE = 500
+
+# How often (in seconds) a blocked producer checks whether the consumer stopped consuming
+_PUT_POLL_INTERVAL = 0.1
+
+class _ProducerError():
+    """Wraps an exception raised by the producer, so it can be re-raised in the consumer"""
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+_END = object() # Put in the queue by the producer when the messages are exhausted
+
+class PrefetchingIterator():
+    """
+    Iterates over the messages of an iterator, which is consumed ahead of time by a background (producer) thread.
+
+    The producer puts the messages in a bounded queue, in batches of 'batch_size' messages (at most 'prefetch_depth' batches at once).
+    Exceptions raised by the iterator are re-raised when the consumer reaches them.
+
+    Statistics on the queue are kept, to tell whether the pipeline is network-bound (the consumer waits on an empty queue)
+    or CPU-bound (the producer waits on a full queue). They are printed in debug mode once the messages are exhausted or the iterator is closed.
+
+    NOTE: If the consumer stops early, close() must be called to stop the producer. (The producer is a daemon thread, so it never keeps the program from exiting)
+    """
+
+    def __init__(self, iterator, prefetch_depth: int = DEFAULT_PREFETCH_DEPTH, batch_size: int = DEFAULT_BATCH_SIZE, debug: bool = False):
+        """
+        :param iterator: The (chat message) iterator to consume in the background
+        :type iterator: Iterator
+        :param prefetch_depth: The maximum number of batches waiting in the queue
+        :type prefetch_depth: int
+        :param batch_size: The number of messages per batch
+        :type batch_size: int
+        :param debug: Whether to print the queue statistics
+        :type debug: bool
+        """
+        self.batch_size = batch_size
+        self.prefetch_depth = prefetch_depth
+        self.debug = debug
+
+        self._queue = queue.Queue(maxsize=prefetch_depth)
+        self._stop = threading.Event()
+        self._batch = iter(())
+        self._finished = False
+
+        # Statistics
+        self.batches = 0
+        self.messages = 0
+        self.total_depth = 0 # Sum of the queue depth seen by the consumer at every batch (for the average)
+        self.consumer_wait_time = 0.0 # Time the consumer spent waiting on an empty queue (network-bound)
+        self.producer_wait_time = 0.0 # Time the producer spent waiting on a full queue (CPU-bound)
+
+        self._producer = threading.Thread(target=self._produce, args=(iterator,), name='chat-prefetch', daemon=True)
+        self._producer.start()
+
+    def _put(self, item) -> bool:
+        """Put an item in the queue, waiting while it is full. Returns False if the consumer stopped in the meantime"""
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=_PUT_POLL_INTERVAL)
+                self.producer_wait_time += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, iterator):
+        batch = []
+        try:
+            for msg in iterator:
+                batch.append(msg)
+                if len(batch) >= self.batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch and not self._put(batch):
+                return
+            self._put(_END)
+        except BaseException as exception:
+            # Hand over the messages received before the exception first
+            if batch and not self._put(batch):
+                return
+            self._put(_ProducerError(exception))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            try:
+                return next(self._batch)
+            except StopIteration:
+                pass
+            if self._finished:
+                raise StopIteration
+
+            depth = self._queue.qsize()
+            start = time.perf_counter()
+            item = self._queue.get()
+            self.consumer_wait_time += time.perf_counter() - start
+
+            if item is _END:
+                self._finish()
+                raise StopIteration
+            if isinstance(item, _ProducerError):
+                self._finish()
+                raise item.exception
+
+            self.batches += 1
+            self.messages += len(item)
+            self.total_depth += depth
+            self._batch = iter(item)
+
+    def _finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        self._stop.set()
+        self.print_stats()
+
+    def close(self):
+        """Stop the producer (if it is still running)"""
+        self._batch = iter(())
+        self._finish()
+
+    def print_stats(self):
+        """Print (in debug mode) the queue statistics, and whether the pipeline was network-bound or CPU-bound"""
+        avg_depth = self.total_depth/self.batches if self.batches else 0
+        bound = 'network-bound' if self.consumer_wait_time >= self.producer_wait_time else 'CPU-bound'
+        dprint(self.debug, f"Pipeline: {self.messages} messages in {self.batches} batches (batch size {self.batch_size}), "
+                           f"average queue depth {avg_depth:.2f}/{self.prefetch_depth}, "
+                           f"consumer waited {self.consumer_wait_time:.2f}s on an empty queue, producer waited {self.producer_wait_time:.2f}s on a full queue ({bound})")
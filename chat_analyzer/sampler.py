@@ -0,0 +1,180 @@
+"""
+Vectorized (NumPy) sampling engine.
+
+Computes the same per-sample statistics as ChatAnalytics.process_message, but for a whole chatlog
+(in the form of ChatColumns) at once, using array operations instead of a Python loop over every message.
+
+Every function returns plain per-sample arrays, building the actual Sample objects is left to ChatAnalytics.process_columns.
+"""
+
+import math
+import numpy as np
+
+from .chatfile import ChatColumns, NO_AUTHOR
+
+def get_last_sample_index(duration: float, interval: int) -> int:
+    """The index of the last sample that fits in the media (the last sample may be shorter than the interval).
+
+    NOTE: Messages at exactly the end of the media (time == duration) belong to the last sample,
+    so there is never a (zero duration) sample starting at the end of the media.
+    """
+    return max(math.ceil(duration/interval), 1) - 1
+
+def get_sampled_mask(times: np.ndarray, duration: float) -> np.ndarray:
+    """A boolean mask of the messages that are sampled.
+    Messages before the start (time < 0) or after the end (time > duration) of the media are ignored (like in ChatAnalytics.process_message)
+
+    :param times: the time_in_seconds column of the chatlog
+    :type times: np.ndarray
+    :param duration: the duration of the media (in seconds)
+    :type duration: float
+    """
+    return (times >= 0) & (times <= duration) # NaN (no time) compares False, so those messages are ignored as well
+
+def get_sample_indices(times: np.ndarray, interval: int, duration: float):
+    """Determine which sample each (sampled) message belongs to.
+
+    Mirrors the sequential behavior of ChatAnalytics.process_message:
+    samples never go back in time, so an out-of-order (earlier) message is counted in the current (latest) sample.
+
+    :param times: the times of the sampled messages (see get_sampled_mask), in chatlog order
+    :type times: np.ndarray
+    :param interval: the duration of the samples (in seconds)
+    :type interval: int
+    :param duration: the duration of the media (in seconds)
+    :type duration: float
+    :returns: (the sample index of each message, the number of samples)
+    :rtype: tuple[np.ndarray, int]
+    """
+    sample_indices = np.floor_divide(times, interval).astype(np.int64)
+    if(len(sample_indices) == 0):
+        return sample_indices, 0
+
+    # Samples are only ever created going forward, so an out-of-order message stays in the latest sample created so far
+    np.maximum.accumulate(sample_indices, out=sample_indices)
+    np.minimum(sample_indices, get_last_sample_index(duration, interval), out=sample_indices)
+
+    return sample_indices, int(sample_indices[-1]) + 1
+
+def get_type_mask(message_type: np.ndarray, message_types: list, selected_types) -> np.ndarray:
+    """A boolean mask of the messages whose type is one of selected_types
+
+    :param message_type: the message_type (code) column of the chatlog
+    :type message_type: np.ndarray
+    :param message_types: the message type names, indexed by code (ChatColumns.message_types)
+    :type message_types: list[str]
+    :param selected_types: the message types to select
+    :type selected_types: set[str]
+    """
+    code_is_selected = np.array([t in selected_types for t in message_types], dtype=bool)
+    if(len(code_is_selected) == 0):
+        return np.zeros(len(message_type), dtype=bool)
+    return code_is_selected[message_type]
+
+class _SampledInterval():
+    """
+    The per-sample statistics of one interval.
+
+    num_samples: int
+        The number of samples
+    counts: dict[str, np.ndarray]
+        sample field -> the value of that field for every sample
+    user_keys: np.ndarray
+        The sorted, distinct (sample, author) pairs of the chat messages, encoded as sample*num_authors + author.
+        Kept so that the unique users of coarser intervals can be derived from them.
+    """
+
+    def __init__(self, num_samples, counts, user_keys):
+        self.num_samples = num_samples
+        self.counts = counts
+        self.user_keys = user_keys
+
+def _sample_messages(times, interval, duration, field_masks, chat_mask, chat_authors, num_authors) -> _SampledInterval:
+    """Sample an interval directly from the messages"""
+    sample_indices, num_samples = get_sample_indices(times, interval, duration)
+
+    counts = {}
+    for sample_field, mask in field_masks.items():
+        counts[sample_field] = np.bincount(sample_indices if mask is None else sample_indices[mask], minlength=num_samples)
+
+    user_keys = np.unique(sample_indices[chat_mask] * num_authors + chat_authors)
+    counts['uniqueUsers'] = np.bincount(user_keys // num_authors, minlength=num_samples)
+
+    return _SampledInterval(num_samples, counts, user_keys)
+
+def _coarsen(finer: _SampledInterval, factor: int, num_authors: int) -> _SampledInterval:
+    """Derive the samples of an interval from those of an interval 'factor' times finer.
+
+    Every coarse sample is made up of exactly 'factor' consecutive finer samples (the sample indices of the coarser
+    interval are the finer ones // factor, even with the running max & last sample clamping of get_sample_indices).
+    Counts are additive, so they are summed. Unique users are not, so they are re-counted from the finer (sample, author) pairs
+    (which are far fewer than the messages).
+    """
+    if(finer.num_samples == 0):
+        return _SampledInterval(0, {sample_field: sample_counts.copy() for sample_field, sample_counts in finer.counts.items()}, finer.user_keys.copy())
+
+    group_starts = np.arange(0, finer.num_samples, factor)
+    num_samples = len(group_starts)
+
+    counts = {}
+    for sample_field, sample_counts in finer.counts.items():
+        if(sample_field != 'uniqueUsers'):
+            counts[sample_field] = np.add.reduceat(sample_counts, group_starts)
+
+    user_keys = np.unique((finer.user_keys // num_authors // factor) * num_authors + finer.user_keys % num_authors)
+    counts['uniqueUsers'] = np.bincount(user_keys // num_authors, minlength=num_samples)
+
+    return _SampledInterval(num_samples, counts, user_keys)
+
+def sample_columns(columns: ChatColumns, intervals, duration: float, txt_msg_types, counted_msg_types: dict):
+    """Compute the per-sample statistics of a whole chatlog, for one or more intervals at once.
+
+    The work that does not depend on the interval (type masks, first time chatters, ...) is only done once.
+    Intervals are computed from the finest to the coarsest, an interval that is a multiple of an already computed one is
+    derived from the samples of that interval instead of from the messages (see _coarsen).
+
+    :param columns: the chatlog
+    :type columns: ChatColumns
+    :param intervals: the durations of the samples (in seconds) to compute the statistics for
+    :type intervals: list[int]
+    :param duration: the duration of the media (in seconds)
+    :type duration: float
+    :param txt_msg_types: the message types that are considered (human) chat messages
+    :type txt_msg_types: set[str]
+    :param counted_msg_types: sample field -> message types counted by that field, for additional (site-specific) counts
+    :type counted_msg_types: dict[str, set[str]]
+    :returns: (interval -> (the number of samples, sample field -> per-sample counts), the total number of unique users)
+    :rtype: tuple[dict[int, tuple[int, dict[str, np.ndarray]]], int]
+    """
+    times = np.asarray(columns.time_in_seconds)
+    sampled = get_sampled_mask(times, duration)
+    times = times[sampled]
+    message_type = np.asarray(columns.message_type)[sampled]
+    author = np.asarray(columns.author)[sampled]
+
+    # Which messages count towards which sample field (None: every message)
+    is_chat = get_type_mask(message_type, columns.message_types, txt_msg_types)
+    field_masks = {'activity': None, 'chatMessages': is_chat}
+    for sample_field, msg_types in counted_msg_types.items():
+        field_masks[sample_field] = get_type_mask(message_type, columns.message_types, msg_types)
+
+    # The first chat message of every user (the first time chatters), shared by all intervals
+    chat_mask = is_chat & (author != NO_AUTHOR)
+    chat_authors = author[chat_mask].astype(np.int64)
+    unique_authors, first_chats = np.unique(chat_authors, return_index=True)
+    is_first_chat = np.zeros(len(times), dtype=bool)
+    is_first_chat[np.flatnonzero(chat_mask)[first_chats]] = True
+    field_masks['firstTimeChatters'] = is_first_chat
+
+    num_authors = int(chat_authors.max()) + 1 if len(chat_authors) else 1
+
+    sampled_intervals = {}
+    for interval in sorted(set(intervals)):
+        divisors = [finer for finer in sampled_intervals if interval % finer == 0]
+        if(divisors):
+            finer = max(divisors)
+            sampled_intervals[interval] = _coarsen(sampled_intervals[finer], interval // finer, num_authors)
+        else:
+            sampled_intervals[interval] = _sample_messages(times, interval, duration, field_masks, chat_mask, chat_authors, num_authors)
+
+    return {interval: (s.num_samples, s.counts) for interval, s in sampled_intervals.items()}, len(unique_authors)
@@ -0,0 +1,240 @@
+"""
+Analytics store: an embedded SQLite database that the analytics of many chatlogs are appended to, to query them all at once
+(ex: "top 10 samples with the most activity across the last 200 streams") without loading every output file.
+
+Every analyzed chatlog (media) is stored with its totals, samples and highlights. Samples are indexed by (media, startTime) for time-range scans
+and by every metric for cross-stream rankings, so queries read only the matching rows.
+"""
+
+import os
+import time
+import sqlite3
+
+from .dataformat import METRIC_TO_FIELD
+
+# Seconds to wait for the lock of the database when another process is writing to it (ex: batch workers)
+STORE_TIMEOUT = 60
+
+# Fields of the media table (stored from the ChatAnalytics fields with the same name)
+_MEDIA_FIELDS = ('mediaSource', 'interval', 'mediaTitle', 'platform', 'duration', 'description', 'program_version',
+                 'totalActivity', 'totalChatMessages', 'totalUniqueUsers',
+                 'overallAvgActivityPerSecond', 'overallAvgChatMessagesPerSecond', 'overallAvgUniqueUsersPerSecond', 'highlights_duration')
+# Fields of the samples table. Site-specific fields are NULL for the samples of the other sites
+_SAMPLE_FIELDS = ('startTime', 'endTime', 'activity', 'chatMessages', 'firstTimeChatters', 'uniqueUsers',
+                  'avgActivityPerSecond', 'avgChatMessagesPerSecond', 'avgUniqueUsersPerSecond',
+                  'subscriptions', 'giftSubscriptions', 'upgradeSubscriptions', 'superchats', 'memberships')
+# Fields of the highlights table
+_HIGHLIGHT_FIELDS = ('startTime', 'endTime', 'duration', 'type', 'peak', 'avg')
+
+# Sample fields that samples can be ranked by
+RANKED_SAMPLE_FIELDS = ('activity', 'chatMessages', 'uniqueUsers', 'avgActivityPerSecond', 'avgChatMessagesPerSecond', 'avgUniqueUsersPerSecond')
+# Media fields that media can be ranked by
+RANKED_MEDIA_FIELDS = ('duration', 'totalActivity', 'totalChatMessages', 'totalUniqueUsers',
+                       'overallAvgActivityPerSecond', 'overallAvgChatMessagesPerSecond', 'overallAvgUniqueUsersPerSecond', 'highlights_duration')
+# Highlight fields that highlights can be ranked by
+RANKED_HIGHLIGHT_FIELDS = ('peak', 'avg', 'duration')
+
+# Used to convert the metric provided by the CLI to the media field of its overall average (see METRIC_TO_FIELD for samples)
+METRIC_TO_MEDIA_FIELD = {
+    "activityPSec": "overallAvgActivityPerSecond",
+    "chatsPSec" : "overallAvgChatMessagesPerSecond",
+    "usersPSec" : "overallAvgUniqueUsersPerSecond",
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS media (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mediaSource TEXT NOT NULL, interval INTEGER NOT NULL, mediaTitle TEXT, platform TEXT, duration REAL, description TEXT, program_version TEXT,
+    totalActivity INTEGER, totalChatMessages INTEGER, totalUniqueUsers INTEGER,
+    overallAvgActivityPerSecond REAL, overallAvgChatMessagesPerSecond REAL, overallAvgUniqueUsersPerSecond REAL, highlights_duration REAL,
+    addedAt REAL,
+    UNIQUE (mediaSource, interval)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    media INTEGER NOT NULL,
+    startTime REAL NOT NULL, endTime REAL, activity INTEGER, chatMessages INTEGER, firstTimeChatters INTEGER, uniqueUsers INTEGER,
+    avgActivityPerSecond REAL, avgChatMessagesPerSecond REAL, avgUniqueUsersPerSecond REAL,
+    subscriptions INTEGER, giftSubscriptions INTEGER, upgradeSubscriptions INTEGER, superchats INTEGER, memberships INTEGER,
+    PRIMARY KEY (media, startTime)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS highlights (
+    media INTEGER NOT NULL,
+    startTime REAL NOT NULL, endTime REAL, duration REAL, type TEXT, peak REAL, avg REAL,
+    PRIMARY KEY (media, startTime)
+) WITHOUT ROWID;
+{''.join(f'CREATE INDEX IF NOT EXISTS samples_{field} ON samples ({field});' for field in RANKED_SAMPLE_FIELDS)}
+{''.join(f'CREATE INDEX IF NOT EXISTS media_{field} ON media ({field});' for field in RANKED_MEDIA_FIELDS)}
+{''.join(f'CREATE INDEX IF NOT EXISTS highlights_{field} ON highlights ({field});' for field in RANKED_HIGHLIGHT_FIELDS)}
+"""
+
+def get_ranked_field(metric: str, ranked_fields, metric_to_field: dict = METRIC_TO_FIELD) -> str:
+    """Get the field to rank by from a metric, which is either a field name or a CLI metric choice (ex: 'usersPSec', see METRIC_TO_FIELD)
+
+    :raises ValueError: if the metric can't be ranked by
+    :rtype: str
+    """
+    field = metric_to_field.get(metric, metric)
+    if(field not in ranked_fields):
+        raise ValueError(f"Can not rank by {metric}, must be one of: {', '.join(list(metric_to_field) + list(ranked_fields))}")
+    return field
+
+def _get_field(o, field: str):
+    """Highlights are dicts when the analytics are read back from an output file (see analyzer.get_ChatAnalytics_from_file)"""
+    return o.get(field) if isinstance(o, dict) else getattr(o, field)
+
+class AnalyticsStore():
+    """
+    SQLite database of the analytics of many chatlogs.
+
+    The analytics of a chatlog (identified by its mediaSource and interval) are added with add(). Adding the analytics of a chatlog that
+    is already in the store replaces them, so re-analyzing a chatlog doesn't create duplicates. Several processes can add to the same store.
+
+    ---
+
+    filepath: str
+        The filepath of the database (created if it doesn't exist)
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(filepath, timeout=STORE_TIMEOUT)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute('PRAGMA journal_mode=WAL') # (Readers don't block the writer)
+        self._connection.execute('PRAGMA synchronous=NORMAL') # (Durable enough in WAL mode, and only syncs on checkpoints)
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, chatAnalytics):
+        """Add (or replace) the analytics of a chatlog: its totals, samples and highlights
+
+        :param chatAnalytics: The (post-processed) analytics of the chatlog
+        :type chatAnalytics: dataformat.ChatAnalytics
+        :returns: The id of the chatlog in the store
+        :rtype: int
+        """
+        samples = chatAnalytics.samples
+        columns = [samples.column(field).tolist() if field in samples.field_names else [None]*len(samples) for field in _SAMPLE_FIELDS]
+        highlights = [tuple(_get_field(highlight, field) for field in _HIGHLIGHT_FIELDS) for highlight in chatAnalytics.highlights]
+
+        with self._connection: # (One transaction, readers never see a partially added chatlog)
+            self._delete(chatAnalytics.mediaSource, chatAnalytics.interval)
+            cursor = self._connection.execute(
+                f"INSERT INTO media ({', '.join(_MEDIA_FIELDS)}, addedAt) VALUES ({', '.join('?'*len(_MEDIA_FIELDS))}, ?)",
+                [getattr(chatAnalytics, field) for field in _MEDIA_FIELDS] + [time.time()])
+            media_id = cursor.lastrowid
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO samples (media, {', '.join(_SAMPLE_FIELDS)}) VALUES (?, {', '.join('?'*len(_SAMPLE_FIELDS))})",
+                ((media_id,) + row for row in zip(*columns)))
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO highlights (media, {', '.join(_HIGHLIGHT_FIELDS)}) VALUES (?, {', '.join('?'*len(_HIGHLIGHT_FIELDS))})",
+                ((media_id,) + row for row in highlights))
+        return media_id
+
+    def _delete(self, media_source: str, interval: int):
+        for row in self._connection.execute("SELECT id FROM media WHERE mediaSource = ? AND interval = ?", (media_source, interval)).fetchall():
+            self._connection.execute("DELETE FROM samples WHERE media = ?", (row['id'],))
+            self._connection.execute("DELETE FROM highlights WHERE media = ?", (row['id'],))
+            self._connection.execute("DELETE FROM media WHERE id = ?", (row['id'],))
+
+    def _media_filter(self, last: int = None, interval: int = None, media_column: str = 'm.id'):
+        """SQL condition (and its parameters) selecting the last LAST added chatlogs, sampled at INTERVAL (the media table is aliased as m)"""
+        conditions = []
+        parameters = []
+        if(interval != None):
+            conditions.append("m.interval = ?")
+            parameters.append(interval)
+        if(last != None):
+            recent = "SELECT id FROM media" + (" WHERE interval = ?" if interval != None else "") + " ORDER BY id DESC LIMIT ?"
+            conditions.append(f"{media_column} IN ({recent})")
+            parameters += ([interval] if interval != None else []) + [last]
+        return (' AND '.join(conditions) or '1'), parameters
+
+    def top_samples(self, metric: str, limit: int = 10, last: int = None, interval: int = None):
+        """The samples with the highest value of a metric, across all the chatlogs in the store
+
+        :param metric: The metric (a sample field, or a CLI metric choice, see METRIC_TO_FIELD)
+        :type metric: str
+        :param limit: The number of samples
+        :type limit: int
+        :param last: Only rank the samples of the last LAST added chatlogs
+        :type last: int
+        :param interval: Only rank the samples of chatlogs sampled at this interval (so samples of the same length are compared)
+        :type interval: int
+        :returns: The samples (highest first), with the source and title of their chatlog
+        :rtype: List[dict]
+        """
+        field = get_ranked_field(metric, RANKED_SAMPLE_FIELDS)
+        condition, parameters = self._media_filter(last, interval, 's.media')
+        rows = self._connection.execute(
+            f"SELECT m.mediaSource, m.mediaTitle, m.interval, s.* FROM samples s JOIN media m ON m.id = s.media "
+            f"WHERE {condition} ORDER BY s.{field} DESC LIMIT ?", parameters + [limit])
+        return [dict(row) for row in rows]
+
+    def top_highlights(self, metric: str = 'peak', limit: int = 10, last: int = None, interval: int = None):
+        """The highlights with the highest peak (or average, or duration), across all the chatlogs in the store (see top_samples)
+
+        :rtype: List[dict]
+        """
+        field = get_ranked_field(metric, RANKED_HIGHLIGHT_FIELDS)
+        condition, parameters = self._media_filter(last, interval, 'h.media')
+        rows = self._connection.execute(
+            f"SELECT m.mediaSource, m.mediaTitle, m.interval, h.* FROM highlights h JOIN media m ON m.id = h.media "
+            f"WHERE {condition} ORDER BY h.{field} DESC LIMIT ?", parameters + [limit])
+        return [dict(row) for row in rows]
+
+    def top_media(self, metric: str, limit: int = 10, last: int = None, interval: int = None):
+        """The chatlogs with the highest total (or overall average) of a metric (ex: 'totalActivity', 'usersPSec')
+
+        :rtype: List[dict]
+        """
+        field = get_ranked_field(metric, RANKED_MEDIA_FIELDS, METRIC_TO_MEDIA_FIELD)
+        condition, parameters = self._media_filter(last, interval)
+        rows = self._connection.execute(f"SELECT * FROM media m WHERE {condition} ORDER BY m.{field} DESC LIMIT ?", parameters + [limit])
+        return [dict(row) for row in rows]
+
+    def get_samples(self, media_source: str, start_time: float = None, end_time: float = None, interval: int = None):
+        """The samples of a chatlog within a time range (samples that start in [start_time, end_time)), in order
+
+        :param media_source: The source of the chatlog (its url or chatfile)
+        :type media_source: str
+        :param start_time: The start of the time range (in seconds), defaults to the start of the chatlog
+        :type start_time: float
+        :param end_time: The end of the time range (in seconds), defaults to the end of the chatlog
+        :type end_time: float
+        :param interval: The interval of the chatlog's samples, if it was stored at several intervals (defaults to the smallest)
+        :type interval: int
+        :rtype: List[dict]
+        """
+        media = self.get_media(media_source, interval)
+        if(media == None):
+            return []
+        rows = self._connection.execute(
+            "SELECT * FROM samples WHERE media = ? AND startTime >= ? AND startTime < ? ORDER BY startTime",
+            (media['id'], start_time if start_time != None else float('-inf'), end_time if end_time != None else float('inf')))
+        return [dict(row) for row in rows]
+
+    def get_media(self, media_source: str, interval: int = None):
+        """The totals of a chatlog (at the given interval, or the smallest one it was stored at), or None if it is not in the store
+
+        :rtype: Union[dict, None]
+        """
+        if(interval != None):
+            row = self._connection.execute("SELECT * FROM media WHERE mediaSource = ? AND interval = ?", (media_source, interval)).fetchone()
+        else:
+            row = self._connection.execute("SELECT * FROM media WHERE mediaSource = ? ORDER BY interval LIMIT 1", (media_source,)).fetchone()
+        return dict(row) if row != None else None
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM media").fetchone()[0]
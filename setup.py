@@ -98,12 +98,16 @@ setup(
         'console_scripts': [
             'chat_analyzer=chat_analyzer.cli:main',
             'chat-analyzer=chat_analyzer.cli:main',
+            'chat_analyzer_query=chat_analyzer.cli:query_main',
+            'chat-analyzer-query=chat_analyzer.cli:query_main',
         ],
     },
 
     extras_require={
         # pip install -e ".[dev]" installs dev dependencies
         'dev': development_requirements,
+        # pip install -e ".[async]" installs the asynchronous downloader's dependencies (ChatDownloader.get_chat_async)
+        'async': ['aiohttp'],
     },
 
     # TODO: Reference Xenova's setup for the chat_downloader to see if theres anything worth adding later